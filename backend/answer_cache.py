@@ -0,0 +1,196 @@
+import os, json, hashlib, logging, tempfile, threading, time
+from collections import OrderedDict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# -----------------------------
+# Semantic LLM answer cache
+# -----------------------------
+class SemanticAnswerCache:
+    """
+    Caches LLM answers and serves them for semantically similar questions.
+
+    Entries are grouped by a context fingerprint (diagnosis, discharge
+    instructions, retrieved chunk texts, web result urls): an answer is only
+    reused when the LLM would have seen the same context. Chunk texts, not
+    positional chunk ids, are hashed, so entries stay correct across a
+    re-ingest and in a cache persisted by an earlier index version. Within a group, a
+    lookup returns the cached answer whose question embedding has the highest
+    cosine similarity, if it is at least `threshold`.
+
+    Bounded to `maxsize` entries (LRU) with a TTL; optionally persisted as
+    JSON to `path` (at most every `persist_interval` seconds, on a background
+    thread so store() never does disk I/O, and on save()). Processes sharing
+    `path` each write their own entries; the last write wins.
+    """
+
+    def __init__(self, threshold=0.92, maxsize=512, ttl=86400.0, path=None, persist_interval=30.0):
+        self.threshold = float(threshold)
+        self.maxsize = int(maxsize)
+        self.ttl = float(ttl)
+        self.path = path or None
+        self.persist_interval = float(persist_interval)
+        self._entries = OrderedDict()   # entry id -> dict(fp, emb, question, answer, created)
+        self._buckets = {}              # fingerprint -> set of entry ids
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._last_save = time.time()
+        self._dirty = False
+        self._saver = None
+        self.hits = 0
+        self.misses = 0
+        if self.path and os.path.exists(self.path):
+            self.load(self.path)
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def fingerprint(diagnosis, instructions, chunk_texts, web_urls=()):
+        """Stable hash of the context that shaped an answer."""
+        payload = json.dumps(
+            [diagnosis or "", instructions or "", [t or "" for t in chunk_texts], sorted(u or "" for u in web_urls)]
+        )
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    # -----------------------------
+    # Lookup / store
+    # -----------------------------
+    def lookup(self, fp, q_emb):
+        """Return the best cached answer for (fp, q_emb) above threshold, or None."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            ids = [i for i in self._buckets.get(fp, ()) if self._alive(i, now)]
+            if ids:
+                sims = np.stack([self._entries[i]["emb"] for i in ids]) @ np.asarray(q_emb, dtype=np.float32)
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    self._entries.move_to_end(ids[best])
+                    self.hits += 1
+                    return self._entries[ids[best]]["answer"]
+            self.misses += 1
+            return None
+
+    def store(self, fp, q_emb, question, answer):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._insert(fp, np.asarray(q_emb, dtype=np.float32), question, answer, time.time())
+            self._dirty = True
+            due = self.path and time.time() - self._last_save >= self.persist_interval
+            if due and (self._saver is None or not self._saver.is_alive()):
+                self._saver = threading.Thread(target=self.persist, name="answer-cache-save", daemon=True)
+                self._saver.start()
+
+    def _insert(self, fp, emb, question, answer, created):
+        eid = self._next_id
+        self._next_id += 1
+        self._entries[eid] = {"fp": fp, "emb": emb, "question": question, "answer": answer, "created": created}
+        self._buckets.setdefault(fp, set()).add(eid)
+        while len(self._entries) > self.maxsize:
+            old, _ = next(iter(self._entries.items()))
+            self._drop(old)
+
+    def _alive(self, eid, now):
+        entry = self._entries.get(eid)
+        if entry is None:
+            return False
+        if now - entry["created"] > self.ttl:
+            self._drop(eid)
+            return False
+        return True
+
+    def _drop(self, eid):
+        entry = self._entries.pop(eid)
+        bucket = self._buckets.get(entry["fp"])
+        if bucket is not None:
+            bucket.discard(eid)
+            if not bucket:
+                del self._buckets[entry["fp"]]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self._dirty = True
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
+
+    # -----------------------------
+    # Persistence
+    # -----------------------------
+    def save(self, path=None):
+        """
+        Atomically write the live entries to `path` (default: self.path) as
+        JSON. The temporary file is unique, so processes saving to the same
+        path never write into each other's file. Raises OSError on failure.
+        """
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            if not self._dirty and path == self.path:
+                return
+            rows = [
+                {"fp": e["fp"], "emb": e["emb"].tolist(), "question": e["question"],
+                 "answer": e["answer"], "created": e["created"]}
+                for e in self._entries.values()
+            ]
+            self._dirty = False
+            self._last_save = time.time()
+        try:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump({"entries": rows}, f)
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError:
+            if path == self.path:
+                with self._lock:
+                    self._dirty = True  # retried at the next save
+            raise
+
+    def persist(self):
+        """save() to self.path, logging instead of raising on failure."""
+        try:
+            self.save()
+        except OSError as e:
+            logger.warning("Could not save answer cache %s: %s", self.path, e)
+
+    def load(self, path):
+        """Load entries saved by save(); expired or unreadable entries are skipped."""
+        try:
+            with open(path, encoding="utf-8") as f:
+                rows = json.load(f).get("entries", [])
+        except (OSError, ValueError) as e:
+            logger.warning("Could not load answer cache %s: %s", path, e)
+            return
+        now = time.time()
+        with self._lock:
+            for r in rows:
+                if now - r.get("created", 0) <= self.ttl:
+                    self._insert(r["fp"], np.asarray(r["emb"], dtype=np.float32),
+                                 r.get("question", ""), r["answer"], r["created"])
+        logger.info("Loaded %d cached answers from %s", len(self._entries), path)
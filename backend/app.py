@@ -1,10 +1,17 @@
-import os, logging, dotenv
-from flask import Flask, request, jsonify
+import os, json, logging, time, uuid, dotenv
+import numpy as np
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-from patient_tool import find_patient_by_name, find_patient_by_id
-from logging_config import configure_logging
-from rag import retrieve, answer_with_llm, rag_confidence
-from web_search import web_search
+from patient_tool import find_patient_by_name, find_patient_by_id, MAX_NAME_MATCHES
+from logging_config import configure_logging, set_request_id, shutdown_logging, stats as logging_stats
+from rag import retrieve, answer_with_llm, rag_confidence, cache_stats, is_ready, readiness, start_background_init
+from rag import cached_retrieve
+from rag import init as init_rag, shutdown as rag_shutdown, clinical_batch, patient_summary
+from rag import reload_index, reload_status, start_reload
+from web_search import web_search, client as web_search_client
+from llm_client import client as llm_client
+from pipeline import Deadline, retrieve_with_fallback, shutdown as pipeline_shutdown
+import metrics
 
 # Load environment variables from .env file
 dotenv.load_dotenv()
@@ -13,10 +20,98 @@ dotenv.load_dotenv()
 configure_logging()
 logger = logging.getLogger(__name__)
 
+# Largest accepted /clinical/batch request
+CLINICAL_BATCH_MAX_ITEMS = int(os.getenv("CLINICAL_BATCH_MAX_ITEMS", "1000"))
+# If set, /admin endpoints require this value in the X-Admin-Token header
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)  # Allow cross-origin requests (for Streamlit frontend)
 
+# Load the embedding model and reference index. By default this happens in the
+# background: receptionist traffic is served immediately, /ready reports when
+# RAG is up. RAG_INIT=eager loads it before serving; gunicorn.conf.py uses this
+# so the preloaded model and index are shared by all forked workers.
+if os.getenv("RAG_INIT", "background") == "eager":
+    try:
+        init_rag()
+    except Exception:
+        logger.error("Eager RAG initialisation failed; workers will retry on first clinical request")
+else:
+    start_background_init()
+
+# -----------------------------
+# Request instrumentation
+# -----------------------------
+@app.before_request
+def start_timing():
+    g.request_start = time.perf_counter()
+    g.stage_timings = metrics.start_request()
+    # Caller-supplied ids let a request be followed across services
+    g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    set_request_id(g.request_id)
+
+
+@app.after_request
+def record_timing(response):
+    # Streaming responses are timed until the response starts; their stages are logged when done
+    elapsed = time.perf_counter() - g.get("request_start", time.perf_counter())
+    endpoint = request.endpoint or "unknown"
+    metrics.REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, status=response.status_code)
+    if response.status_code >= 500:
+        metrics.ERRORS.inc(stage=f"http_{endpoint}")
+    if "request_id" in g:
+        response.headers["X-Request-ID"] = g.request_id
+    return response
+
+
+@metrics.registry.register_collector
+def collect_cache_metrics():
+    """Existing cache and web search counters, read at scrape time."""
+    caches = cache_stats()
+    web = web_search_client.stats()
+    names = ("embedding_cache", "result_cache", "answer_cache")
+    return [
+        ("cache_hits_total", "counter", "Cache hits", [({"cache": n}, caches[n]["hits"]) for n in names]
+         + [({"cache": "web_search"}, web.get("cache_hits", 0))]),
+        ("cache_misses_total", "counter", "Cache misses", [({"cache": n}, caches[n]["misses"]) for n in names]
+         + [({"cache": "web_search"}, web.get("cache_misses", 0))]),
+        ("web_search_calls_total", "counter", "Web searches sent to the provider", [({}, web["calls"])]),
+        ("web_search_failures_total", "counter", "Failed web searches", [({}, web["failures"])]),
+        ("web_search_timeouts_total", "counter", "Web searches that hit their deadline", [({}, web["timeouts"])]),
+        ("web_search_rejected_total", "counter", "Web searches skipped by the circuit breaker", [({}, web["rejected"])]),
+        ("rag_ready", "gauge", "1 once the embedding model and reference index are loaded", [({}, int(is_ready()))]),
+    ]
+
+
+@metrics.registry.register_collector
+def collect_llm_metrics():
+    """LLM client counters and queue depth, read at scrape time (nothing when no key is set)."""
+    if llm_client is None:
+        return []
+    llm = llm_client.stats()
+    return [
+        ("llm_in_flight", "gauge", "LLM calls holding a concurrency slot", [({}, llm["in_flight"])]),
+        ("llm_waiting", "gauge", "LLM calls queued for a concurrency slot", [({}, llm["waiting"])]),
+        ("llm_calls_total", "counter", "HTTP requests sent to the LLM provider", [({}, llm["calls"])]),
+        ("llm_retries_total", "counter", "LLM requests retried after an error", [({}, llm["retries"])]),
+        ("llm_failures_total", "counter", "LLM calls that failed after retries", [({}, llm["failures"])]),
+        ("llm_timeouts_total", "counter", "LLM calls that missed their deadline", [({}, llm["timeouts"])]),
+        ("llm_rejected_total", "counter", "LLM calls that got no slot before their deadline", [({}, llm["rejected"])]),
+    ]
+
+
+def log_timings(label, state):
+    """Per-request stage timings (ms) as one structured log line, for finding tail-latency culprits."""
+    timings = state["timings"]
+    total_ms = round((time.perf_counter() - state["start"]) * 1000, 2)
+    logger.info(
+        "%s timings patient=%s total_ms=%.2f stages=%s used_web=%s", label, state["patient_id"], total_ms,
+        json.dumps(timings, sort_keys=True), state["used_web"],
+        extra={"stage_timings": dict(timings), "total_ms": total_ms},
+    )
+
 # -----------------------------
 # Receptionist Agent API
 # -----------------------------
@@ -59,7 +154,11 @@ def receptionist():
         return jsonify({"role": "receptionist", "text": text, "patient": p})
 
     # --- Search by Patient Name ---
-    matches = find_patient_by_name(patient_name)
+    matches = find_patient_by_name(patient_name, limit=MAX_NAME_MATCHES)
+    # An exact full-name hit wins over prefix / fuzzy neighbours
+    exact = [m for m in matches if m["patient_name"].strip().lower() == candidate.lower()]
+    if len(exact) == 1:
+        matches = exact
     if len(matches) == 0:
         return jsonify({
             "role": "receptionist",
@@ -69,7 +168,7 @@ def receptionist():
         options = [{"patient_id": m["patient_id"], "patient_name": m["patient_name"]} for m in matches]
         return jsonify({
             "role": "receptionist",
-            "text": "Multiple matches found. Please reply with patient ID to select one.",
+            "text": "Multiple matches found (best matches first). Please reply with patient ID to select one.",
             "matches": options
         })
 
@@ -85,48 +184,73 @@ def receptionist():
 # -----------------------------
 # Clinical Agent API
 # -----------------------------
-@app.route("/clinical", methods=["POST"])
-def clinical():
+def make_serializable(obj):
+    """Convert NumPy types for safe JSON serialization."""
+    if isinstance(obj, (np.integer,)):
+        return int(obj)
+    elif isinstance(obj, (np.floating,)):
+        return float(obj)
+    elif isinstance(obj, (np.ndarray,)):
+        return obj.tolist()
+    elif isinstance(obj, dict):
+        return {k: make_serializable(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [make_serializable(i) for i in obj]
+    else:
+        return obj
+
+
+def prepare_clinical(payload):
     """
-    Handles clinical questions from the patient.
-    Performs retrieval using RAG and generates an answer.
+    Shared front half of /clinical and /clinical/stream:
+    validates the request, retrieves reference chunks and runs the web
+    search fallback when RAG confidence is low.
+    Returns (state dict, None) on success or (None, error response).
     """
-    payload = request.get_json() or {}
     patient_id = payload.get("patient_id")
     question = payload.get("question") or payload.get("message") or ""
 
     # Validate inputs
     if not patient_id:
-        return jsonify({"error": "patient_id required"}), 400
-    patient = find_patient_by_id(patient_id)
+        return None, (jsonify({"error": "patient_id required"}), 400)
+    with metrics.stage("patient_lookup"):
+        patient = find_patient_by_id(patient_id)
     if not patient:
-        return jsonify({"error": "patient not found"}), 404
+        return None, (jsonify({"error": "patient not found"}), 404)
 
     logger.info("Clinical: patient=%s question=%s", patient_id, question)
 
-    # Retrieve top relevant chunks using embeddings
-    contexts = retrieve(question, top_k=3)
-    top_score = rag_confidence(contexts)
-
-    # Trigger web search if RAG confidence is low
-    web_results = []
-    used_web = False
-    if top_score < 0.14:
-        logger.info("Low RAG confidence (%.4f). Triggering web search.", top_score)
-        web_results = web_search(question, max_results=3)
-        used_web = bool(web_results)
+    if not is_ready():
+        start_background_init()  # no-op while loading; retries after a failed load
+        body = jsonify({"error": "clinical agent is starting up, please retry shortly", **readiness()})
+        return None, (body, 503, {"Retry-After": "5"})
 
-    # Generate final answer using LLM (if key available) or fallback text
-    answer = answer_with_llm(
-        patient_summary=f"Name: {patient['patient_name']}. "
-                        f"Primary diagnosis: {patient.get('primary_diagnosis')}. "
-                        f"Discharge instructions: {patient.get('discharge_instructions')}",
-        question=question,
-        contexts=contexts,
-        web_results=web_results
+    # Retrieve top relevant chunks; web search is only used if RAG confidence
+    # is low (with SPECULATIVE_WEB_SEARCH=1 it starts alongside retrieval)
+    deadline = Deadline()
+    contexts, web_results, top_score = retrieve_with_fallback(
+        question, retrieve, rag_confidence, web_search, deadline, top_k=3, max_web_results=3,
+        cached=cached_retrieve,
     )
+    used_web = bool(web_results)
+
+    state = {
+        "patient_id": patient_id,
+        "patient": patient,
+        "question": question,
+        "contexts": contexts,
+        "web_results": web_results,
+        "used_web": used_web,
+        "sources": build_sources(contexts, web_results),
+        "deadline": deadline,
+        "timings": g.stage_timings,
+        "start": g.request_start,
+    }
+    return state, None
+
 
-    # Build JSON-serializable source list
+def build_sources(contexts, web_results):
+    """JSON-serializable source list shown with an answer (reference chunks, then web results)."""
     sources = []
     for c in contexts:
         src = {
@@ -134,10 +258,12 @@ def clinical():
             "snippet": c.get("document", "")[:400],
             "score": float(c.get("score", 0.0))
         }
+        if c.get("page_start"):
+            src.update(doc=c.get("doc"), page_start=c["page_start"], page_end=c["page_end"])
         sources.append(src)
 
     # Append web results if used
-    if used_web:
+    if web_results:
         for w in web_results:
             sources.append({
                 "id": None,
@@ -146,44 +272,192 @@ def clinical():
                 "title": w.get("title"),
                 "source": "web"
             })
+    return make_serializable(sources)
 
-    # Utility to convert NumPy types for safe JSON serialization
-    def make_serializable(obj):
-        import numpy as np
-        if isinstance(obj, (np.integer,)):
-            return int(obj)
-        elif isinstance(obj, (np.floating,)):
-            return float(obj)
-        elif isinstance(obj, (np.ndarray,)):
-            return obj.tolist()
-        elif isinstance(obj, dict):
-            return {k: make_serializable(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [make_serializable(i) for i in obj]
-        else:
-            return obj
+
+def llm_kwargs(state):
+    """Arguments for answer_with_llm built from a prepare_clinical() state."""
+    patient = state["patient"]
+    return {
+        "patient_summary": patient_summary(patient),
+        "question": state["question"],
+        "contexts": state["contexts"],
+        "web_results": state["web_results"],
+        "patient": patient,
+        "timeout": state["deadline"].remaining(),
+    }
+
+
+@app.route("/clinical", methods=["POST"])
+def clinical():
+    """
+    Handles clinical questions from the patient.
+    Performs retrieval using RAG and generates an answer.
+    """
+    state, error = prepare_clinical(request.get_json() or {})
+    if error:
+        return error
+
+    # Generate final answer using LLM (if key available) or fallback text
+    answer = answer_with_llm(**llm_kwargs(state))
 
     payload = {
         "role": "clinical",
         "text": answer,
-        "sources": make_serializable(sources)
+        "sources": state["sources"]
     }
 
     logger.info(
         "Clinical answered patient=%s, sources=%s, used_web=%s",
-        patient_id, [s.get("id") for s in sources], used_web
+        state["patient_id"], [s.get("id") for s in state["sources"]], state["used_web"]
     )
+    log_timings("Clinical", state)
     return jsonify(payload)
 
+
+def sse(event, data):
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route("/clinical/stream", methods=["POST"])
+def clinical_stream():
+    """
+    Streaming variant of /clinical (Server-Sent Events).
+    Emits a `sources` event first, then one `token` event per generated
+    text fragment, and finally `done` with the full answer.
+    """
+    state, error = prepare_clinical(request.get_json() or {})
+    if error:
+        return error
+
+    def generate():
+        yield sse("sources", {"role": "clinical", "sources": state["sources"]})
+        parts = []
+        for token in answer_with_llm(**llm_kwargs(state), stream=True):
+            parts.append(token)
+            yield sse("token", {"text": token})
+        yield sse("done", {"text": "".join(parts)})
+        logger.info(
+            "Clinical streamed patient=%s, sources=%s, used_web=%s",
+            state["patient_id"], [s.get("id") for s in state["sources"]], state["used_web"]
+        )
+        log_timings("Clinical streamed", state)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.route("/clinical/batch", methods=["POST"])
+def clinical_batch_endpoint():
+    """
+    Answers many clinical questions in one request (e.g. nightly follow-up jobs).
+    Body: {"items": [{"patient_id": "P001", "question": "..."}, ...], "answer": true}
+    Set "answer": false to return only the retrieved sources.
+    Returns {"results": [...]} in input order; unknown patients get an "error"
+    entry instead of failing the whole batch.
+    """
+    payload = request.get_json() or {}
+    items = payload.get("items")
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "items must be a non-empty list of {patient_id, question}"}), 400
+    if len(items) > CLINICAL_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"at most {CLINICAL_BATCH_MAX_ITEMS} items per batch"}), 413
+    if not is_ready():
+        start_background_init()
+        body = jsonify({"error": "clinical agent is starting up, please retry shortly", **readiness()})
+        return body, 503, {"Retry-After": "5"}
+
+    pairs = [
+        (item.get("patient_id"), item.get("question") or item.get("message") or "")
+        if isinstance(item, dict) else (None, "")
+        for item in items
+    ]
+    t0 = time.perf_counter()
+    batch = clinical_batch(pairs, find_patient_by_id, web_search=web_search, top_k=3,
+                           answer=bool(payload.get("answer", True)))
+
+    results = []
+    for r in batch:
+        if "error" in r:
+            results.append(r)
+            continue
+        out = {
+            "patient_id": r["patient_id"],
+            "question": r["question"],
+            "sources": build_sources(r["contexts"], r["web_results"]),
+            "used_web": bool(r["web_results"]),
+        }
+        if "answer" in r:
+            out["text"] = r["answer"]
+        results.append(out)
+
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    logger.info("Clinical batch: %d items, %d unique questions, %.0f ms",
+                len(pairs), len({q for _, q in pairs}), elapsed_ms)
+    return jsonify({"role": "clinical", "results": results, "elapsed_ms": round(elapsed_ms, 1)})
+
 # -----------------------------
 # Utility Endpoints
 # -----------------------------
 @app.route("/health", methods=["GET"])
 def health():
-    """Simple health check endpoint."""
+    """Liveness check: answers as soon as the process is up."""
     return jsonify({"status": "ok"})
 
 
+@app.route("/ready", methods=["GET"])
+def ready():
+    """Readiness check: 200 once the embedding model and reference index are loaded, else 503."""
+    info = readiness()
+    return jsonify(info), (200 if info["ready"] else 503)
+
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    """Cache hit/miss, web search, LLM client and logging queue counters for monitoring."""
+    return jsonify({**cache_stats(), "web_search": web_search_client.stats(),
+                    "llm": llm_client.stats() if llm_client is not None else None, "logging": logging_stats()})
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus text exposition: stage / request latency histograms and counters (all workers under gunicorn)."""
+    return Response(metrics.registry.exposition(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/admin/index", methods=["GET"])
+def index_status():
+    """Serving and published reference index versions, and the state of the last reload."""
+    if ADMIN_TOKEN and request.headers.get("X-Admin-Token") != ADMIN_TOKEN:
+        return jsonify({"error": "forbidden"}), 403
+    return jsonify(reload_status())
+
+
+@app.route("/admin/reload-index", methods=["POST"])
+def reload_index_endpoint():
+    """
+    Swap in the reference index version last published by scripts/ingest_reference.py
+    without a restart. Loads in the background and returns 202; with {"wait": true}
+    returns once the new version serves (500 if it failed validation; the old one stays).
+    Under gunicorn this reloads one worker; the others follow within RAG_INDEX_CHECK_INTERVAL.
+    """
+    if ADMIN_TOKEN and request.headers.get("X-Admin-Token") != ADMIN_TOKEN:
+        return jsonify({"error": "forbidden"}), 403
+    if not is_ready():
+        return jsonify({"error": "clinical agent is starting up, please retry shortly", **readiness()}), 503
+    payload = request.get_json(silent=True) or {}
+    if payload.get("wait"):
+        try:
+            return jsonify(reload_index(force=bool(payload.get("force"))))
+        except Exception as e:
+            return jsonify({"error": f"{type(e).__name__}: {e}", **reload_status()}), 500
+    started = start_reload()
+    return jsonify({"started": started, **reload_status()}), 202
+
+
 @app.route("/config", methods=["GET"])
 def config():
     """Return configuration info for frontend (like OpenAI status)."""
@@ -192,11 +466,20 @@ def config():
     return jsonify({"openai_configured": openai_enabled, "model": model})
 
 
+def shutdown():
+    """Stop background work and flush caches (graceful worker exit, see gunicorn.conf.py)."""
+    pipeline_shutdown()
+    rag_shutdown()
+    shutdown_logging()
+
+
 # -----------------------------
 # App Runner
 # -----------------------------
+# Development server only. For production use gunicorn:
+#     gunicorn -c backend/gunicorn.conf.py
 if __name__ == "__main__":
     host = os.getenv("FLASK_HOST", "0.0.0.0")
     port = int(os.getenv("FLASK_PORT", 5000))
     # Run in debug mode for local development
-    app.run(host=host, port=port, debug=True)
+    app.run(host=host, port=port, debug=os.getenv("FLASK_DEBUG", "1") == "1")
@@ -0,0 +1,115 @@
+import os, logging, queue, threading, time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+# -----------------------------
+# Micro-batching query encoder
+# -----------------------------
+class EmbeddingBatcher:
+    """
+    Collects texts submitted by concurrent request threads and encodes them
+    in a single `encode_fn(list_of_texts)` call.
+
+    A batch is flushed when it reaches `max_batch_size` texts or when
+    `max_wait_ms` has passed since its first text arrived, so batching adds
+    at most max_wait_ms to any request. Identical texts in one batch are
+    encoded once.
+
+    The worker thread starts lazily and is restarted after os.fork(), so the
+    batcher can be created before a pre-forking server spawns its workers.
+    """
+
+    def __init__(self, encode_fn, max_batch_size=32, max_wait_ms=5.0):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.batches = 0
+        self.items = 0
+
+    # -----------------------------
+    # Client side
+    # -----------------------------
+    def submit(self, text):
+        """Queue one text; returns a Future resolving to its embedding row."""
+        self._ensure_worker()
+        fut = Future()
+        self._queue.put((text, fut))
+        return fut
+
+    def encode(self, texts, timeout=None):
+        """Encode `texts` via the shared batches; returns a list of embedding rows."""
+        futures = [self.submit(t) for t in texts]
+        return [f.result(timeout=timeout) for f in futures]
+
+    def stats(self):
+        """Batch counters for monitoring."""
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": (self.items / self.batches) if self.batches else 0.0,
+        }
+
+    # -----------------------------
+    # Worker side
+    # -----------------------------
+    def _ensure_worker(self):
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == pid and self._thread.is_alive():
+                return
+            if self._pid != pid:
+                # Forked child: the parent's queue and thread are not ours
+                self._queue = queue.Queue()
+            self._pid = pid
+            self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+            self._thread.start()
+
+    def _collect(self):
+        """Block for the first item, then gather more until full or max_wait elapses."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            batch = [(t, f) for t, f in batch if f.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                self._encode_batch(batch)
+            except Exception as e:
+                # Anything failing here (encode, bad texts, a short result) fails
+                # the whole batch; no caller is left waiting on its future.
+                logger.exception("Batch encode of %d texts failed: %s", len(batch), e)
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+
+    def _encode_batch(self, batch):
+        unique = list(dict.fromkeys(t for t, _ in batch))
+        vectors = self.encode_fn(unique)
+        if len(vectors) != len(unique):
+            raise ValueError(f"encode_fn returned {len(vectors)} rows for {len(unique)} texts")
+        row = {t: vectors[i] for i, t in enumerate(unique)}
+        for text, fut in batch:
+            fut.set_result(row[text])
+        self.batches += 1
+        self.items += len(batch)
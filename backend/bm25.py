@@ -0,0 +1,183 @@
+"""
+backend/bm25.py
+---------------
+BM25 inverted index over the reference chunks, for hybrid lexical + dense
+retrieval. Built at ingest time next to the vector index (see
+scripts/ingest_reference.py) and memory-mapped at query time.
+
+Postings are stored in CSR form, and each posting carries its final BM25
+weight, so a query is a sum of slices:
+    - bm25_indptr.npy   int64 (n_terms + 1) offsets into the postings
+    - bm25_docs.npy     int32 chunk id per posting (ascending within a term)
+    - bm25_weights.npy  float32 BM25 term weight per posting
+    - bm25_vocab.json   {"terms": {term: id}, "idf": [...], "count", "k1", "b"}
+                        written last: marks a complete BM25 index
+"""
+
+import json
+import logging
+import os
+import re
+from array import array
+
+import numpy as np
+
+from vector_index import top_k_indices
+
+logger = logging.getLogger(__name__)
+
+BM25_INDPTR_FILE = "bm25_indptr.npy"
+BM25_DOCS_FILE = "bm25_docs.npy"
+BM25_WEIGHTS_FILE = "bm25_weights.npy"
+BM25_VOCAB_FILE = "bm25_vocab.json"
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+a about after all also am an and any are as at be because been before being but by can could did do
+does doing for from had has have having how i if in into is it its just me more most my no not of on
+or other our should so some such than that the their them then there these they this to too very was
+we were what when where which while who why will with would you your
+""".split())
+
+
+def tokenize(text):
+    """Lowercased alphanumeric terms without stopwords ("eGFR" -> "egfr", "K+" -> "k")."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Builder:
+    """
+    Accumulates postings chunk by chunk in compact arrays (12 bytes per
+    posting), then writes the CSR index with save().
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.terms = {}
+        self._term_ids = array("i")
+        self._doc_ids = array("i")
+        self._tfs = array("i")
+        self._doc_len = array("i")
+
+    def add(self, texts):
+        for text in texts:
+            doc = len(self._doc_len)
+            tokens = tokenize(text)
+            self._doc_len.append(len(tokens))
+            counts = {}
+            for tok in tokens:
+                counts[tok] = counts.get(tok, 0) + 1
+            for tok, tf in counts.items():
+                self._term_ids.append(self.terms.setdefault(tok, len(self.terms)))
+                self._doc_ids.append(doc)
+                self._tfs.append(tf)
+
+    def build(self):
+        """Returns a BM25Index held in memory."""
+        n_docs, n_terms = len(self._doc_len), len(self.terms)
+        term_ids = np.frombuffer(self._term_ids, dtype=np.int32)
+        order = np.argsort(term_ids, kind="stable")  # docs stay ascending within a term
+        docs = np.frombuffer(self._doc_ids, dtype=np.int32)[order]
+        tfs = np.frombuffer(self._tfs, dtype=np.int32)[order].astype(np.float32)
+        df = np.bincount(term_ids, minlength=n_terms)
+        indptr = np.zeros(n_terms + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(df)
+
+        doc_len = np.frombuffer(self._doc_len, dtype=np.int32).astype(np.float32)
+        avgdl = float(doc_len.mean()) if n_docs else 0.0
+        idf = np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        norm = self.k1 * (1.0 - self.b + self.b * doc_len[docs] / max(avgdl, 1e-9))
+        weights = (np.repeat(idf, df) * tfs * (self.k1 + 1.0) / (tfs + norm)).astype(np.float32)
+        return BM25Index(self.terms, idf, indptr, docs, weights, n_docs, self.k1, self.b)
+
+
+class BM25Index:
+    """Okapi BM25 search over chunk ids."""
+
+    def __init__(self, terms, idf, indptr, docs, weights, count, k1=1.2, b=0.75):
+        self.terms = terms
+        self.idf = np.asarray(idf, dtype=np.float32)
+        self.indptr = indptr
+        self.docs = docs
+        self.weights = weights
+        self.count = count
+        self.k1 = k1
+        self.b = b
+
+    def __len__(self):
+        return self.count
+
+    def _query_terms(self, query):
+        return list(dict.fromkeys(self.terms[t] for t in tokenize(query) if t in self.terms))
+
+    def scores(self, query):
+        """BM25 score of every chunk for `query` (dense float32 vector)."""
+        out = np.zeros(self.count, dtype=np.float32)
+        for term in self._query_terms(query):
+            start, end = self.indptr[term], self.indptr[term + 1]
+            out[self.docs[start:end]] += self.weights[start:end]  # docs are unique within a term
+        return out
+
+    def search(self, query, k):
+        """Top-k chunk ids by BM25 (only chunks matching at least one term), best first."""
+        scores = self.scores(query)
+        idx = top_k_indices(scores, k, min_score=1e-9)
+        return idx, scores[idx]
+
+    def save(self, index_dir):
+        for fn, arr in ((BM25_INDPTR_FILE, self.indptr), (BM25_DOCS_FILE, self.docs),
+                        (BM25_WEIGHTS_FILE, self.weights)):
+            path = os.path.join(index_dir, fn)
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, arr)
+            os.replace(path + ".tmp", path)
+        path = os.path.join(index_dir, BM25_VOCAB_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"terms": self.terms, "idf": self.idf.tolist(), "count": self.count,
+                       "k1": self.k1, "b": self.b}, f)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def exists(cls, index_dir):
+        return os.path.exists(os.path.join(index_dir, BM25_VOCAB_FILE))
+
+    @classmethod
+    def load(cls, index_dir):
+        with open(os.path.join(index_dir, BM25_VOCAB_FILE)) as f:
+            vocab = json.load(f)
+
+        def mm(fn):
+            return np.load(os.path.join(index_dir, fn), mmap_mode="r")
+        return cls(vocab["terms"], vocab["idf"], np.load(os.path.join(index_dir, BM25_INDPTR_FILE)),
+                   mm(BM25_DOCS_FILE), mm(BM25_WEIGHTS_FILE), vocab["count"], vocab["k1"], vocab["b"])
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuse ranked id lists: score(id) = sum over lists of 1 / (k + rank), rank from 1.
+    Returns ids sorted by fused score, best first (ties keep first-seen order).
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            fused[int(doc)] = fused.get(int(doc), 0.0) + 1.0 / (k + rank)
+    return sorted(fused, key=fused.get, reverse=True)
+
+
+def open_bm25(index_dir, chunks):
+    """
+    Return the BM25 index for a loaded reference index. If it is missing or
+    stale on disk, it is built in memory from `chunks` instead.
+    """
+    if index_dir and BM25Index.exists(index_dir):
+        index = BM25Index.load(index_dir)
+        if len(index) == len(chunks):
+            return index
+        logger.warning("BM25 index in %s is stale (%d vs %d chunks); building in memory",
+                       index_dir, len(index), len(chunks))
+    else:
+        logger.warning("BM25 index not found in %s; building in memory", index_dir)
+    builder = BM25Builder()
+    builder.add(chunks)
+    return builder.build()
@@ -0,0 +1,187 @@
+"""
+backend/chunker.py
+------------------
+Streaming, sentence-aware text chunker for reference ingestion.
+
+chunk_pages() consumes (page_number, text) pairs one page at a time and
+yields chunks that end on sentence or paragraph boundaries and fit a token
+budget. Only the current page and the chunk being built are held in memory,
+so peak memory does not grow with the size of the PDF.
+
+PageChunker is the same chunker fed one page per call. Its state (the
+chunk being built, which seeds the next chunk's overlap, and a sentence
+running over the page break) can be saved and restored, so a document
+chunked in several calls or runs gives the same chunks as one pass.
+
+Every chunk is a dict:
+    {"text": str, "doc": str, "page_start": int, "page_end": int, "tokens": int}
+"""
+
+import re
+
+# MiniLM truncates input at 256 word pieces; stay under that with some headroom
+MAX_CHUNK_TOKENS = 200
+OVERLAP_TOKENS = 40
+MIN_CHUNK_TOKENS = 12
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+# Sentence end: . ! ? (optionally followed by a closing quote/bracket) then whitespace
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])[\"')\]]?\s+(?=[\"'(\[]?[A-Z0-9])")
+_HYPHEN_BREAK_RE = re.compile(r"(\w)-\n(\w)")
+
+
+def estimate_tokens(text):
+    """Approximate model token count: words and punctuation marks."""
+    return len(_TOKEN_RE.findall(text))
+
+
+def split_sentences(text):
+    """Split whitespace-normalized text into sentences (the boundaries iter_sentences uses)."""
+    return _SENTENCE_END_RE.split(text)
+
+
+def _clean(text):
+    """Undo PDF hard line wrapping: re-join hyphenated words and collapse whitespace."""
+    return " ".join(_HYPHEN_BREAK_RE.sub(r"\1\2", text).split())
+
+
+def _split_long(sentence, max_tokens):
+    """Split a sentence longer than the budget into word windows."""
+    words, piece, n = sentence.split(), [], 0
+    for word in words:
+        cost = estimate_tokens(word)
+        if piece and n + cost > max_tokens:
+            yield " ".join(piece)
+            piece, n = [], 0
+        piece.append(word)
+        n += cost
+    if piece:
+        yield " ".join(piece)
+
+
+def _page_sentences(page_no, text, carry, max_carry_chars):
+    """
+    Sentences of one page as [(page_number, sentence)]. `carry` is the
+    (page_number, fragment) the previous page ended with, or None; returns
+    (sentences, carry for the next page).
+    """
+    out = []
+    paragraphs = _PARAGRAPH_RE.split(text)
+    for p_idx, paragraph in enumerate(paragraphs):
+        paragraph = _clean(paragraph)
+        if not paragraph:
+            continue
+        if carry:
+            paragraph = carry[1] + " " + paragraph
+            start_page = carry[0]
+            carry = None
+        else:
+            start_page = page_no
+        sentences = _SENTENCE_END_RE.split(paragraph)
+        last = len(paragraphs) - 1
+        for s_idx, sentence in enumerate(sentences):
+            tail = p_idx == last and s_idx == len(sentences) - 1
+            # The page's last fragment may continue on the next page
+            if tail and not sentence.rstrip().endswith((".", "!", "?")) and len(sentence) < max_carry_chars:
+                carry = (start_page, sentence)
+            else:
+                out.append((start_page, sentence))
+            start_page = page_no
+    return out, carry
+
+
+def iter_sentences(pages, max_carry_chars=4000):
+    """
+    Yield (page_number, sentence) from an iterable of (page_number, text).
+    A sentence that runs over a page break is reported on the page it starts on.
+    """
+    carry = None
+    for page_no, text in pages:
+        sentences, carry = _page_sentences(page_no, text, carry, max_carry_chars)
+        yield from sentences
+    if carry:
+        yield carry
+
+
+class PageChunker:
+    """
+    Incremental chunk_pages(): feed() takes one page and returns the chunks
+    it completed, finish() returns the last one. state() is a JSON-safe
+    snapshot of the unfinished chunk and carried sentence; pass it back as
+    `state` to continue the same document elsewhere (e.g. after a checkpoint).
+    """
+
+    def __init__(self, doc="", max_tokens=MAX_CHUNK_TOKENS, overlap_tokens=OVERLAP_TOKENS,
+                 min_tokens=MIN_CHUNK_TOKENS, state=None, max_carry_chars=4000):
+        self.doc = doc
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_tokens = min_tokens
+        self.max_carry_chars = max_carry_chars
+        state = state or {}
+        self._buf = [tuple(item) for item in state.get("buf", [])]  # [(page, sentence, tokens)]
+        self._size = sum(item[2] for item in self._buf)
+        self._carry = tuple(state["carry"]) if state.get("carry") else None
+
+    def state(self):
+        return {"buf": [list(item) for item in self._buf], "carry": list(self._carry) if self._carry else None}
+
+    def feed(self, page_no, text):
+        sentences, self._carry = _page_sentences(page_no, text, self._carry, self.max_carry_chars)
+        return [chunk for page, sentence in sentences for chunk in self._add(page, sentence)]
+
+    def finish(self):
+        out = self._add(*self._carry) if self._carry else []
+        if self._buf and self._size >= self.min_tokens:
+            out.append(self._emit())
+        self._buf, self._size, self._carry = [], 0, None
+        return out
+
+    def _emit(self):
+        return {
+            "text": " ".join(s for _, s, _ in self._buf),
+            "doc": self.doc,
+            "page_start": self._buf[0][0],
+            "page_end": self._buf[-1][0],
+            "tokens": self._size,
+        }
+
+    def _add(self, page_no, sentence):
+        out = []
+        n = estimate_tokens(sentence)
+        if n <= self.max_tokens:
+            pieces = [(sentence, n)]
+        else:
+            pieces = [(p, estimate_tokens(p)) for p in _split_long(sentence, self.max_tokens)]
+        for piece, n in pieces:
+            if self._buf and self._size + n > self.max_tokens:
+                if self._size >= self.min_tokens:
+                    out.append(self._emit())
+                # Keep whole trailing sentences as overlap, never the entire buffer
+                keep, kept = [], 0
+                for item in reversed(self._buf[1:]):
+                    if kept + item[2] > self.overlap_tokens or kept + item[2] + n > self.max_tokens:
+                        break
+                    keep.append(item)
+                    kept += item[2]
+                self._buf, self._size = keep[::-1], kept
+            self._buf.append((page_no, piece, n))
+            self._size += n
+        return out
+
+
+def chunk_pages(pages, doc="", max_tokens=MAX_CHUNK_TOKENS, overlap_tokens=OVERLAP_TOKENS,
+                min_tokens=MIN_CHUNK_TOKENS):
+    """
+    Generate chunks from an iterable of (page_number, text).
+
+    Sentences are packed until the next one would exceed `max_tokens`; the
+    next chunk then starts with the trailing sentences of the previous one
+    (up to `overlap_tokens`) so context is not lost at the boundary.
+    Chunks under `min_tokens` (headers, page numbers) are dropped.
+    """
+    chunker = PageChunker(doc, max_tokens, overlap_tokens, min_tokens)
+    for page_no, text in pages:
+        yield from chunker.feed(page_no, text)
+    yield from chunker.finish()
@@ -0,0 +1,141 @@
+"""
+backend/context_packing.py
+--------------------------
+Packs retrieved reference chunks into the LLM prompt's context section.
+
+Consecutive chunks of a document share up to OVERLAP_TOKENS of text (see
+backend/chunker.py), so the top-k hits often repeat the same sentences.
+pack_contexts():
+    - merges hits that are neighbours in the same document into one block,
+      in document order, dropping the text the second chunk repeats
+    - drops sentences already placed in a more relevant block
+    - adds blocks in relevance order until the token budget is used; the
+      block that does not fit is cut at a sentence boundary
+    - always keeps the top block, if need be cut to the budget mid-sentence,
+      so a tight budget never leaves the prompt without context
+
+Every block keeps the 1-based positions of its hits in the retrieval result,
+so [Source N] citations still match the source list returned to the client.
+Token counts use chunker.estimate_tokens (words and punctuation marks).
+"""
+
+import re
+
+from chunker import estimate_tokens, split_sentences
+
+# Shortest repeated chunk boundary treated as overlap, and shortest sentence deduplicated
+MIN_OVERLAP_CHARS = 20
+MIN_DEDUP_TOKENS = 4
+# A block cut to fit the budget must keep at least this many tokens
+MIN_BLOCK_TOKENS = 24
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+def _overlap(a, b):
+    """Length of the longest suffix of `a` that is a prefix of `b` (0 if under MIN_OVERLAP_CHARS)."""
+    probe = b[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    pos = a.find(probe, max(0, len(a) - len(b)))
+    while pos != -1:
+        if b.startswith(a[pos:]):
+            return len(a) - pos
+        pos = a.find(probe, pos + 1)
+    return 0
+
+
+def _truncate(text, max_tokens):
+    """Leading words of `text` that fit in `max_tokens`."""
+    words, n = [], 0
+    for word in text.split():
+        n += estimate_tokens(word)
+        if n > max_tokens:
+            break
+        words.append(word)
+    return " ".join(words)
+
+
+def _runs(contexts):
+    """Group hits into runs of consecutive chunk ids from the same document; runs keep hit order."""
+    hits = sorted(enumerate(contexts, start=1), key=lambda h: (str(h[1].get("doc") or ""), h[1].get("id", -1)))
+    runs = []
+    for hit in hits:
+        prev = runs[-1][-1][1] if runs else None
+        if (prev is not None and prev.get("doc") == hit[1].get("doc")
+                and prev.get("id") is not None and hit[1].get("id") == prev.get("id") + 1):
+            runs[-1].append(hit)
+        else:
+            runs.append([hit])
+    return sorted(runs, key=lambda run: min(rank for rank, _ in run))
+
+
+def _merge(run):
+    """Text of a run of neighbouring chunks with each boundary overlap kept once."""
+    text = run[0][1].get("document", "")
+    for _, c in run[1:]:
+        doc = c.get("document", "")
+        text += " " + doc[_overlap(text, doc):] if not text.endswith(doc) else ""
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+def _block(run, sentences, tokens):
+    chunks = [c for _, c in run]
+    block = {
+        "sources": sorted(rank for rank, _ in run),
+        "ids": [c.get("id") for c in chunks],
+        "document": " ".join(sentences),
+        "score": max(float(c.get("score") or 0.0) for c in chunks),
+        "tokens": tokens,
+    }
+    pages = [c for c in chunks if c.get("page_start")]
+    if pages:
+        block.update(doc=chunks[0].get("doc"), page_start=min(c["page_start"] for c in pages),
+                     page_end=max(c["page_end"] for c in pages))
+    return block
+
+
+def pack_contexts(contexts, budget_tokens):
+    """
+    Pack `contexts` (retrieval results, best first) into at most
+    `budget_tokens` tokens (<= 0: no limit). Returns (blocks, stats); each
+    block has sources, ids, document, score, tokens and, when known, doc /
+    page_start / page_end. stats: chunks, blocks, tokens_in, tokens_out,
+    dropped (hits whose text did not fit the budget).
+    """
+    tokens_in = sum(estimate_tokens(c.get("document", "")) for c in contexts)
+    seen, blocks, covered, used = set(), [], set(), 0
+    for run in _runs(contexts):
+        kept, size, cut = [], 0, False
+        for sentence in split_sentences(_merge(run)):
+            n = estimate_tokens(sentence)
+            key = _SPACE_RE.sub(" ", sentence).strip().lower()
+            if not key or (n >= MIN_DEDUP_TOKENS and key in seen):
+                continue
+            if budget_tokens > 0 and used + size + n > budget_tokens:
+                if not blocks and not kept:
+                    # Even the top block's first sentence is over budget: keep the part that fits
+                    sentence = _truncate(sentence, budget_tokens)
+                    if sentence:
+                        kept.append(sentence)
+                        size += estimate_tokens(sentence)
+                cut = True
+                break
+            seen.add(key)
+            kept.append(sentence)
+            size += n
+        if kept and (not cut or size >= MIN_BLOCK_TOKENS or not blocks):
+            blocks.append(_block(run, kept, size))
+            used += size
+        if not cut:
+            covered.update(rank for rank, _ in run)  # placed, or repeats text already placed
+        else:
+            break  # relevance order: nothing less relevant goes in ahead of the cut block
+    stats = {
+        "chunks": len(contexts),
+        "blocks": len(blocks),
+        "tokens_in": tokens_in,
+        "tokens_out": used,
+        "dropped": len(contexts) - len(covered | {r for b in blocks for r in b["sources"]}),
+    }
+    return blocks, stats
@@ -0,0 +1,244 @@
+"""
+backend/encoders.py
+-------------------
+Query/chunk encoders behind one interface, selected with RAG_ENCODER
+(see backend/rag.py):
+
+    - sentence-transformers  the PyTorch model (all-MiniLM-L6-v2)
+    - onnx                   the same model exported to ONNX and, by default,
+                             int8-quantized; runs on ONNX Runtime's CPU provider
+                             from a local directory (no download at serve time)
+    - hash                   deterministic hashed bag-of-words projection; no
+                             model files or heavy dependencies, for offline CI
+
+Every encoder takes an explicit intra-op thread count and runs one forward
+pass at a time: concurrent request threads queue on a lock instead of each
+starting a full set of math threads and oversubscribing the cores.
+
+`encode(texts)` returns L2-normalized float32 rows. `model_id` names the
+embedding space and is recorded in the index meta: the sentence-transformers
+and ONNX encoders share it (same model, same vectors up to quantization
+error), the hash encoder does not.
+
+Create the ONNX model once with scripts/export_onnx_encoder.py.
+"""
+
+import json
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+
+from ref_index import normalize_rows
+
+ENCODERS = ("sentence-transformers", "onnx", "hash")
+
+ONNX_CONFIG_FILE = "encoder.json"
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_INT8_FILE = "model.int8.onnx"
+ONNX_TOKENIZER_FILE = "tokenizer.json"
+
+
+class Encoder:
+    """Base class: subclasses implement _encode(texts, batch_size) and set name, model_id, dim."""
+
+    name = ""
+
+    def __init__(self, threads=0):
+        self.threads = int(threads or 0)
+        self._lock = threading.Lock()
+
+    def encode(self, texts, batch_size=64):
+        """L2-normalized float32 embeddings of `texts`, one row each."""
+        if not len(texts):
+            return np.zeros((0, self.dim), dtype=np.float32)
+        with self._lock:
+            return normalize_rows(self._encode(list(texts), batch_size))
+
+    def set_threads(self, n):
+        """Use `n` intra-op threads from now on (0 = library default)."""
+        self.threads = int(n or 0)
+
+    def describe(self):
+        return {"encoder": self.name, "model": self.model_id, "dim": self.dim, "threads": self.threads}
+
+
+# -----------------------------
+# PyTorch (sentence-transformers)
+# -----------------------------
+class SentenceTransformerEncoder(Encoder):
+    name = "sentence-transformers"
+
+    def __init__(self, model_name, threads=0):
+        super().__init__(threads)
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self.model_id = model_name
+        self.dim = self.model.get_sentence_embedding_dimension()
+        if self.threads:
+            self.set_threads(self.threads)
+
+    def set_threads(self, n):
+        # torch's intra-op pool is process-wide
+        super().set_threads(n)
+        if self.threads:
+            import torch
+            torch.set_num_threads(self.threads)
+
+    def _encode(self, texts, batch_size):
+        return self.model.encode(texts, batch_size=batch_size, show_progress_bar=False, convert_to_numpy=True)
+
+
+# -----------------------------
+# ONNX Runtime (CPU, optionally int8)
+# -----------------------------
+class OnnxEncoder(Encoder):
+    """
+    Transformer exported to ONNX plus its fast tokenizer, run with mean
+    pooling (as all-MiniLM-L6-v2 does). `model_dir` is written by
+    export_onnx(); nothing is fetched from the network.
+
+    ONNX Runtime's thread pool belongs to the session and does not survive
+    fork, so set_threads() (called by gunicorn's post_fork) builds a new
+    session in each worker.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_dir, threads=0, quantized=True):
+        super().__init__(threads)
+        import onnxruntime  # noqa: F401  (fail early if the optional dependency is missing)
+        from tokenizers import Tokenizer
+        with open(os.path.join(model_dir, ONNX_CONFIG_FILE)) as f:
+            config = json.load(f)
+        self.model_id = config["model"]
+        self.dim = config["dim"]
+        self.model_path = os.path.join(model_dir, ONNX_INT8_FILE if quantized else ONNX_MODEL_FILE)
+        if not os.path.exists(self.model_path):
+            raise FileNotFoundError(f"{self.model_path} not found. Run scripts/export_onnx_encoder.py first.")
+        self.name = "onnx-int8" if quantized else "onnx"
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, ONNX_TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=config.get("pad_id", 0))
+        self.session = self._session()
+
+    def _session(self):
+        import onnxruntime as ort
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = self.threads
+        opts.inter_op_num_threads = 1
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session = ort.InferenceSession(self.model_path, opts, providers=["CPUExecutionProvider"])
+        self._inputs = {i.name for i in session.get_inputs()}
+        return session
+
+    def set_threads(self, n):
+        with self._lock:
+            super().set_threads(n)
+            self.session = self._session()
+
+    def _encode(self, texts, batch_size):
+        out = []
+        for start in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(texts[start:start + batch_size])
+            mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feed = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": mask,
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            hidden = self.session.run(None, {k: v for k, v in feed.items() if k in self._inputs})[0]
+            weights = mask[:, :, None].astype(np.float32)
+            out.append((hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9))
+        return np.concatenate(out)
+
+
+def export_onnx(model_name, out_dir, quantize=True, opset=14):
+    """
+    Export a sentence-transformers model's transformer to `out_dir`
+    (model.onnx, tokenizer.json, encoder.json) and, if `quantize`, write a
+    dynamically int8-quantized copy (model.int8.onnx). Uses the locally cached
+    model if there is one. Returns `out_dir`.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer = st[0].auto_model.eval()
+    tokenizer = st.tokenizer
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer.save_pretrained(out_dir)  # fast tokenizer -> tokenizer.json
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    axes = {n: {0: "batch", 1: "seq"} for n in names}
+    axes["last_hidden_state"] = {0: "batch", 1: "seq"}
+    model_path = os.path.join(out_dir, ONNX_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(transformer, tuple(sample[n] for n in names), model_path, input_names=names,
+                          output_names=["last_hidden_state"], dynamic_axes=axes, opset_version=opset)
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(model_path, os.path.join(out_dir, ONNX_INT8_FILE), weight_type=QuantType.QInt8)
+
+    with open(os.path.join(out_dir, ONNX_CONFIG_FILE), "w") as f:
+        json.dump({
+            "model": model_name,
+            "dim": st.get_sentence_embedding_dimension(),
+            "max_seq_length": st.max_seq_length,
+            "pad_id": tokenizer.pad_token_id or 0,
+        }, f, indent=2)
+    return out_dir
+
+
+# -----------------------------
+# Deterministic test encoder
+# -----------------------------
+_TOKEN = re.compile(r"\w+")
+
+
+class HashEncoder(Encoder):
+    """
+    Hashed bag of words and word bigrams through a fixed random projection.
+    Same text -> same vector in every process and on every machine; texts
+    sharing words get similar vectors, which is enough to exercise retrieval
+    end to end without a model.
+    """
+
+    name = "hash"
+
+    def __init__(self, dim=384, buckets=4096, seed=0, threads=0):
+        super().__init__(threads)
+        self.dim = dim
+        self.buckets = buckets
+        self.model_id = f"hash-{dim}"
+        self.proj = np.random.default_rng(seed).standard_normal((buckets, dim)).astype(np.float32)
+
+    def _encode(self, texts, batch_size):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            tokens = _TOKEN.findall(text.lower())
+            features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            if features:
+                rows = [zlib.crc32(f.encode("utf-8")) % self.buckets for f in features]
+                out[i] = self.proj[rows].sum(axis=0)
+        return out
+
+
+def model_id_for(kind, model_name, dim=384):
+    """The model_id make_encoder(kind, model_name, dim=dim) will have, without loading it."""
+    return f"hash-{dim}" if kind == "hash" else model_name
+
+
+def make_encoder(kind, model_name, threads=0, onnx_dir=None, quantized=True, dim=384):
+    """Build the encoder named `kind` (one of ENCODERS)."""
+    if kind == "sentence-transformers":
+        return SentenceTransformerEncoder(model_name, threads=threads)
+    if kind == "onnx":
+        return OnnxEncoder(onnx_dir, threads=threads, quantized=quantized)
+    if kind == "hash":
+        return HashEncoder(dim=dim, threads=threads)
+    raise ValueError(f"unknown encoder {kind!r}; expected one of {', '.join(ENCODERS)}")
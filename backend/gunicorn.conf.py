@@ -0,0 +1,76 @@
+"""
+backend/gunicorn.conf.py
+------------------------
+Production serving: multi-process gunicorn with threaded workers.
+
+The app is imported once in the master (preload_app) with RAG_INIT=eager,
+so the embedding model and the memory-mapped reference index are loaded
+before workers are forked. Workers share the model weights copy-on-write
+and the index through the page cache instead of loading N copies.
+
+Run from the repository root (data paths are relative to it):
+    gunicorn -c backend/gunicorn.conf.py
+
+Environment:
+    GUNICORN_WORKERS           worker processes (default: CPU count)
+    GUNICORN_THREADS           request threads per worker (default 4)
+    GUNICORN_GRACEFUL_TIMEOUT  seconds in-flight requests get on shutdown (default 30)
+    RAG_ENCODER_THREADS        encoder threads per worker (default: CPUs / workers)
+    PROMETHEUS_MULTIPROC_DIR   where workers write metrics for /metrics to add up
+                               (default: <tmp>/clinical-metrics-<port>, emptied at start)
+"""
+
+import gc
+import multiprocessing
+import os
+import tempfile
+
+os.environ.setdefault("RAG_INIT", "eager")
+# Set before the app (and backend/metrics.py) is imported
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR",
+                      os.path.join(tempfile.gettempdir(), f"clinical-metrics-{os.getenv('FLASK_PORT', '5000')}"))
+
+wsgi_app = "wsgi:app"
+pythonpath = os.path.dirname(os.path.abspath(__file__))
+bind = f"{os.getenv('FLASK_HOST', '0.0.0.0')}:{os.getenv('FLASK_PORT', '5000')}"
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count()))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+worker_class = "gthread"
+preload_app = True
+# A request can use its whole deadline; leave headroom before the worker is killed
+timeout = int(float(os.getenv("CLINICAL_DEADLINE_S", "20"))) + 10
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+accesslog = "-"
+
+
+def on_starting(server):
+    import metrics
+    metrics.registry.clear_dir()
+
+
+def pre_fork(server, worker):
+    # Move everything loaded so far out of the GC's reach, so collections in the
+    # workers don't write to (and un-share) the preloaded objects' pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import metrics
+    import rag
+    metrics.registry.start_worker()
+    # Also rebuilds an ONNX Runtime session, whose thread pool did not survive the fork
+    rag.set_encoder_threads(rag.RAG_ENCODER_THREADS or max(1, multiprocessing.cpu_count() // server.cfg.workers))
+
+
+def worker_exit(server, worker):
+    import app
+    import metrics
+    app.shutdown()
+    metrics.registry.flush()
+
+
+def child_exit(server, worker):
+    # Runs in the master: keep the dead worker's counters in /metrics totals
+    import metrics
+    metrics.registry.mark_process_dead(worker.pid)
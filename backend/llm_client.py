@@ -0,0 +1,278 @@
+import os, contextlib, json, logging, random, socket, threading, time
+import dotenv
+import requests
+from requests.adapters import HTTPAdapter
+import metrics
+
+# Load environment variables from .env file
+dotenv.load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------
+# Configuration
+# -----------------------------
+OPENAI_KEY = os.getenv("OPENAI_API_KEY", "")
+# OpenAI-compatible endpoint (e.g. scripts/mock_openai_server.py at http://localhost:8001/v1)
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
+MODEL_NAME = os.getenv("MODEL_NAME", "gpt-3.5-turbo")
+# Upper bound for one LLM call (queueing + retries + generation); request deadlines can only shorten it
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "20"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "3"))
+# Max simultaneous calls to the provider per process; further calls queue for a slot
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# Retries after a connection error, 429 or 5xx, with full-jitter exponential backoff (seconds)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "0.25"))
+LLM_RETRY_BACKOFF_MAX = float(os.getenv("LLM_RETRY_BACKOFF_MAX", "2"))
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "500"))
+
+RETRY_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+
+class LLMError(Exception):
+    """The provider call failed (after any retries)."""
+
+
+class LLMTimeout(LLMError):
+    """The call's deadline passed: waiting for a slot, between retries or while generating."""
+
+
+# -----------------------------
+# LLM client
+# -----------------------------
+class LLMClient:
+    """
+    OpenAI-compatible Chat Completions client for the answer stage.
+
+    - one pooled requests.Session per process (keep-alive connections are
+      reused; re-created after fork)
+    - a deadline per call covering the wait for a slot, every attempt and
+      the backoff sleeps; the read timeout never exceeds what is left, and
+      once response headers arrive a watchdog closes the connection at the
+      deadline (the read timeout bounds each socket read, not the response)
+    - retries with full-jitter exponential backoff on connection errors,
+      429 and 5xx (Retry-After is honoured if it fits the deadline)
+    - at most `max_concurrency` calls in flight; the rest wait in line, and
+      the wait is observed in llm_queue_wait_seconds
+
+    chat() returns the answer text and chat_stream() yields text fragments;
+    both raise LLMTimeout when the deadline passes and LLMError on other
+    failures, so callers can fall back at once.
+    """
+
+    def __init__(self, api_key, api_base=OPENAI_API_BASE, model=MODEL_NAME, timeout=LLM_TIMEOUT,
+                 connect_timeout=LLM_CONNECT_TIMEOUT, max_concurrency=LLM_MAX_CONCURRENCY,
+                 max_retries=LLM_MAX_RETRIES, backoff=LLM_RETRY_BACKOFF, backoff_max=LLM_RETRY_BACKOFF_MAX,
+                 max_tokens=LLM_MAX_TOKENS):
+        self.api_key = api_key
+        self.url = api_base.rstrip("/") + "/chat/completions"
+        self.model = model
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+        self._pid = None
+        self._session = None
+        self._slots = None
+        self.in_flight = self.waiting = 0
+        self.calls = self.retries = self.failures = self.timeouts = self.rejected = 0
+
+    # -----------------------------
+    # Per-process state
+    # -----------------------------
+    def _ensure_process(self):
+        # Pooled sockets and a semaphore held by threads of the parent must not cross fork()
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency, max_retries=0)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    session.headers.update({"Authorization": f"Bearer {self.api_key}"})
+                    self._session = session
+                    self._slots = threading.BoundedSemaphore(self.max_concurrency)
+                    self.in_flight = self.waiting = 0
+                    self._pid = os.getpid()
+
+    def _acquire(self, deadline):
+        self._ensure_process()
+        with self._lock:
+            self.waiting += 1
+        start = time.monotonic()
+        try:
+            acquired = self._slots.acquire(timeout=max(0.0, deadline - start))
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        metrics.LLM_QUEUE_SECONDS.observe(time.monotonic() - start)
+        if not acquired:
+            self._count("rejected")
+            raise LLMTimeout(f"no LLM slot free within {deadline - start:.2f}s ({self.max_concurrency} in flight)")
+        with self._lock:
+            self.in_flight += 1
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    # -----------------------------
+    # Requests
+    # -----------------------------
+    def _deadline(self, timeout):
+        return time.monotonic() + (self.timeout if timeout is None else min(timeout, self.timeout))
+
+    def _post(self, payload, deadline):
+        """
+        POST with retries until a 2xx response; the caller holds a slot and
+        reads the body under _guard(). The body is always streamed, so the
+        call returns once the headers are in.
+        """
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            retry_after = None
+            self._count("calls")
+            try:
+                resp = self._session.post(self.url, json=payload, stream=True,
+                                          timeout=(min(self.connect_timeout, remaining), remaining))
+            except (requests.Timeout, requests.ConnectionError) as e:
+                error = e
+            else:
+                if resp.status_code < 300:
+                    return resp
+                error = LLMError(f"HTTP {resp.status_code}: {resp.text[:200].strip()}")
+                retry_after = resp.headers.get("Retry-After")
+                resp.close()
+                if resp.status_code not in RETRY_STATUSES:
+                    self._count("failures")
+                    raise error
+            if attempt == self.max_retries:
+                if time.monotonic() >= deadline:
+                    break
+                self._count("failures")
+                raise LLMError(f"LLM call failed after {attempt + 1} attempts: {error}") from error
+            delay = random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+            try:
+                delay = max(delay, float(retry_after)) if retry_after else delay
+            except ValueError:
+                pass
+            if time.monotonic() + delay >= deadline:
+                break
+            logger.warning("LLM call attempt %d failed (%s); retrying in %.2fs", attempt + 1, error, delay)
+            self._count("retries")
+            time.sleep(delay)
+        self._count("timeouts")
+        raise LLMTimeout("LLM deadline exceeded")
+
+    @staticmethod
+    def _abort(resp, fired):
+        # Runs on the watchdog timer. Shutting the socket down wakes a read
+        # blocked on it; close() then releases the response. The connection may
+        # have handed its socket to the response (Connection: close), so look in both.
+        fired.set()
+        fp = getattr(getattr(resp.raw, "_fp", None), "fp", None)
+        for sock in (getattr(getattr(resp.raw, "_connection", None), "sock", None),
+                     getattr(getattr(fp, "raw", None), "_sock", None)):
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        try:
+            resp.close()
+        except Exception:
+            pass  # the reading thread sees the connection fail either way
+
+    @contextlib.contextmanager
+    def _guard(self, resp, deadline, what):
+        """
+        Read `resp` within the deadline: a timer aborts the connection when it
+        passes, so a body trickling in a few bytes per read timeout cannot run
+        past it. Read errors become LLMTimeout (deadline passed) or LLMError.
+        """
+        fired = threading.Event()
+        timer = threading.Timer(max(0.0, deadline - time.monotonic()), self._abort, (resp, fired))
+        timer.daemon = True
+        timer.start()
+        try:
+            yield
+        except Exception as e:
+            if fired.is_set() or isinstance(e, requests.Timeout):
+                self._count("timeouts")
+                raise LLMTimeout(f"LLM deadline exceeded while {what}") from e
+            if not isinstance(e, (requests.RequestException, ValueError)):
+                raise
+            self._count("failures")
+            raise LLMError(f"LLM {what} failed: {e}") from e
+        finally:
+            timer.cancel()
+            resp.close()
+
+    def _payload(self, messages, stream):
+        return {"model": self.model, "messages": messages, "max_tokens": self.max_tokens, "temperature": 0.0,
+                "stream": stream}
+
+    def chat(self, messages, timeout=None):
+        """Answer text for `messages`; `timeout` (seconds) caps the whole call."""
+        deadline = self._deadline(timeout)
+        self._acquire(deadline)
+        try:
+            resp = self._post(self._payload(messages, False), deadline)
+            with self._guard(resp, deadline, "reading the response"):
+                body = resp.json()
+            return body["choices"][0]["message"]["content"].strip()
+        finally:
+            self._release()
+
+    def chat_stream(self, messages, timeout=None):
+        """
+        Generator of answer text fragments. Retries happen only before the
+        first fragment; the slot is held until the stream ends or is closed.
+        """
+        deadline = self._deadline(timeout)
+        self._acquire(deadline)
+        try:
+            resp = self._post(self._payload(messages, True), deadline)
+            with self._guard(resp, deadline, "streaming"):
+                for line in resp.iter_lines():
+                    if time.monotonic() >= deadline:
+                        raise requests.Timeout()
+                    if not line.startswith(b"data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == b"[DONE]":
+                        break
+                    text = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                    if text:
+                        yield text
+        finally:
+            self._release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "model": self.model,
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "max_concurrency": self.max_concurrency,
+                "calls": self.calls,
+                "retries": self.retries,
+                "failures": self.failures,
+                "timeouts": self.timeouts,
+                "rejected": self.rejected,
+            }
+
+
+client = LLMClient(OPENAI_KEY) if OPENAI_KEY else None
@@ -1,12 +1,24 @@
+import atexit
+import contextvars
+import copy
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 # -------------------------------------------------------
 # Logging Configuration
 # -------------------------------------------------------
 # This module sets up project-wide logging with rotation.
 # Logs are written to both the console and a rotating file.
+#
+# By default (LOG_QUEUE=1) request threads only put records on an in-memory
+# queue; a background listener thread does the formatting, file I/O and
+# rotation. File records are JSON lines (LOG_FORMAT=json) carrying the
+# request id and, where logged, per-request stage timings.
 # -------------------------------------------------------
 
 # Define log directory and file paths
@@ -14,25 +26,199 @@ LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "logs")
 os.makedirs(LOG_DIR, exist_ok=True)
 LOG_PATH = os.path.join(LOG_DIR, "system.log")
 
-def configure_logging():
-    """Configure global logging settings for the application."""
-    logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" (one JSON object per line) or "text" for the log file; the console is always text
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Hand records to a background thread instead of writing them on the request path
+LOG_QUEUE = os.getenv("LOG_QUEUE", "1") == "1"
+# Records buffered for the listener (0 = unbounded); when full, records are dropped, not waited for
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
 
+TEXT_FORMAT = "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+CONSOLE_FORMAT = "%(asctime)s | %(levelname)s | %(message)s"
+
+# Extra record attributes copied into JSON output when present
+STRUCTURED_FIELDS = ("stage_timings", "total_ms", "prompt_stats")
+
+# -------------------------------------------------------
+# Request ids
+# -------------------------------------------------------
+_request_id = contextvars.ContextVar("request_id", default=None)
+
+
+def set_request_id(request_id):
+    """Tag every record logged from this context with `request_id`."""
+    _request_id.set(request_id)
+
+
+def get_request_id():
+    return _request_id.get()
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds record.request_id; runs in the logging thread, before any queue hop."""
+
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = _request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, message, request_id, thread and structured extras."""
+
+    def format(self, record):
+        out = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "thread": record.threadName,
+        }
+        for field in STRUCTURED_FIELDS:
+            if hasattr(record, field):
+                out[field] = getattr(record, field)
+        if record.exc_info:
+            out["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            out["exc_info"] = record.exc_text
+        return json.dumps(out, default=str)
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks the caller: records are dropped (and counted) if the queue is full."""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # Like QueueHandler.prepare (merge args, drop unpicklable exc_info), but the
+        # traceback is kept apart in exc_text so formatters can place it themselves
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DroppingQueueHandler.dropped += 1
+
+
+# -------------------------------------------------------
+# Setup
+# -------------------------------------------------------
+_lock = threading.Lock()
+_handlers = []       # handlers this module attached to the root logger
+_listener = None
+
+
+def _make_handlers(fmt, path):
     # File handler with rotation (max 5MB per file, up to 3 backups)
-    fh = RotatingFileHandler(
-        LOG_PATH, maxBytes=5 * 1024 * 1024, backupCount=3, encoding="utf-8"
-    )
-    fh.setLevel(logging.INFO)
-    fh_formatter = logging.Formatter(
-        "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
-    )
-    fh.setFormatter(fh_formatter)
-    logger.addHandler(fh)
+    fh = RotatingFileHandler(path, maxBytes=5 * 1024 * 1024, backupCount=3, encoding="utf-8")
+    fh.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
 
     # Console handler for real-time log visibility
     ch = logging.StreamHandler()
-    ch.setLevel(logging.INFO)
-    ch_formatter = logging.Formatter("%(asctime)s | %(levelname)s | %(message)s")
-    ch.setFormatter(ch_formatter)
-    logger.addHandler(ch)
+    ch.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+    return [fh, ch]
+
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, use_queue=LOG_QUEUE, path=LOG_PATH,
+                      queue_size=LOG_QUEUE_SIZE):
+    """
+    Configure global logging settings for the application.
+    Idempotent: calling it again replaces the handlers it attached earlier
+    instead of adding duplicates.
+    """
+    global _listener
+    with _lock:
+        _remove_handlers()
+        root = logging.getLogger()
+        root.setLevel(level)
+        handlers = _make_handlers(fmt, path)
+        for h in handlers:
+            h.setLevel(level)
+        if use_queue:
+            q = queue.Queue(queue_size)
+            qh = _DroppingQueueHandler(q)
+            qh.addFilter(RequestIdFilter())
+            _listener = QueueListener(q, *handlers, respect_handler_level=True)
+            _listener.start()
+            attached = [qh]
+        else:
+            for h in handlers:
+                h.addFilter(RequestIdFilter())
+            attached = handlers
+        for h in attached:
+            root.addHandler(h)
+        _handlers[:] = attached
+
+
+def _remove_handlers():
+    global _listener
+    root = logging.getLogger()
+    if _listener is not None:
+        _listener.stop()  # drains the queue
+        for h in _listener.handlers:
+            h.close()
+        _listener = None
+    for h in _handlers:
+        root.removeHandler(h)
+        h.close()
+    _handlers.clear()
+
+
+def shutdown_logging():
+    """
+    Drain the queue and stop the listener thread. Later records are written
+    directly, so nothing logged during interpreter shutdown is lost.
+    """
+    global _listener
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        root = logging.getLogger()
+        for h in _handlers:
+            root.removeHandler(h)
+        handlers = list(_listener.handlers)
+        for h in handlers:
+            h.addFilter(RequestIdFilter())
+            root.addHandler(h)
+        _handlers[:] = handlers
+        _listener = None
+
+
+atexit.register(shutdown_logging)
+
+
+def _restart_after_fork():
+    # The listener thread does not survive fork (gunicorn preloads the app in
+    # the master); give each child a fresh queue and its own listener
+    global _lock, _listener
+    _lock = threading.Lock()
+    if _listener is None:
+        return
+    q = queue.Queue(_listener.queue.maxsize)
+    for h in _handlers:
+        h.queue = q
+    _listener = QueueListener(q, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def stats():
+    """Queue depth and dropped-record count, for monitoring."""
+    q = _listener.queue if _listener is not None else None
+    return {
+        "queued": q.qsize() if q is not None else 0,
+        "dropped": _DroppingQueueHandler.dropped,
+        "mode": "queue" if q is not None else "direct",
+    }
@@ -0,0 +1,343 @@
+import bisect, contextvars, json, logging, os, tempfile, threading, time, uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Directory where every worker process writes its samples, so /metrics reports
+# the whole server and not only the worker that took the scrape ("" = this
+# process only). backend/gunicorn.conf.py sets it.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+# Seconds between a worker's writes of its samples to that directory
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+
+# Latency buckets in seconds (Prometheus "le" upper bounds; +Inf is implicit)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 60.0)
+
+
+# -----------------------------
+# Metric types (Prometheus text exposition format)
+# -----------------------------
+def _label_str(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels."""
+
+    type = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels.get(n, "")) for n in self.labels), 0)
+
+    def series(self):
+        """[(sample name with labels, value)]"""
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(f"{self.name}{_label_str(self.labels, key)}", v) for key, v in items]
+
+    def samples(self):
+        return [f"{name} {_fmt(v)}" for name, v in self.series()]
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    """Cumulative-bucket histogram (count, sum and one counter per bucket), optionally split by labels."""
+
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    def series(self):
+        """[(sample name with labels, value)]: cumulative buckets, then _sum and _count per label set."""
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        out = []
+        for key, series in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_fmt(bound)}"'
+                out.append((f"{self.name}_bucket{_label_str(self.labels, key, [le])}", cumulative))
+            out.append((f"{self.name}_sum{_label_str(self.labels, key)}", round(series[-1], 6)))
+            out.append((f"{self.name}_count{_label_str(self.labels, key)}", cumulative))
+        return out
+
+    def samples(self):
+        return [f"{name} {_fmt(v)}" for name, v in self.series()]
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Registry:
+    """
+    Metrics served at /metrics. Besides Counter / Histogram objects it holds
+    collectors: callables returning [(name, type, help, [(labels dict, value)])]
+    that read existing counters (cache stats, web search client) at scrape time.
+
+    With `multiproc_dir` (one directory per server), each worker process
+    writes its samples to a file there every `flush_interval` seconds and
+    when it exits, and exposition() adds up its own live samples and every
+    other worker's file. Counters and histograms of workers that died are
+    kept (mark_process_dead() folds them into one archive file), so totals
+    never go down when gunicorn replaces a worker; gauges are the sum over
+    live workers. Other workers' samples are up to `flush_interval` old.
+    """
+
+    ARCHIVE = "dead_workers.json"
+
+    def __init__(self, multiproc_dir="", flush_interval=METRICS_FLUSH_INTERVAL):
+        self._metrics = []
+        self._collectors = []
+        self.multiproc_dir = multiproc_dir
+        self.flush_interval = flush_interval
+        self._file = None
+        self._file_pid = None
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, fn):
+        self._collectors.append(fn)
+        return fn
+
+    def families(self):
+        """This process's metrics: [(name, type, help, [(sample name with labels, value)])]."""
+        out = [(m.name, m.type, m.help, m.series()) for m in self._metrics]
+        for collect in self._collectors:
+            for name, kind, help, samples in collect():
+                out.append((name, kind, help,
+                            [(f"{name}{_label_str(labels.keys(), labels.values())}", v) for labels, v in samples]))
+        return out
+
+    def exposition(self):
+        families = self.families()
+        if self.multiproc_dir:
+            families = _merge([families] + self._other_processes())
+        lines = []
+        for name, kind, help, samples in families:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            lines += [f"{sample} {_fmt(value)}" for sample, value in samples]
+        return "\n".join(lines) + "\n"
+
+    # -----------------------------
+    # Multi-process mode
+    # -----------------------------
+    def start_worker(self):
+        """
+        Begin writing this process's samples to multiproc_dir (call after
+        fork). Values inherited from the parent are dropped first, so they
+        are not counted once per worker.
+        """
+        if not self.multiproc_dir:
+            return
+        for m in self._metrics:
+            m.reset()
+        self._file = os.path.join(self.multiproc_dir, f"worker_{os.getpid()}_{uuid.uuid4().hex[:8]}.json")
+        self._file_pid = os.getpid()
+        self.flush()
+        threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Write this worker's samples to its file (no-op outside a started worker)."""
+        if self._file is None or self._file_pid != os.getpid():
+            return
+        try:
+            _write_json(self._file, {"families": self.families()})
+        except OSError as e:
+            logger.warning("Could not write metrics to %s: %s", self._file, e)
+
+    def mark_process_dead(self, pid):
+        """
+        Fold the counters and histograms of dead worker `pid` into the archive
+        and remove its file. Call from the parent (gunicorn child_exit), which
+        is then the only writer of the archive.
+        """
+        if not self.multiproc_dir:
+            return
+        prefix = f"worker_{pid}_"
+        files = [fn for fn in _listdir(self.multiproc_dir) if fn.startswith(prefix) and fn.endswith(".json")]
+        if not files:
+            return
+        archive = _read_json(os.path.join(self.multiproc_dir, self.ARCHIVE)) or {"families": [], "files": []}
+        families = [archive["families"]]
+        for fn in files:
+            data = _read_json(os.path.join(self.multiproc_dir, fn))
+            if data is not None and fn not in archive["files"]:
+                families.append([f for f in data["families"] if f[1] in ("counter", "histogram")])
+        try:
+            # Archive first, then remove: readers skip worker files the archive already holds
+            _write_json(os.path.join(self.multiproc_dir, self.ARCHIVE),
+                        {"families": _merge(families), "files": sorted(set(archive["files"]) | set(files))})
+            for fn in files:
+                os.unlink(os.path.join(self.multiproc_dir, fn))
+        except OSError as e:
+            logger.warning("Could not archive metrics of worker %s: %s", pid, e)
+
+    def clear_dir(self):
+        """Create multiproc_dir and remove samples left by an earlier server run."""
+        if not self.multiproc_dir:
+            return
+        os.makedirs(self.multiproc_dir, exist_ok=True)
+        for fn in _listdir(self.multiproc_dir):
+            if fn.endswith(".json") or fn.endswith(".tmp"):
+                try:
+                    os.unlink(os.path.join(self.multiproc_dir, fn))
+                except OSError:
+                    pass
+
+    def _other_processes(self):
+        own = os.path.basename(self._file) if self._file_pid == os.getpid() and self._file else None
+        workers = {}
+        for fn in _listdir(self.multiproc_dir):
+            if fn.startswith("worker_") and fn.endswith(".json") and fn != own:
+                data = _read_json(os.path.join(self.multiproc_dir, fn))
+                if data is not None:
+                    workers[fn] = data["families"]
+        # Read after the worker files: a file removed by mark_process_dead() meanwhile is in here
+        archive = _read_json(os.path.join(self.multiproc_dir, self.ARCHIVE))
+        if archive is None:
+            return list(workers.values())
+        return [fams for fn, fams in workers.items() if fn not in archive["files"]] + [archive["families"]]
+
+
+def _merge(family_lists):
+    """Add up samples of the same name across processes; families keep first-seen order."""
+    merged = {}
+    for families in family_lists:
+        for name, kind, help, samples in families:
+            entry = merged.setdefault(name, (kind, help, {}))
+            for sample, value in samples:
+                entry[2][sample] = entry[2].get(sample, 0) + value
+    return [(name, kind, help, list(values.items())) for name, (kind, help, values) in merged.items()]
+
+
+def _listdir(path):
+    try:
+        return sorted(os.listdir(path))
+    except OSError:
+        return []
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+registry = Registry(PROMETHEUS_MULTIPROC_DIR)
+
+STAGE_SECONDS = registry.register(Histogram(
+    "clinical_stage_seconds", "Time spent per /clinical pipeline stage", ["stage"]))
+REQUEST_SECONDS = registry.register(Histogram(
+    "http_request_seconds", "HTTP request latency until the response starts", ["endpoint", "status"]))
+WEB_FALLBACKS = registry.register(Counter(
+    "clinical_web_fallbacks_total", "Clinical questions answered with the web search fallback"))
+ERRORS = registry.register(Counter(
+    "errors_total", "Failed pipeline stages and 5xx responses", ["stage"]))
+LLM_QUEUE_SECONDS = registry.register(Histogram(
+    "llm_queue_wait_seconds", "Time LLM calls waited for a concurrency slot"))
+LLM_FALLBACKS = registry.register(Counter(
+    "llm_fallbacks_total", "Answers served as reference excerpts because the LLM call failed", ["reason"]))
+
+
+# -----------------------------
+# Per-request stage timings
+# -----------------------------
+# Each request gets its own dict of stage -> milliseconds. Work handed to a
+# thread pool does not inherit the context; pass current_timings() explicitly.
+_timings = contextvars.ContextVar("stage_timings", default=None)
+
+
+def start_request():
+    """Begin collecting stage timings for the current request; returns the dict."""
+    timings = {}
+    _timings.set(timings)
+    return timings
+
+
+def current_timings():
+    """Stage timings of the current request (None outside a request)."""
+    return _timings.get()
+
+
+@contextmanager
+def stage(name, timings=None):
+    """
+    Time a block as pipeline stage `name`: observed in clinical_stage_seconds,
+    added to the request's stage timings, and counted in errors_total if it raises.
+    """
+    if timings is None:
+        timings = _timings.get()
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        if not isinstance(e, GeneratorExit):
+            ERRORS.inc(stage=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        if timings is not None:
+            timings[name] = round(timings.get(name, 0.0) + elapsed * 1000, 2)
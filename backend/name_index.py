@@ -0,0 +1,193 @@
+import bisect, heapq, re
+from collections import Counter
+
+# -----------------------------
+# Tunables
+# -----------------------------
+# Minimum trigram (Dice) similarity for a typo-tolerant token match
+FUZZY_THRESHOLD = 0.4
+# Maximum vocabulary tokens a single query token may expand to
+MAX_EXPANSIONS = 16
+
+# Relative weight of each kind of token match
+EXACT_SIM = 1.0
+PREFIX_SIM = 0.85
+FUZZY_WEIGHT = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Lowercase and split a name into alphanumeric tokens."""
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def trigrams(token):
+    """Padded character trigrams of a token (e.g. 'rao' -> {'$ra', 'rao', 'ao$'})."""
+    padded = f"${token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# -----------------------------
+# Inverted name index
+# -----------------------------
+class NameIndex:
+    """
+    Token-based inverted index over names with prefix and trigram fuzzy matching.
+
+    Each distinct token is stored once in a sorted vocabulary (for prefix range
+    lookups) and in a trigram -> tokens map (for typo tolerance); postings map
+    token -> keys. A query is answered by expanding every query token to a few
+    vocabulary tokens, intersecting their postings, and ranking the survivors.
+
+    Not thread-safe for writers; callers serialize add/remove.
+    """
+
+    def __init__(self):
+        self._names = {}      # key -> tuple of tokens
+        self._postings = {}   # token -> set of keys
+        self._grams = {}      # trigram -> set of tokens
+        self._vocab = []      # sorted distinct tokens
+
+    def __len__(self):
+        return len(self._names)
+
+    # -----------------------------
+    # Mutation
+    # -----------------------------
+    def add(self, key, name):
+        """Index `name` under `key` (replacing any previous name for that key)."""
+        if key in self._names:
+            self.remove(key)
+        tokens = tuple(tokenize(name))
+        self._names[key] = tokens
+        for tok in set(tokens):
+            keys = self._postings.get(tok)
+            if keys is None:
+                keys = self._postings[tok] = set()
+                bisect.insort(self._vocab, tok)
+                for g in trigrams(tok):
+                    self._grams.setdefault(g, set()).add(tok)
+            keys.add(key)
+
+    def remove(self, key):
+        """Drop `key` from the index; no-op if absent."""
+        tokens = self._names.pop(key, None)
+        if tokens is None:
+            return
+        for tok in set(tokens):
+            keys = self._postings.get(tok)
+            if keys is None:
+                continue
+            keys.discard(key)
+            if keys:
+                continue
+            del self._postings[tok]
+            i = bisect.bisect_left(self._vocab, tok)
+            if i < len(self._vocab) and self._vocab[i] == tok:
+                del self._vocab[i]
+            for g in trigrams(tok):
+                toks = self._grams.get(g)
+                if toks:
+                    toks.discard(tok)
+                    if not toks:
+                        del self._grams[g]
+
+    # -----------------------------
+    # Query
+    # -----------------------------
+    def _expand(self, qtok):
+        """
+        Map one query token to [(similarity, vocab_token), ...], best first.
+        Order of preference: exact, prefix, trigram fuzzy (alphabetic tokens only).
+        """
+        out = []
+        if qtok in self._postings:
+            out.append((EXACT_SIM, qtok))
+
+        # Prefix matches via the sorted vocabulary
+        i = bisect.bisect_right(self._vocab, qtok)
+        while i < len(self._vocab) and len(out) < MAX_EXPANSIONS:
+            tok = self._vocab[i]
+            if not tok.startswith(qtok):
+                break
+            out.append((PREFIX_SIM * len(qtok) / len(tok) + (1 - PREFIX_SIM) * 0.5, tok))
+            i += 1
+
+        # Typo tolerance; numbers are identifiers, so never fuzz them
+        if not out and len(qtok) >= 3 and not qtok.isdigit():
+            qgrams = trigrams(qtok)
+            shared = Counter()
+            for g in qgrams:
+                shared.update(self._grams.get(g, ()))
+            fuzzy = []
+            for tok, n in shared.items():
+                sim = 2.0 * n / (len(qgrams) + len(tok))  # len(tok) == trigram count
+                if sim >= FUZZY_THRESHOLD:
+                    fuzzy.append((FUZZY_WEIGHT * sim, tok))
+            fuzzy.sort(reverse=True)
+            out.extend(fuzzy[:MAX_EXPANSIONS])
+
+        out.sort(key=lambda x: -x[0])
+        return out
+
+    def search(self, query, limit=5):
+        """
+        Rank indexed keys against `query`.
+        Every query token must match (exactly, by prefix, or fuzzily).
+        Returns [(score, key), ...] sorted best first, at most `limit` items.
+        """
+        qtokens = list(dict.fromkeys(tokenize(query)))
+        if not qtokens:
+            return []
+
+        expansions = []
+        keysets = []
+        for qt in qtokens:
+            exp = self._expand(qt)
+            if not exp:
+                return []
+            expansions.append(exp)
+            postings = [self._postings[tok] for _, tok in exp]
+            keysets.append(postings[0] if len(postings) == 1 else set().union(*postings))
+
+        # Intersect smallest-first so the working set shrinks fast
+        order = sorted(range(len(keysets)), key=lambda i: len(keysets[i]))
+        candidates = keysets[order[0]]
+        for i in order[1:]:
+            candidates = candidates & keysets[i]
+            if not candidates:
+                return []
+
+        # Query tokens with a single expansion contribute the same sim to every
+        # candidate; only multi-expansion tokens need a per-key lookup.
+        base = 0.0
+        varying = []
+        for exp in expansions:
+            if len(exp) == 1:
+                base += exp[0][0]
+            else:
+                varying.append([(sim, self._postings[tok]) for sim, tok in exp])
+
+        qnorm = tuple(tokenize(query))
+        n_q = len(qtokens)
+        names = self._names
+
+        def rank_key(key):
+            total = base
+            for exp in varying:
+                for sim, keys in exp:
+                    if key in keys:
+                        total += sim
+                        break
+            name_tokens = names[key]
+            score = total / n_q + 0.1 * min(1.0, n_q / len(name_tokens))
+            if name_tokens == qnorm:
+                score += 1.0
+            return (-score, key)
+
+        if limit:
+            ranked = heapq.nsmallest(limit, candidates, key=rank_key)
+        else:
+            ranked = sorted(candidates, key=rank_key)
+        return [(-rank_key(key)[0], key) for key in ranked]
@@ -0,0 +1,173 @@
+"""
+backend/patient_snapshot.py
+---------------------------
+Single-file, columnar patient database: the alternative to one JSON file per
+patient under data/patients/ (see PATIENT_STORE in backend/patient_tool.py).
+
+The snapshot is one JSON document with one column per field:
+    {"format": "patients-columnar-v1", "count": n, "fields": [...],
+     "columns": {field: {"values": [...]}                      # plain: one value per row
+                        | {"dict": [...], "codes": [...]}}}    # dictionary-encoded
+
+Fields with few distinct values (diagnoses, follow-ups, dietary restrictions,
+medication lists, dates) are dictionary-encoded: each distinct value is stored
+and held in memory once (strings interned), and rows keep a 1-4 byte code in
+an array. No per-patient objects exist in memory; get() builds a dict on demand.
+
+Build a snapshot from the JSON directory with scripts/convert_patients.py.
+"""
+
+import json
+import os
+import sys
+from array import array
+
+FORMAT = "patients-columnar-v1"
+
+# A column is dictionary-encoded if it has at most this share of distinct values
+DICT_MAX_DISTINCT_RATIO = 0.5
+
+
+def _freeze(value):
+    """Hashable form of a JSON value, for counting distinct list values."""
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+def _code_array(n_values):
+    return array("B" if n_values <= 0xFF else "H" if n_values <= 0xFFFF else "I")
+
+
+def _copy(value):
+    """Copy of a JSON value's lists and dicts (strings and numbers are immutable and shared)."""
+    if isinstance(value, list):
+        return [_copy(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    return value
+
+
+def _intern(value):
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, list):
+        return [_intern(v) for v in value]
+    return value
+
+
+# -----------------------------
+# Write side
+# -----------------------------
+def build_columns(records):
+    """Column-encode `records` (dicts with a patient_id); returns the snapshot document."""
+    records = sorted((r for r in records if r.get("patient_id") is not None), key=lambda r: r["patient_id"])
+    fields = ["patient_id"]
+    for r in records:
+        for k in r:
+            if k not in fields:
+                fields.append(k)
+
+    columns = {}
+    n = len(records)
+    for field in fields:
+        raw = [r.get(field) for r in records]
+        dictionary, codes = {}, []
+        for v in raw:
+            codes.append(dictionary.setdefault(_freeze(v), len(dictionary)))
+        if field != "patient_id" and n and len(dictionary) <= max(1, DICT_MAX_DISTINCT_RATIO * n):
+            values = [None] * len(dictionary)
+            for v, code in zip(raw, codes):
+                values[code] = v
+            columns[field] = {"dict": values, "codes": codes}
+        else:
+            columns[field] = {"values": raw}
+    return {"format": FORMAT, "count": n, "fields": fields, "columns": columns}
+
+
+def write_snapshot(path, records):
+    """Write `records` to `path` atomically (temporary file + rename). Returns the record count."""
+    doc = build_columns(records)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(doc, f, separators=(",", ":"))
+    os.replace(tmp, path)
+    return doc["count"]
+
+
+# -----------------------------
+# Read side
+# -----------------------------
+class PatientTable:
+    """
+    Read-only columnar patient table.
+
+    Plain columns are lists; dictionary-encoded columns are (values, codes)
+    with codes in a compact array. Fields that are null for a row are left
+    out of that row's dict.
+    """
+
+    def __init__(self, fields, columns, count):
+        self.fields = fields
+        self.count = count
+        self._plain = {}
+        self._dict = {}
+        for field in fields:
+            col = columns[field]
+            if "dict" in col:
+                values = tuple(_intern(v) for v in col["dict"])
+                codes = _code_array(len(values))
+                codes.extend(col["codes"])
+                self._dict[field] = (values, codes)
+            else:
+                self._plain[field] = [_intern(v) for v in col["values"]]
+        self._row_of = {pid: i for i, pid in enumerate(self._plain["patient_id"])}
+
+    def __len__(self):
+        return self.count
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            doc = json.load(f)
+        if doc.get("format") != FORMAT:
+            raise ValueError(f"{path} is not a {FORMAT} patient snapshot")
+        return cls(doc["fields"], doc["columns"], doc["count"])
+
+    def ids(self):
+        """patient_ids in row order (sorted)."""
+        return self._plain["patient_id"]
+
+    def names(self):
+        """(patient_id, patient_name) for every row."""
+        return zip(self.ids(), self.column("patient_name"))
+
+    def column(self, field):
+        """All values of one field, in row order."""
+        if field in self._plain:
+            return self._plain[field]
+        if field in self._dict:
+            values, codes = self._dict[field]
+            return [values[c] for c in codes]
+        return [None] * self.count
+
+    def row(self, i):
+        """Row `i` as a new dict; list and dict values are copies, so callers may modify it."""
+        out = {}
+        for field in self.fields:
+            if field in self._plain:
+                value = self._plain[field][i]
+            else:
+                values, codes = self._dict[field]
+                value = values[codes[i]]
+            if value is not None:
+                out[field] = _copy(value)
+        return out
+
+    def get(self, pid):
+        """The record for `pid` as a new dict, or None."""
+        i = self._row_of.get(pid)
+        return None if i is None else self.row(i)
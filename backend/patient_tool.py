@@ -1,46 +1,315 @@
-import os, json, logging
+import os, json, logging, threading, time
+from name_index import NameIndex
+from patient_snapshot import PatientTable
 
 logger = logging.getLogger(__name__)
 
 # Path to the directory containing dummy patient JSON files
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "patients")
 
+# Seconds between full mtime scans of DATA_DIR. Files added, renamed or deleted
+# change the directory mtime and are picked up on the next lookup regardless.
+REFRESH_INTERVAL = float(os.getenv("PATIENT_REFRESH_INTERVAL", "10"))
+
+# Default number of ranked candidates returned by a name search
+MAX_NAME_MATCHES = int(os.getenv("MAX_NAME_MATCHES", "5"))
+
+# Patient storage: "json" (one file per patient in DATA_DIR) or "snapshot"
+# (single columnar file, built with scripts/convert_patients.py)
+PATIENT_STORE = os.getenv("PATIENT_STORE", "json")
+SNAPSHOT_PATH = os.getenv(
+    "PATIENT_SNAPSHOT_PATH", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "patients.snapshot.json")
+)
+
+
 # -----------------------------
-# Utility: List all available patients
+# In-memory indexed patient store
 # -----------------------------
-def list_patients():
+class PatientStore:
     """
-    Loads all patient JSON files from the data/patients directory.
-    Returns a list of patient records (as dictionaries).
+    Loads patient JSON files once and keeps them indexed in memory.
+
+    - `_by_id`   : patient_id -> record (hash index)
+    - `_names`   : NameIndex over patient_name (ranked fuzzy / prefix search)
+
+    If several files hold the same patient_id, the first by file name owns
+    it; when the owner goes away the next file's record takes its place.
+
+    Changes on disk are applied incrementally: each scan only stats the
+    directory entries and re-parses files whose (mtime, size) changed, and
+    drops records whose files disappeared. Records are shared between
+    callers and must be treated as read-only.
     """
-    res = []
-    if not os.path.exists(DATA_DIR):
-        return res
 
-    # Iterate through all .json files and load patient data
-    for fn in sorted(os.listdir(DATA_DIR)):
-        if fn.endswith(".json"):
-            with open(os.path.join(DATA_DIR, fn)) as f:
-                res.append(json.load(f))
-    return res
+    def __init__(self, data_dir=DATA_DIR, refresh_interval=REFRESH_INTERVAL):
+        self.data_dir = data_dir
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self._files = {}      # filename -> ((mtime_ns, size), patient_id, record)
+        self._pid_files = {}  # patient_id -> filenames holding it
+        self._by_id = {}
+        self._names = NameIndex()
+        self._dir_mtime = None
+        self._last_scan = None
+
+    def __len__(self):
+        self.refresh()
+        return len(self._by_id)
+
+    # -----------------------------
+    # Refresh / incremental reload
+    # -----------------------------
+    def refresh(self, force=False):
+        """
+        Bring the in-memory indexes up to date with DATA_DIR.
+        Cheap when nothing changed: a single stat of the directory.
+        """
+        try:
+            dir_mtime = os.stat(self.data_dir).st_mtime_ns
+        except FileNotFoundError:
+            dir_mtime = None
+
+        now = time.monotonic()
+        if (
+            not force
+            and self._last_scan is not None
+            and dir_mtime == self._dir_mtime
+            and now - self._last_scan < self.refresh_interval
+        ):
+            return
+
+        with self._lock:
+            # Another thread may have scanned while we waited for the lock
+            if (
+                not force
+                and self._last_scan is not None
+                and dir_mtime == self._dir_mtime
+                and time.monotonic() - self._last_scan < self.refresh_interval
+            ):
+                return
+            self._scan()
+            self._dir_mtime = dir_mtime
+            self._last_scan = time.monotonic()
+
+    def _scan(self):
+        seen = set()
+        added = changed = 0
+
+        if os.path.isdir(self.data_dir):
+            with os.scandir(self.data_dir) as it:
+                for entry in it:
+                    if not entry.name.endswith(".json"):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    seen.add(entry.name)
+                    stamp = (st.st_mtime_ns, st.st_size)
+                    known = self._files.get(entry.name)
+                    if known and known[0] == stamp:
+                        continue
+                    record = self._load_file(entry.path)
+                    if known:
+                        self._unindex(entry.name)
+                        changed += 1
+                    else:
+                        added += 1
+                    if record is not None:
+                        self._index(entry.name, stamp, record)
+
+        removed = [fn for fn in self._files if fn not in seen]
+        for fn in removed:
+            self._unindex(fn)
+
+        if added or changed or removed:
+            logger.info(
+                "PatientStore refreshed: added=%d changed=%d removed=%d total=%d",
+                added, changed, len(removed), len(self._by_id)
+            )
+
+    @staticmethod
+    def _load_file(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Skipping unreadable patient file %s: %s", path, e)
+            return None
+
+    def _index(self, fn, stamp, record):
+        pid = record.get("patient_id")
+        self._files[fn] = (stamp, pid, record)
+        if pid is None:
+            return
+        files = self._pid_files.setdefault(pid, set())
+        files.add(fn)
+        if len(files) > 1:
+            logger.warning("patient_id %s appears in several files: %s", pid, ", ".join(sorted(files)))
+        self._publish(pid)
+
+    def _unindex(self, fn):
+        _, pid, _ = self._files.pop(fn)
+        files = self._pid_files.get(pid)
+        if files is None:
+            return
+        files.discard(fn)
+        if not files:
+            del self._pid_files[pid]
+        self._publish(pid)
+
+    def _publish(self, pid):
+        """Point the indexes at the record of `pid`'s owning file, or drop `pid` if no file holds it."""
+        files = self._pid_files.get(pid)
+        if not files:
+            if self._by_id.pop(pid, None) is not None:
+                self._names.remove(pid)
+            return
+        record = self._files[min(files)][2]
+        if self._by_id.get(pid) is not record:
+            self._by_id[pid] = record
+            self._names.add(pid, record.get("patient_name", ""))
+
+    # -----------------------------
+    # Lookups
+    # -----------------------------
+    def all(self):
+        """Return every patient record, ordered by patient_id."""
+        self.refresh()
+        # refresh() in another thread changes the index under the lock
+        with self._lock:
+            by_id = dict(self._by_id)
+        return [by_id[pid] for pid in sorted(by_id)]
+
+    def get(self, pid):
+        """Return the record for `pid`, or None."""
+        self.refresh()
+        return self._by_id.get(pid)
+
+    def search_name(self, name, limit=MAX_NAME_MATCHES):
+        """
+        Typo-tolerant name search (exact, prefix and trigram matches per token).
+        Returns up to `limit` records ranked best first; `limit=None` returns all.
+        """
+        self.refresh()
+        with self._lock:
+            ranked = self._names.search(name, limit=limit)
+            by_id = self._by_id
+            return [by_id[pid] for _, pid in ranked if pid in by_id]
+
+
+class SnapshotPatientStore:
+    """
+    Same interface as PatientStore, served from a single columnar snapshot
+    file (see backend/patient_snapshot.py). One file read and parse instead
+    of one per patient; repeated strings are held once.
+
+    The snapshot is re-loaded, and swapped in whole, when the file's
+    (mtime, size) changes; checked at most every `refresh_interval` seconds.
+    Records are built per call, so callers may keep or modify them.
+    """
+
+    def __init__(self, path=SNAPSHOT_PATH, refresh_interval=REFRESH_INTERVAL):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self._table = None
+        self._names = NameIndex()
+        self._stamp = None
+        self._last_scan = None
+
+    def __len__(self):
+        self.refresh()
+        return len(self._table) if self._table is not None else 0
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and self._last_scan is not None and now - self._last_scan < self.refresh_interval:
+            return
+        with self._lock:
+            if not force and self._last_scan is not None and time.monotonic() - self._last_scan < self.refresh_interval:
+                return
+            self._last_scan = time.monotonic()
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                if self._table is not None:
+                    logger.warning("Patient snapshot %s disappeared; keeping the loaded copy", self.path)
+                return
+            stamp = (st.st_mtime_ns, st.st_size)
+            if stamp == self._stamp:
+                return
+            try:
+                table = PatientTable.load(self.path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning("Skipping unreadable patient snapshot %s: %s", self.path, e)
+                return
+            names = NameIndex()
+            for pid, name in table.names():
+                names.add(pid, name or "")
+            self._table, self._names, self._stamp = table, names, stamp
+            logger.info("Patient snapshot loaded: %d patients from %s", len(table), self.path)
+
+    def all(self):
+        """Return every patient record, ordered by patient_id."""
+        self.refresh()
+        table = self._table
+        return [table.row(i) for i in range(len(table))] if table is not None else []
+
+    def get(self, pid):
+        """Return the record for `pid`, or None."""
+        self.refresh()
+        table = self._table
+        return table.get(pid) if table is not None else None
+
+    def search_name(self, name, limit=MAX_NAME_MATCHES):
+        """Typo-tolerant name search, ranked best first (see PatientStore.search_name)."""
+        self.refresh()
+        with self._lock:
+            table, ranked = self._table, self._names.search(name, limit=limit)
+        if table is None:
+            return []
+        return [r for r in (table.get(pid) for _, pid in ranked) if r is not None]
+
+
+def make_store(kind=PATIENT_STORE):
+    if kind == "json":
+        return PatientStore()
+    if kind == "snapshot":
+        return SnapshotPatientStore()
+    raise ValueError(f"Unknown PATIENT_STORE {kind!r}; use 'json' or 'snapshot'")
+
+
+# Process-wide store used by the Flask routes
+_store = make_store()
+
+
+def get_store():
+    """Return the shared patient store (PatientStore or SnapshotPatientStore)."""
+    return _store
 
 
 # -----------------------------
-# Search: Find patient(s) by name
+# Utility: List all available patients
 # -----------------------------
-def find_patient_by_name(name):
+def list_patients():
     """
-    Performs a case-insensitive name search in the patient dataset.
-    Returns a list of matching patient records.
+    Returns all patient records from the data/patients directory
+    or the patient snapshot (served from the in-memory store).
     """
-    name = (name or "").strip().lower()
-    matches = []
+    return _store.all()
 
-    for p in list_patients():
-        if name in p.get("patient_name", "").lower():
-            matches.append(p)
 
-    logger.info(f"find_patient_by_name name={name} found={len(matches)}")
+# -----------------------------
+# Search: Find patient(s) by name
+# -----------------------------
+def find_patient_by_name(name, limit=MAX_NAME_MATCHES):
+    """
+    Performs a case-insensitive, typo-tolerant name search in the patient dataset.
+    Returns up to `limit` matching patient records, best match first.
+    """
+    matches = _store.search_name(name, limit=limit)
+    logger.info(f"find_patient_by_name name={(name or '').strip().lower()} found={len(matches)}")
     return matches
 
 
@@ -52,7 +321,4 @@ def find_patient_by_id(pid):
     Searches for a patient using their unique patient ID (e.g., P001).
     Returns the matching patient record, or None if not found.
     """
-    for p in list_patients():
-        if p.get("patient_id") == pid:
-            return p
-    return None
+    return _store.get(pid)
@@ -0,0 +1,127 @@
+import os, logging, threading, time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# RAG confidence below which web search results are used
+WEB_FALLBACK_THRESHOLD = float(os.getenv("WEB_FALLBACK_THRESHOLD", "0.14"))
+# End-to-end budget for one /clinical request (retrieval + web search + LLM)
+CLINICAL_DEADLINE_S = float(os.getenv("CLINICAL_DEADLINE_S", "20"))
+# Start web search alongside retrieval instead of after it (only when the
+# retrieval result is not cached; a cached result's confidence is known at once).
+# Off by default: it saves at most the retrieval time, while abandoned searches
+# hold search slots (see scripts/bench_speculative_search.py)
+SPECULATIVE_WEB_SEARCH = os.getenv("SPECULATIVE_WEB_SEARCH", "0") == "1"
+# Threads available for background web searches
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "8"))
+
+
+# -----------------------------
+# Request deadline
+# -----------------------------
+class Deadline:
+    """A single time budget shared by every stage of a request."""
+
+    def __init__(self, seconds=CLINICAL_DEADLINE_S):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0.0
+
+
+# -----------------------------
+# Shared worker pool (re-created after fork)
+# -----------------------------
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="pipeline")
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def shutdown():
+    """Stop accepting background work; pending speculative searches are dropped."""
+    global _executor
+    if _executor is not None and _executor_pid == os.getpid():
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+# -----------------------------
+# Retrieval with speculative web search
+# -----------------------------
+def _timed_web_search(web_search, timings, question, max_web_results, timeout, cancel):
+    # Runs on a pool thread, so the request's timings dict is passed in
+    if cancel.is_set():
+        return []
+    with metrics.stage("web_search", timings):
+        return web_search(question, max_web_results, timeout=timeout, cancel=cancel)
+
+
+def _abandon(web_future, cancel):
+    """Drop a web search nobody will wait for: cancel it if queued, else tell it to stop waiting."""
+    cancel.set()
+    return web_future.cancel()
+
+
+def retrieve_with_fallback(question, retrieve, confidence, web_search, deadline,
+                           top_k=3, max_web_results=3, speculative=SPECULATIVE_WEB_SEARCH, cached=None):
+    """
+    Run RAG retrieval, then the web-search fallback if confidence is low.
+
+    With `speculative`, the web search is submitted to the worker pool before
+    retrieval starts, unless `cached(question, top_k=top_k)` already holds
+    the retrieval result (its confidence is then known without waiting). If
+    RAG confidence clears WEB_FALLBACK_THRESHOLD, the search is cancelled, or,
+    if already running, told through its cancel event to stop waiting and
+    its result ignored. Otherwise its results are awaited for no longer than
+    the request deadline.
+
+    Returns (contexts, web_results, top_score).
+    """
+    timings = metrics.current_timings()
+    cancel = threading.Event()
+    contexts = cached(question, top_k=top_k) if cached is not None else None
+    web_future = None
+    if speculative and contexts is None:
+        web_future = get_executor().submit(_timed_web_search, web_search, timings, question, max_web_results,
+                                           deadline.remaining(), cancel)
+
+    if contexts is None:
+        contexts = retrieve(question, top_k=top_k)
+    top_score = confidence(contexts)
+
+    if top_score >= WEB_FALLBACK_THRESHOLD:
+        if web_future is not None and not _abandon(web_future, cancel):
+            logger.info("RAG confidence %.4f; abandoning in-flight web search", top_score)
+        return contexts, [], top_score
+
+    logger.info("Low RAG confidence (%.4f). Using web search.", top_score)
+    metrics.WEB_FALLBACKS.inc()
+    if web_future is None:
+        web_future = get_executor().submit(_timed_web_search, web_search, timings, question, max_web_results,
+                                           deadline.remaining(), cancel)
+    try:
+        web_results = web_future.result(timeout=deadline.remaining())
+    except FutureTimeout:
+        logger.warning("Web search missed the request deadline; answering without it")
+        metrics.ERRORS.inc(stage="web_search_deadline")
+        _abandon(web_future, cancel)
+        web_results = []
+    except Exception as e:
+        logger.exception("Web search failed: %s", e)
+        web_results = []
+    return contexts, web_results or [], top_score
@@ -1,6 +1,20 @@
-import os, pickle, numpy as np, logging
-from sentence_transformers import SentenceTransformer
+import os, re, atexit, functools, pickle, threading, time, types, numpy as np, logging
+from concurrent.futures import ThreadPoolExecutor
 import dotenv
+from ref_index import index_exists, load_index, normalize_rows, META_FILE
+from ref_index import current_version, current_version_dir, gc_versions
+from encoders import make_encoder
+from vector_index import open_index, IVF_CENTROIDS_FILE
+from bm25 import open_bm25, reciprocal_rank_fusion
+from chunker import estimate_tokens
+from context_packing import pack_contexts
+from batching import EmbeddingBatcher
+from cache import TTLCache
+from answer_cache import SemanticAnswerCache
+from pipeline import Deadline, WEB_FALLBACK_THRESHOLD
+from llm_client import LLMTimeout
+import llm_client
+import metrics
 
 # Load environment variables from .env file
 dotenv.load_dotenv()
@@ -8,79 +22,586 @@ dotenv.load_dotenv()
 logger = logging.getLogger(__name__)
 
 # Load environment configurations
-OPENAI_KEY = os.getenv("OPENAI_API_KEY", "")
-MODEL_NAME = os.getenv("MODEL_NAME", "gpt-3.5-turbo")
-REF_EMB_PATH = "data/reference_embeddings.pkl"
+REF_INDEX_DIR = os.getenv("REF_INDEX_DIR", "data/reference_index")
+REF_EMB_PATH = "data/reference_embeddings.pkl"  # legacy pickle format
+# Vector search backend: "exact" (brute force), "ivf" (approximate, built at ingest),
+# "int8" / "binary" (quantized codes in memory, shortlist rescored exactly)
+RAG_INDEX_BACKEND = os.getenv("RAG_INDEX_BACKEND", "exact")
+# IVF lists scanned per query: higher = better recall, slower
+RAG_IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", "8"))
+# Candidates rescored with float vectors by the quantized backends (0 = backend default)
+RAG_RESCORE = int(os.getenv("RAG_RESCORE", "0"))
+# Hybrid retrieval: fuse dense hits with BM25 hits (reciprocal rank fusion). Off by default:
+# it costs a BM25 search per query and does not change the web fallback decision
+RAG_HYBRID = os.getenv("RAG_HYBRID", "0") == "1"
+# Candidates taken from each ranker before fusion, and the RRF rank constant
+RAG_HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "50"))
+RAG_RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+# Query micro-batching: concurrent queries are encoded together
+RAG_BATCH_MAX_SIZE = int(os.getenv("RAG_BATCH_MAX_SIZE", "32"))
+RAG_BATCH_MAX_WAIT_MS = float(os.getenv("RAG_BATCH_MAX_WAIT_MS", "5"))
+# Query cache (embeddings + top-k results): entries, TTL seconds
+RAG_CACHE_SIZE = int(os.getenv("RAG_CACHE_SIZE", "1024"))
+RAG_CACHE_TTL = float(os.getenv("RAG_CACHE_TTL", "3600"))
+# Seconds between checks for a re-ingested reference index
+RAG_INDEX_CHECK_INTERVAL = float(os.getenv("RAG_INDEX_CHECK_INTERVAL", "10"))
+# Index versions kept on disk after a reload (the serving one is always kept)
+RAG_INDEX_KEEP_VERSIONS = int(os.getenv("RAG_INDEX_KEEP_VERSIONS", "2"))
+# Semantic LLM answer cache: min cosine similarity to reuse an answer, size, TTL, file
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+ANSWER_CACHE_PATH = os.getenv(
+    "ANSWER_CACHE_PATH", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "answer_cache.json")
+)
+# Token budget for reference context in an LLM prompt (0 = no limit); see backend/context_packing.py
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1000"))
+# Batch clinical queries: overall time budget, threads for web searches / LLM calls
+CLINICAL_BATCH_DEADLINE_S = float(os.getenv("CLINICAL_BATCH_DEADLINE_S", "300"))
+CLINICAL_BATCH_WORKERS = int(os.getenv("CLINICAL_BATCH_WORKERS", "4"))
+EMBED_MODEL = "all-MiniLM-L6-v2"
+# Query encoder: "sentence-transformers" (PyTorch), "onnx" (ONNX Runtime, exported with
+# scripts/export_onnx_encoder.py) or "hash" (deterministic, model-free; for offline tests)
+RAG_ENCODER = os.getenv("RAG_ENCODER", "sentence-transformers")
+# Intra-op threads for the encoder (0 = library default); set per worker under gunicorn.
+# RAG_TORCH_THREADS is the older name of this setting.
+RAG_ENCODER_THREADS = int(os.getenv("RAG_ENCODER_THREADS", os.getenv("RAG_TORCH_THREADS", "0")))
+# Exported ONNX model directory, and whether to run its int8-quantized copy
+RAG_ONNX_DIR = os.getenv("RAG_ONNX_DIR", f"data/models/{EMBED_MODEL}-onnx")
+RAG_ONNX_INT8 = os.getenv("RAG_ONNX_INT8", "1") == "1"
 
 # -----------------------------
-# Load Embedding Model and Reference Data
+# Embedding Model and Reference Data (loaded lazily, see init())
 # -----------------------------
-logger.info("Loading sentence-transformer model...")
-model = SentenceTransformer("all-MiniLM-L6-v2")
+model = None
+_ref = None
 
-# Ensure reference embeddings are available
-if not os.path.exists(REF_EMB_PATH):
-    raise FileNotFoundError(f"{REF_EMB_PATH} not found. Run scripts/ingest_reference.py first.")
 
-logger.info("Loading reference embeddings...")
-data = pickle.load(open(REF_EMB_PATH, "rb"))
-chunks = data["chunks"]  # Text chunks from the reference PDF
-embeddings = np.array(data["embeddings"])  # Corresponding vector embeddings
+def _encode_normalized(texts):
+    return model.encode(texts)
+
+
+# One forward pass per batch of concurrent queries instead of one per request
+query_batcher = EmbeddingBatcher(
+    _encode_normalized,
+    max_batch_size=RAG_BATCH_MAX_SIZE,
+    max_wait_ms=RAG_BATCH_MAX_WAIT_MS,
+)
+
+
+def _index_stamp(root):
+    """
+    Published version plus mtimes of the files ingest writes last; changes
+    whenever ingest publishes a new version (or rewrites an unversioned index).
+    """
+    index_dir = current_version_dir(root)
+    stamp = [index_dir]
+    for fn in (META_FILE, IVF_CENTROIDS_FILE):
+        try:
+            stamp.append(os.stat(os.path.join(index_dir, fn)).st_mtime_ns)
+        except FileNotFoundError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+def _load_reference():
+    """
+    Open the published reference index version. Returns a namespace with
+    chunks, embeddings, vector_index, bm25 (None unless RAG_HYBRID),
+    index_dir, version, stamp and model (embedding model recorded at ingest).
+    """
+    logger.info("Loading reference embeddings...")
+    stamp = _index_stamp(REF_INDEX_DIR)
+    index_dir = stamp[0]
+    if index_exists(index_dir):
+        # Memory-mapped, pre-normalized float32 index (shared via the page cache)
+        chunks, embeddings, meta = load_index(index_dir)
+        vector_index = open_index(index_dir, embeddings, RAG_INDEX_BACKEND, nprobe=RAG_IVF_NPROBE,
+                                  rescore=RAG_RESCORE or None)
+        version = os.path.basename(index_dir) if index_dir != REF_INDEX_DIR else f"{meta.get('created')}:{stamp[1:]}"
+        embed_model = meta.get("model")
+    elif os.path.exists(REF_EMB_PATH):
+        logger.warning("%s not found; falling back to legacy %s. Re-run scripts/ingest_reference.py.",
+                       REF_INDEX_DIR, REF_EMB_PATH)
+        with open(REF_EMB_PATH, "rb") as f:
+            data = pickle.load(f)
+        chunks = data["chunks"]
+        embeddings = normalize_rows(data["embeddings"])
+        vector_index = open_index(None, embeddings, "exact")
+        index_dir = stamp = embed_model = None
+        version = f"pickle:{os.stat(REF_EMB_PATH).st_mtime_ns}"
+    else:
+        raise FileNotFoundError(f"{REF_INDEX_DIR} not found. Run scripts/ingest_reference.py first.")
+    bm25 = open_bm25(index_dir, chunks) if RAG_HYBRID else None
+    logger.info("Reference index %s: %d chunks, dim=%d, backend=%s%s", version,
+                embeddings.shape[0], embeddings.shape[1], vector_index.name, " + bm25" if bm25 else "")
+    return types.SimpleNamespace(
+        chunks=chunks, embeddings=embeddings, vector_index=vector_index, bm25=bm25,
+        index_dir=index_dir, version=version, stamp=stamp, model=embed_model, checked=time.monotonic(),
+    )
+
+
+def _validate_reference(ref):
+    """Raise ValueError unless `ref` is usable with the loaded model."""
+    n, dim = ref.embeddings.shape
+    if len(ref.chunks) != n:
+        raise ValueError(f"index has {len(ref.chunks)} chunks but {n} embeddings")
+    if model is not None and dim != model.dim:
+        raise ValueError(f"index dim {dim} does not match the embedding model")
+    if model is not None and ref.model and ref.model != model.model_id:
+        raise ValueError(f"index was built with {ref.model!r}, queries are encoded with {model.model_id!r}")
+    if ref.bm25 is not None and len(ref.bm25) != n:
+        raise ValueError(f"BM25 index covers {len(ref.bm25)} of {n} chunks")
+    sample = np.asarray(ref.embeddings[np.linspace(0, n - 1, min(n, 64)).astype(np.int64)]) if n else None
+    if sample is not None and not np.all(np.isfinite(sample)):
+        raise ValueError("index contains non-finite embeddings")
+
+
+def _warm_reference(ref, queries=8):
+    """
+    Fault the index into memory before it takes traffic, so the first
+    requests after a swap don't pay for page faults: the exact backend reads
+    every vector, the others run a few searches.
+    """
+    n = ref.embeddings.shape[0]
+    if not n:
+        return
+    if ref.vector_index.name == "exact":
+        for start in range(0, n, 65536):
+            float(np.asarray(ref.embeddings[start:start + 65536]).sum())
+    rows = np.asarray(ref.embeddings[np.linspace(0, n - 1, min(n, queries)).astype(np.int64)], dtype=np.float32)
+    for (top_idx, _), row in zip(ref.vector_index.search_batch(rows, 3), rows):
+        for i in top_idx:
+            ref.chunks[int(i)]
+    if ref.bm25 is not None:
+        ref.bm25.search(ref.chunks[0][:200], 3)
+
+
+_ref_lock = threading.Lock()
+
+# Bounded LRU+TTL caches keyed on the normalized question text.
+# Result keys include the index version; results are cleared on reload.
+embedding_cache = TTLCache(RAG_CACHE_SIZE, RAG_CACHE_TTL)
+result_cache = TTLCache(RAG_CACHE_SIZE, RAG_CACHE_TTL)
+
+
+def _current_reference():
+    """
+    Return the loaded reference index. If scripts/ingest_reference.py has
+    published a new version, a background reload is started; this request
+    (and every other until the swap) keeps using the current one.
+    """
+    ensure_ready()
+    ref = _ref
+    if ref.stamp is None or time.monotonic() - ref.checked < RAG_INDEX_CHECK_INTERVAL:
+        return ref
+    ref.checked = time.monotonic()
+    if _index_stamp(REF_INDEX_DIR) != ref.stamp:
+        start_reload()
+    return ref
+
 
 # -----------------------------
-# Optional OpenAI Setup
+# Hot reload
 # -----------------------------
-if OPENAI_KEY:
-    import openai
-    openai.api_key = OPENAI_KEY
-    logger.info(f"OpenAI enabled, model={MODEL_NAME}")
+_reload_lock = threading.Lock()         # one reload at a time
+_reload_thread_lock = threading.Lock()  # guards starting the background thread
+_reload_thread = None
+_reload_status = {"state": "idle"}
+
+
+def reload_index(force=False):
+    """
+    Load the published index version, validate and warm it, then swap it in.
+    Requests already running keep the version they started with; old
+    version directories are garbage-collected afterwards.
+    On failure the current index stays in service and the error is raised.
+    Returns {"reloaded", "version", ...}.
+    """
+    global _ref
+    ensure_ready()
+    with _reload_lock:
+        old = _ref
+        if not force and old.stamp is not None and _index_stamp(REF_INDEX_DIR) == old.stamp:
+            return {"reloaded": False, "version": old.version}
+        start = time.perf_counter()
+        _reload_status.update(state="loading", started=time.time(), error=None)
+        try:
+            new = _load_reference()
+            _validate_reference(new)
+            _warm_reference(new)
+        except Exception as e:
+            _reload_status.update(state="failed", error=f"{type(e).__name__}: {e}")
+            logger.exception("Reference index reload failed; keeping version %s: %s", old.version, e)
+            raise
+        with _ref_lock:
+            _ref = new
+        # Answers were generated from the old version's chunks; drop them with the cached results
+        result_cache.clear()
+        answer_cache.clear()
+        removed = gc_versions(REF_INDEX_DIR, keep=RAG_INDEX_KEEP_VERSIONS, in_use=[new.version]) \
+            if new.stamp is not None else []
+        elapsed = round(time.perf_counter() - start, 3)
+        _reload_status.update(state="idle", last_version=new.version, last_reload_s=elapsed, finished=time.time())
+        logger.info("Reference index swapped %s -> %s in %.3fs (removed versions: %s)",
+                    old.version, new.version, elapsed, removed or "none")
+        return {"reloaded": True, "version": new.version, "previous": old.version, "seconds": elapsed,
+                "removed_versions": removed}
+
+
+def _reload_in_background():
+    try:
+        reload_index()
+    except Exception:
+        pass  # logged by reload_index(); reported through reload_status()
+
+
+def start_reload():
+    """Start reload_index() in a daemon thread unless one is already running. Returns True if started."""
+    global _reload_thread
+    with _reload_thread_lock:
+        if _reload_thread is not None and _reload_thread.is_alive():
+            return False
+        _reload_thread = threading.Thread(target=_reload_in_background, name="rag-reload", daemon=True)
+        _reload_thread.start()
+        return True
+
+
+def reload_status():
+    """Serving version and state of the last / running reload, for the admin endpoint."""
+    out = dict(_reload_status)
+    if _reload_thread is not None and _reload_thread.is_alive():
+        out["state"] = "loading"
+    out["version"] = _ref.version if _ref is not None else None
+    out["published"] = current_version(REF_INDEX_DIR)
+    return out
+
+
+# LLM answers reused across patients with the same clinical context (see answer_with_llm)
+answer_cache = SemanticAnswerCache(
+    threshold=ANSWER_CACHE_THRESHOLD, maxsize=ANSWER_CACHE_SIZE,
+    ttl=ANSWER_CACHE_TTL, path=ANSWER_CACHE_PATH,
+)
+atexit.register(answer_cache.persist)
+
+
+# -----------------------------
+# Initialisation and Readiness
+# -----------------------------
+# Importing this module is cheap: the sentence-transformer model and the
+# reference index are loaded by init(), either in a background thread at
+# server start (start_background_init) or on first use (ensure_ready).
+_ready = threading.Event()
+_init_lock = threading.Lock()         # held for the whole load
+_init_thread_lock = threading.Lock()  # guards starting the background thread
+_init_thread = None
+_init_error = None
+_init_timings = {}
+
+
+def init():
+    """Load the embedding model and reference index. Idempotent and thread-safe; raises on failure."""
+    global model, _ref, _init_error
+    if _ready.is_set():
+        return
+    with _init_lock:
+        if _ready.is_set():
+            return
+        try:
+            start = time.perf_counter()
+            logger.info("Loading %s encoder...", RAG_ENCODER)
+            model = make_encoder(RAG_ENCODER, EMBED_MODEL, threads=RAG_ENCODER_THREADS, onnx_dir=RAG_ONNX_DIR,
+                                 quantized=RAG_ONNX_INT8)
+            _init_timings["model_load_s"] = round(time.perf_counter() - start, 3)
+
+            start = time.perf_counter()
+            _ref = _load_reference()
+            _validate_reference(_ref)
+            _init_timings["index_load_s"] = round(time.perf_counter() - start, 3)
+        except Exception as e:
+            _init_error = f"{type(e).__name__}: {e}"
+            logger.exception("RAG initialisation failed: %s", e)
+            raise
+        _init_error = None
+        _ready.set()
+        logger.info("RAG ready (%s)", _init_timings)
+
+
+def _reset_init_after_fork():
+    # A loader thread running at fork time does not exist in the child, and the
+    # locks it held would stay locked forever; start over with fresh ones
+    global _init_lock, _init_thread_lock, _init_thread, _reload_lock, _reload_thread_lock, _reload_thread
+    _init_lock = threading.Lock()
+    _init_thread_lock = threading.Lock()
+    _init_thread = None
+    _reload_lock = threading.Lock()
+    _reload_thread_lock = threading.Lock()
+    _reload_thread = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_init_after_fork)
+
+
+def _init_in_background():
+    try:
+        init()
+    except Exception:
+        pass  # logged by init(); reported through readiness()
+
+
+def start_background_init():
+    """Start init() in a daemon thread unless loading is done or under way (retries after a failure)."""
+    global _init_thread
+    with _init_thread_lock:
+        if _ready.is_set() or (_init_thread is not None and _init_thread.is_alive()):
+            return
+        _init_thread = threading.Thread(target=_init_in_background, name="rag-init", daemon=True)
+        _init_thread.start()
+
+
+def ensure_ready():
+    """Block until the model and index are loaded, loading them in this thread if needed."""
+    if not _ready.is_set():
+        init()
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def set_encoder_threads(n):
+    """Cap the encoder's intra-op threads (one worker per core needs n=1)."""
+    if model is not None:
+        model.set_threads(max(1, int(n)))
+
+
+def shutdown():
+    """Flush state that should survive a restart; called on graceful worker exit."""
+    answer_cache.persist()
+
+
+def readiness():
+    """State of background initialisation, for the /ready endpoint."""
+    if _ready.is_set():
+        state = "ready"
+    elif _init_thread is not None and _init_thread.is_alive():
+        state = "loading"
+    elif _init_error:
+        state = "failed"
+    else:
+        state = "not_started"
+    out = {"ready": _ready.is_set(), "state": state, **_init_timings}
+    if _init_error and not _ready.is_set():
+        out["error"] = _init_error
+    if model is not None:
+        out["encoder"] = model.describe()
+    if _ref is not None:
+        out["chunks"] = int(_ref.embeddings.shape[0])
+    return out
+
+
+def cache_stats():
+    """Hit/miss counters of the query and answer caches, for monitoring."""
+    return {
+        "embedding_cache": embedding_cache.stats(),
+        "result_cache": result_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "index_version": _ref.version if _ref is not None else None,
+    }
+
+# -----------------------------
+# Optional OpenAI Setup (see backend/llm_client.py)
+# -----------------------------
+if llm_client.client is not None:
+    logger.info("OpenAI enabled, model=%s, endpoint=%s", llm_client.client.model, llm_client.client.url)
 else:
-    openai = None
     logger.info("OpenAI key not set — using fallback mode (no API calls).")
 
 # -----------------------------
 # RAG Retrieval Functions
 # -----------------------------
-def retrieve(query, top_k=3):
+def normalize_question(text):
+    """Cache key for a question: lowercased, whitespace-collapsed, trailing punctuation removed."""
+    return " ".join((text or "").lower().split()).rstrip("?!. ")
+
+
+def embed_query(query):
+    """Return the L2-normalized float32 embedding of `query` (cached, micro-batched)."""
+    key = normalize_question(query)
+    q_emb = embedding_cache.get(key)
+    if q_emb is None:
+        ensure_ready()
+        with metrics.stage("query_encoding"):
+            q_emb = query_batcher.encode([query])[0]
+        embedding_cache.put(key, q_emb)
+    return q_emb
+
+
+def embed_queries(queries):
+    """
+    Embeddings for many queries as an (n x dim) matrix. Cached queries are
+    reused; the rest are encoded together in a single model call.
+    """
+    keys = [normalize_question(q) for q in queries]
+    found = {k: embedding_cache.get(k) for k in set(keys)}
+    missing = {}
+    for q, k in zip(queries, keys):
+        if found[k] is None:
+            missing.setdefault(k, q)
+    if missing:
+        ensure_ready()
+        with metrics.stage("query_encoding"):
+            embs = _encode_normalized(list(missing.values()))
+        for k, emb in zip(missing, embs):
+            found[k] = emb
+            embedding_cache.put(k, emb)
+    return np.stack([found[k] for k in keys]) if keys else np.empty((0, 0), dtype=np.float32)
+
+
+def _results(ref, top_idx, scores):
+    """Context dicts for search hits (chunk text, score and page metadata if any)."""
+    source = getattr(ref.chunks, "source", lambda i: None)
+    return [
+        {"id": int(i), "document": ref.chunks[int(i)], "score": float(s), **(source(i) or {})}
+        for i, s in zip(top_idx, scores)
+    ]
+
+
+def _hybrid(ref, query, q_emb, dense_ids, top_k, min_score):
+    """
+    Fuse dense candidates with BM25 candidates by reciprocal rank fusion.
+    Returns (ids, cosine scores) of the top_k fused hits.
+    """
+    lexical_ids, _ = ref.bm25.search(query, RAG_HYBRID_CANDIDATES)
+    ids = np.array(reciprocal_rank_fusion([dense_ids, lexical_ids], k=RAG_RRF_K), dtype=np.int64)
+    # "score" stays the cosine similarity, so thresholds mean the same with or without BM25
+    scores = np.asarray(ref.embeddings[ids], dtype=np.float32) @ q_emb if len(ids) else np.empty(0, np.float32)
+    if min_score is not None:
+        keep = scores >= min_score
+        ids, scores = ids[keep], scores[keep]
+    # Chunks found by both rankers outrank the dense top hit; keep it in the last slot,
+    # so RAG confidence (the best cosine returned) is never lower than with dense-only retrieval
+    if len(dense_ids) and top_k > 0:
+        pos = np.flatnonzero(ids == dense_ids[0])
+        if len(pos) and pos[0] >= top_k:
+            order = np.r_[np.arange(top_k - 1), pos[0]]
+            ids, scores = ids[order], scores[order]
+    return ids[:top_k], scores[:top_k]
+
+
+def _candidates(ref, top_k):
+    return max(top_k, RAG_HYBRID_CANDIDATES) if ref.bm25 is not None else top_k
+
+
+def _search_results(ref, query, q_emb, hits, top_k, min_score):
+    """Context dicts for one query's dense hits, fused with BM25 when enabled."""
+    top_idx, scores = hits
+    if ref.bm25 is not None:
+        top_idx, scores = _hybrid(ref, query, q_emb, top_idx, top_k, min_score)
+    return _results(ref, top_idx, scores)
+
+
+def retrieve(query, top_k=3, min_score=None):
     """
     Perform semantic retrieval using cosine similarity
     between query embedding and stored reference embeddings.
-    Returns top_k most relevant chunks.
+    Returns up to top_k most relevant chunks, best first
+    (optionally only those scoring at least min_score). Chunks from an index
+    with page metadata also carry "doc", "page_start" and "page_end".
+
+    With RAG_HYBRID, dense and BM25 rankings are fused, so chunks that
+    contain exact drug names or lab terms rank even when their cosine score
+    is low. The best dense hit is always among the results.
     """
-    q_emb = model.encode([query])[0]
-    sims = np.dot(embeddings, q_emb) / (np.linalg.norm(embeddings, axis=1) * np.linalg.norm(q_emb))
-    sims = np.nan_to_num(sims)  # Handle potential NaN values
-    top_idx = np.argsort(sims)[::-1][:top_k]
-    results = [{"id": int(i), "document": chunks[int(i)], "score": float(sims[int(i)])} for i in top_idx]
-    return results
+    ref = _current_reference()
+    key = (ref.version, normalize_question(query), top_k, min_score)
+    cached = result_cache.get(key)
+    if cached is not None:
+        return [dict(r) for r in cached]
+
+    q_emb = embed_query(query)
+    # Rows are unit-norm, so cosine similarity is an inner product
+    with metrics.stage("similarity_search"):
+        hits = ref.vector_index.search(q_emb, _candidates(ref, top_k), min_score if ref.bm25 is None else None)
+        results = _search_results(ref, query, q_emb, hits, top_k, min_score)
+    result_cache.put(key, results)
+    return [dict(r) for r in results]
+
+
+def cached_retrieve(query, top_k=3, min_score=None):
+    """retrieve()'s result if it is in the result cache (no encoding or search), else None."""
+    ref = _current_reference()
+    cached = result_cache.get((ref.version, normalize_question(query), top_k, min_score))
+    return [dict(r) for r in cached] if cached is not None else None
+
+
+def retrieve_batch(queries, top_k=3, min_score=None):
+    """
+    retrieve() for many queries at once; returns one result list per query.
+    Duplicate questions are retrieved once, uncached ones are embedded in a
+    single batch and scored with one matrix-matrix product.
+    """
+    ref = _current_reference()
+    keys = [(ref.version, normalize_question(q), top_k, min_score) for q in queries]
+    results = {k: result_cache.get(k) for k in set(keys)}
+    todo = {}
+    for q, k in zip(queries, keys):
+        if results[k] is None:
+            todo.setdefault(k, q)
+    if todo:
+        q_embs = embed_queries(list(todo.values()))
+        with metrics.stage("similarity_search"):
+            hits = ref.vector_index.search_batch(q_embs, _candidates(ref, top_k), min_score if ref.bm25 is None else None)
+            for (k, q), q_emb, h in zip(todo.items(), q_embs, hits):
+                results[k] = _search_results(ref, q, q_emb, h, top_k, min_score)
+                result_cache.put(k, results[k])
+    return [[dict(r) for r in results[k]] for k in keys]
 
 
 def rag_confidence(contexts, min_score=0.15):
     """
     Heuristic function to estimate RAG confidence.
     If the top similarity score is below 'min_score', trigger a web search fallback.
+    The score is the best cosine similarity among the returned chunks. The
+    dense top hit is always returned, so this is the same with and without
+    hybrid retrieval: BM25 changes which chunks reach the prompt, not whether
+    the web fallback fires.
     """
     if not contexts:
         return 0.0
-    top_score = contexts[0].get("score", 0.0)
-    return float(top_score)
+    return float(max(c.get("score", 0.0) for c in contexts))
+
+
+def page_label(c):
+    """Human-readable citation for a chunk, e.g. "nephrology.pdf p. 12-13" ("" if unknown)."""
+    if not c.get("page_start"):
+        return ""
+    pages = f"p. {c['page_start']}" if c["page_start"] == c["page_end"] else f"p. {c['page_start']}-{c['page_end']}"
+    return f"{c['doc']} {pages}" if c.get("doc") else pages
 
 
 # -----------------------------
 # Prompt Construction for LLM
 # -----------------------------
-def compose_prompt(patient_summary, question, contexts, web_results=None):
+def compose_prompt(patient_summary, question, contexts, web_results=None, stats=None):
     """
     Build a context-rich prompt for LLM input.
     Includes:
-    - Top reference snippets (from RAG)
+    - Top reference snippets (from RAG), packed into RAG_CONTEXT_TOKENS
     - Optional web search results
     - Patient summary and clinical question
+    If `stats` is a dict, the context packing counts are stored in it.
     """
+    blocks, packing = pack_contexts(contexts, RAG_CONTEXT_TOKENS)
+    if stats is not None:
+        stats.update(packing)
     ctx_text = ""
-    for i, c in enumerate(contexts, start=1):
-        snippet = c.get("document", "")[:1200]
-        ctx_text += f"[Source {i} | chunk:{c.get('id')} | score:{c.get('score'):.4f}]\n{snippet}\n\n"
+    for b in blocks:
+        sources = ", ".join(str(i) for i in b["sources"])
+        ids = ",".join(str(i) for i in b["ids"])
+        where = f" | {page_label(b)}" if page_label(b) else ""
+        ctx_text += f"[Source {sources} | chunk:{ids}{where} | score:{b['score']:.4f}]\n{b['document']}\n\n"
 
     web_block = ""
     if web_results:
@@ -113,41 +634,169 @@ End with: "Disclaimer: This is NOT medical advice. Consult a clinician."
 # -----------------------------
 # LLM Answer Generation / Fallback
 # -----------------------------
-def answer_with_llm(patient_summary, question, contexts, web_results=None):
+def openai_chat(messages, timeout=None):
+    """Default LLM: one Chat Completions call through the pooled client, returns the answer text."""
+    return llm_client.client.chat(messages, timeout=timeout)
+
+
+def openai_chat_stream(messages, timeout=None):
+    """Default streaming LLM: yields answer text fragments as the provider produces them."""
+    return llm_client.client.chat_stream(messages, timeout=timeout)
+
+
+def _answer_fingerprint(patient, contexts, web_results):
+    return answer_cache.fingerprint(
+        patient.get("primary_diagnosis"),
+        patient.get("discharge_instructions"),
+        [c.get("document") for c in contexts],
+        [w.get("url") for w in web_results or []],
+    )
+
+
+def _mentions_patient(answer, patient):
+    """True if the answer names the patient, so it must not be served to others."""
+    tokens = [re.escape(tok) for tok in re.findall(r"\w+", patient.get("patient_name") or "") if len(tok) > 2]
+    return bool(tokens) and re.search(rf"\b(?:{'|'.join(tokens)})\b", answer, re.IGNORECASE) is not None
+
+
+def _cached_answer(question, contexts, web_results, patient):
+    """Semantic answer cache lookup. Returns (fingerprint, q_emb, cached answer or None)."""
+    if patient is None or not answer_cache.enabled:
+        return None, None, None
+    fp = _answer_fingerprint(patient, contexts, web_results)
+    q_emb = embed_query(question)
+    return fp, q_emb, answer_cache.lookup(fp, q_emb)
+
+
+def _store_answer(fp, q_emb, question, answer, patient):
+    """Cache an LLM answer; a cache failure is logged and never costs the caller the answer."""
+    if fp is None or not answer or _mentions_patient(answer, patient):
+        return
+    try:
+        answer_cache.store(fp, q_emb, question, answer)
+    except Exception as e:
+        logger.warning("Could not cache LLM answer: %s", e)
+
+
+def _llm_messages(patient_summary, question, contexts, web_results):
+    packing = {}
+    prompt = compose_prompt(patient_summary, question, contexts, web_results, stats=packing)
+    prompt_stats = {"chars": len(prompt), "tokens": estimate_tokens(prompt), **packing,
+                    "web": len(web_results) if web_results else 0}
+    logger.info(
+        "LLM prompt length: %d chars, ~%d tokens; contexts=%d -> blocks=%d, context tokens %d -> %d "
+        "(dropped=%d); web=%d",
+        prompt_stats["chars"], prompt_stats["tokens"], packing["chunks"], packing["blocks"], packing["tokens_in"],
+        packing["tokens_out"], packing["dropped"], prompt_stats["web"], extra={"prompt_stats": prompt_stats}
+    )
+    return [
+        {"role": "system", "content": "You are a concise clinical assistant. Use only the provided sources."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def answer_with_llm(patient_summary, question, contexts, web_results=None, patient=None, llm=None, stream=False,
+                    timeout=None):
     """
     Generate the final answer.
-    - If OpenAI key available → uses GPT for response synthesis.
+    - If an LLM is available (OpenAI key, or an `llm(messages)` callable
+      such as a test stub) → uses it for response synthesis.
     - Otherwise → falls back to structured reference excerpts.
+
+    When `patient` is given, LLM answers are looked up in / stored to the
+    semantic answer cache, keyed by the patient's diagnosis and discharge
+    instructions plus the retrieved sources.
+
+    With stream=True a generator of text fragments is returned instead of a
+    string; `llm` must then return an iterator of fragments.
+
+    `timeout` is the remaining request budget in seconds; when it is already
+    spent the LLM is skipped and the excerpt fallback is returned. The
+    default client also caps every call at LLM_TIMEOUT and returns the
+    fallback as soon as its deadline passes, even while queued for a slot.
     """
-    prompt = compose_prompt(patient_summary, question, contexts, web_results)
-    logger.info(
-        "LLM prompt length: %d chars; contexts=%d; web=%d",
-        len(prompt), len(contexts), len(web_results) if web_results else 0
-    )
+    if timeout is not None and timeout <= 0:
+        logger.warning("Request deadline exhausted before LLM call; using fallback answer")
+        metrics.LLM_FALLBACKS.inc(reason="deadline")
+        if stream:
+            return iter([fallback_answer(contexts, web_results)])
+        return fallback_answer(contexts, web_results)
 
-    # --- Case 1: OpenAI API available ---
-    if openai:
+    if stream:
+        if llm is None and llm_client.client is not None:
+            llm = functools.partial(openai_chat_stream, timeout=timeout)
+        return _stream_answer(patient_summary, question, contexts, web_results, patient, llm,
+                              metrics.current_timings())
+
+    if llm is None and llm_client.client is not None:
+        llm = functools.partial(openai_chat, timeout=timeout)
+
+    # --- Case 1: LLM available ---
+    if llm:
+        fp, q_emb, cached = _cached_answer(question, contexts, web_results, patient)
+        if cached is not None:
+            logger.info("Answer cache hit; skipping LLM call")
+            return cached
         try:
-            messages = [
-                {"role": "system", "content": "You are a concise clinical assistant. Use only the provided sources."},
-                {"role": "user", "content": prompt}
-            ]
-            resp = openai.ChatCompletion.create(
-                model=MODEL_NAME,
-                messages=messages,
-                max_tokens=500,
-                temperature=0.0,
-            )
-            return resp["choices"][0]["message"]["content"].strip()
+            with metrics.stage("llm_generation"):
+                answer = llm(_llm_messages(patient_summary, question, contexts, web_results))
+        except LLMTimeout as e:
+            logger.warning("LLM call missed its deadline (%s); using fallback answer", e)
+            metrics.LLM_FALLBACKS.inc(reason="deadline")
         except Exception as e:
-            logger.exception("OpenAI call failed: %s", e)
+            logger.exception("LLM call failed: %s", e)
+            metrics.LLM_FALLBACKS.inc(reason="error")
+        else:
+            _store_answer(fp, q_emb, question, answer, patient)
+            return answer
 
     # --- Case 2: Fallback mode (no API key) ---
+    return fallback_answer(contexts, web_results)
+
+
+def _stream_answer(patient_summary, question, contexts, web_results, patient, llm, timings=None):
+    """
+    Generator behind answer_with_llm(stream=True). `timings` is the caller's
+    stage timings dict: the generator body runs after the request has returned.
+    """
+    if llm:
+        fp, q_emb, cached = _cached_answer(question, contexts, web_results, patient)
+        if cached is not None:
+            logger.info("Answer cache hit; skipping LLM call")
+            yield cached
+            return
+        parts = []
+        try:
+            with metrics.stage("llm_generation", timings):
+                for token in llm(_llm_messages(patient_summary, question, contexts, web_results)):
+                    parts.append(token)
+                    yield token
+        except Exception as e:
+            if isinstance(e, LLMTimeout):
+                logger.warning("LLM stream missed its deadline (%s)", e)
+            else:
+                logger.exception("LLM stream failed: %s", e)
+            metrics.LLM_FALLBACKS.inc(reason="deadline" if isinstance(e, LLMTimeout) else "error")
+            if parts:
+                yield "\n\n[Answer interrupted. Please ask again.]"
+                return
+        else:
+            _store_answer(fp, q_emb, question, "".join(parts).strip(), patient)
+            return
+
+    # Fallback text, streamed line by line so clients handle both paths alike
+    for line in fallback_answer(contexts, web_results).splitlines(keepends=True):
+        yield line
+
+
+def fallback_answer(contexts, web_results=None):
+    """Structured reference excerpts used when no LLM is available or it fails."""
     out = ""
     if contexts:
         out += "Top reference excerpts:\n\n"
         for i, c in enumerate(contexts, start=1):
-            out += f"[Source {i}] (score={c.get('score'):.4f}) {c.get('document')[:400]}...\n\n"
+            where = f"{page_label(c)}, " if page_label(c) else ""
+            out += f"[Source {i}] ({where}score={c.get('score'):.4f}) {c.get('document')[:400]}...\n\n"
 
     if web_results:
         out += "Web search results:\n\n"
@@ -159,3 +808,85 @@ def answer_with_llm(patient_summary, question, contexts, web_results=None):
 
     out += "Disclaimer: This is NOT medical advice. Consult a clinician."
     return out
+
+
+# -----------------------------
+# Batch Clinical Queries
+# -----------------------------
+def patient_summary(patient):
+    """Patient context passed to the LLM with every clinical question."""
+    return (
+        f"Name: {patient['patient_name']}. "
+        f"Primary diagnosis: {patient.get('primary_diagnosis')}. "
+        f"Discharge instructions: {patient.get('discharge_instructions')}"
+    )
+
+
+def _gather(future, deadline, default):
+    try:
+        return future.result(timeout=deadline.remaining())
+    except Exception as e:
+        future.cancel()
+        logger.warning("Batch item missed the deadline or failed (%s); using fallback", type(e).__name__)
+        return default()
+
+
+def clinical_batch(items, get_patient, web_search=None, top_k=3, max_web_results=3, answer=True, deadline=None):
+    """
+    Answer many (patient_id, question) pairs in one pass.
+
+    Patients are looked up once each. Questions are deduplicated, embedded
+    in one batch and scored with one matrix-matrix product (retrieve_batch).
+    Each distinct low-confidence question gets one web search. LLM answers
+    run on CLINICAL_BATCH_WORKERS threads, which are separate from the
+    interactive request pool. Items still unanswered at the deadline get
+    the excerpt fallback.
+
+    Returns one dict per item, in input order:
+        {"patient_id", "question", "contexts", "web_results", "answer"}
+        or {"patient_id", "question", "error"}
+    """
+    deadline = deadline or Deadline(CLINICAL_BATCH_DEADLINE_S)
+    patients = {}
+    for pid, _ in items:
+        if pid and pid not in patients:
+            patients[pid] = get_patient(pid)
+
+    results = [None] * len(items)
+    known = []
+    for i, (pid, question) in enumerate(items):
+        if patients.get(pid):
+            known.append((i, pid, question))
+        else:
+            results[i] = {"patient_id": pid, "question": question,
+                          "error": "patient not found" if pid else "patient_id required"}
+    contexts = retrieve_batch([q for _, _, q in known], top_k=top_k)
+
+    pool = ThreadPoolExecutor(CLINICAL_BATCH_WORKERS, thread_name_prefix="clinical-batch")
+    try:
+        web = {}
+        if web_search is not None:
+            for (_, _, question), ctx in zip(known, contexts):
+                key = normalize_question(question)
+                if key not in web and rag_confidence(ctx) < WEB_FALLBACK_THRESHOLD:
+                    metrics.WEB_FALLBACKS.inc()
+                    web[key] = pool.submit(lambda q=question: web_search(q, max_web_results, timeout=deadline.remaining()))
+            web = {key: _gather(f, deadline, list) or [] for key, f in web.items()}
+
+        pending = []
+        for (i, pid, question), ctx in zip(known, contexts):
+            web_results = web.get(normalize_question(question), [])
+            results[i] = {"patient_id": pid, "question": question, "contexts": ctx, "web_results": web_results}
+            if answer:
+                kwargs = {
+                    "patient_summary": patient_summary(patients[pid]), "question": question,
+                    "contexts": ctx, "web_results": web_results, "patient": patients[pid],
+                }
+                future = pool.submit(lambda kw=kwargs: answer_with_llm(**kw, timeout=deadline.remaining()))
+                pending.append((i, future, kwargs))
+        for i, future, kw in pending:
+            results[i]["answer"] = _gather(future, deadline, lambda kw=kw: fallback_answer(kw["contexts"], kw["web_results"]))
+    finally:
+        # Never wait past the deadline for stragglers; their results are already replaced
+        pool.shutdown(wait=False, cancel_futures=True)
+    return results
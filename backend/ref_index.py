@@ -0,0 +1,286 @@
+"""
+backend/ref_index.py
+--------------------
+On-disk layout of the reference (RAG) index and helpers to read / write it.
+
+An index directory contains:
+    - embeddings.npy     float32 matrix (n_chunks x dim), rows L2-normalized
+    - chunks.bin         UTF-8 chunk texts, concatenated
+    - chunk_offsets.npy  int64 byte offsets into chunks.bin (n_chunks + 1)
+    - chunk_docs.npy     int32 index into meta["docs"] per chunk     (optional)
+    - chunk_pages.npy    int32 (n_chunks x 2) first/last source page  (optional)
+    - meta.json          {"count", "dim", "model", "created", "docs"}
+
+Everything is opened with memory mapping, so loading is O(1) and worker
+processes on the same host share one copy of the index via the page cache.
+
+Ingest writes each run to a new version directory and then publishes it:
+    <root>/versions/<version>/   one complete index (layout above)
+    <root>/CURRENT               name of the published version (replaced atomically)
+A root without CURRENT is read as a single unversioned index (older layout).
+"""
+
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+EMBEDDINGS_FILE = "embeddings.npy"
+CHUNKS_FILE = "chunks.bin"
+OFFSETS_FILE = "chunk_offsets.npy"
+META_FILE = "meta.json"
+CHUNK_DOCS_FILE = "chunk_docs.npy"
+CHUNK_PAGES_FILE = "chunk_pages.npy"
+VERSIONS_DIR = "versions"
+CURRENT_FILE = "CURRENT"
+
+
+def normalize_rows(matrix):
+    """Return a float32 copy of `matrix` with every row scaled to unit L2 norm."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class IndexWriter:
+    """
+    Streams chunks + embeddings into `index_dir` without holding them in memory.
+
+        writer = IndexWriter(index_dir, count, dim)
+        writer.add(chunk_texts, vectors)   # any number of times, `count` rows in total
+        writer.add(chunk_texts, vectors, sources=[(doc, page_start, page_end), ...])
+        writer.close(model_name)
+
+    Files are written under temporary names and renamed on close(), with
+    meta.json last, so readers never observe a half-written index.
+    """
+
+    def __init__(self, index_dir, count, dim):
+        os.makedirs(index_dir, exist_ok=True)
+        self.index_dir = index_dir
+        self.count = count
+        self.dim = dim
+        self._row = 0
+        self._pos = 0
+        self._emb_tmp = os.path.join(index_dir, EMBEDDINGS_FILE + ".tmp")
+        self._chunks_tmp = os.path.join(index_dir, CHUNKS_FILE + ".tmp")
+        self._embeddings = np.lib.format.open_memmap(self._emb_tmp, mode="w+", dtype=np.float32, shape=(count, dim))
+        self._offsets = np.zeros(count + 1, dtype=np.int64)
+        self._chunks = open(self._chunks_tmp, "wb")
+        self._docs = {}  # doc name -> id
+        self._chunk_docs = np.full(count, -1, dtype=np.int32)
+        self._chunk_pages = np.zeros((count, 2), dtype=np.int32)
+        self._has_sources = False
+
+    def add(self, chunks, embeddings, sources=None):
+        embeddings = normalize_rows(embeddings)
+        n = len(chunks)
+        if embeddings.shape[0] != n:
+            raise ValueError(f"{n} chunks but {embeddings.shape[0]} embeddings")
+        if self._row + n > self.count:
+            raise ValueError(f"IndexWriter expected {self.count} rows, got more")
+        self._embeddings[self._row:self._row + n] = embeddings
+        if sources is not None:
+            self._has_sources = True
+            for j, (doc, page_start, page_end) in enumerate(sources):
+                self._chunk_docs[self._row + j] = self._docs.setdefault(doc, len(self._docs))
+                self._chunk_pages[self._row + j] = (page_start, page_end)
+        for text in chunks:
+            data = text.encode("utf-8")
+            self._chunks.write(data)
+            self._pos += len(data)
+            self._row += 1
+            self._offsets[self._row] = self._pos
+
+    def close(self, model_name=""):
+        if self._row != self.count:
+            raise ValueError(f"IndexWriter expected {self.count} rows, got {self._row}")
+        self._chunks.close()
+        self._embeddings.flush()
+        del self._embeddings
+        offsets_tmp = os.path.join(self.index_dir, OFFSETS_FILE + ".tmp")
+        with open(offsets_tmp, "wb") as f:
+            np.save(f, self._offsets)
+        if self._has_sources:
+            for fn, arr in ((CHUNK_DOCS_FILE, self._chunk_docs), (CHUNK_PAGES_FILE, self._chunk_pages)):
+                with open(os.path.join(self.index_dir, fn + ".tmp"), "wb") as f:
+                    np.save(f, arr)
+        # Everything is on disk; swap the files in back to back
+        os.replace(self._chunks_tmp, os.path.join(self.index_dir, CHUNKS_FILE))
+        os.replace(offsets_tmp, os.path.join(self.index_dir, OFFSETS_FILE))
+        os.replace(self._emb_tmp, os.path.join(self.index_dir, EMBEDDINGS_FILE))
+        for fn in (CHUNK_DOCS_FILE, CHUNK_PAGES_FILE):
+            path = os.path.join(self.index_dir, fn)
+            if self._has_sources:
+                os.replace(path + ".tmp", path)
+            elif os.path.exists(path):
+                os.remove(path)  # stale metadata from a previous index
+
+        meta = {
+            "count": int(self.count),
+            "dim": int(self.dim),
+            "model": model_name,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "docs": sorted(self._docs, key=self._docs.get),
+        }
+        tmp = os.path.join(self.index_dir, META_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp, os.path.join(self.index_dir, META_FILE))
+        return meta
+
+
+def write_index(index_dir, chunks, embeddings, model_name="", sources=None):
+    """
+    Write chunks + embeddings to `index_dir` in the memory-mappable layout.
+    Embeddings are L2-normalized and stored as float32. `sources` optionally
+    gives (doc, page_start, page_end) per chunk.
+    meta.json is written last, so a directory with meta.json is complete.
+    """
+    embeddings = np.asarray(embeddings)
+    dim = embeddings.shape[1] if embeddings.ndim == 2 else 0
+    writer = IndexWriter(index_dir, len(chunks), dim)
+    writer.add(chunks, embeddings.reshape(len(chunks), dim), sources)
+    return writer.close(model_name)
+
+
+def index_exists(index_dir):
+    """True if `index_dir` holds a complete index (meta.json is written last)."""
+    return os.path.exists(os.path.join(index_dir, META_FILE))
+
+
+# -----------------------------
+# Versions
+# -----------------------------
+def new_version_dir(root):
+    """Create and return an empty directory for the next index version (names sort by time)."""
+    os.makedirs(os.path.join(root, VERSIONS_DIR), exist_ok=True)
+    while True:
+        now = time.time()
+        name = time.strftime("%Y%m%dT%H%M%S", time.localtime(now)) + f".{int(now * 1000) % 1000:03d}-{os.getpid()}"
+        path = os.path.join(root, VERSIONS_DIR, name)
+        try:
+            os.mkdir(path)
+            return path
+        except FileExistsError:
+            time.sleep(0.001)
+
+
+def current_version(root):
+    """Name of the published version, or None for an unversioned root."""
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def current_version_dir(root):
+    """Directory of the published index version (`root` itself if unversioned)."""
+    version = current_version(root)
+    return os.path.join(root, VERSIONS_DIR, version) if version else root
+
+
+def publish_version(root, version_dir):
+    """Point CURRENT at a complete version directory; readers switch atomically."""
+    if not index_exists(version_dir):
+        raise ValueError(f"{version_dir} is not a complete index")
+    tmp = os.path.join(root, CURRENT_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        f.write(os.path.basename(os.path.normpath(version_dir)) + "\n")
+    os.replace(tmp, os.path.join(root, CURRENT_FILE))
+
+
+def gc_versions(root, keep=2, in_use=()):
+    """
+    Delete old version directories, keeping the `keep` newest, the published
+    one and any named in `in_use`. Processes that still have a deleted
+    version memory-mapped keep reading it until they let go (POSIX).
+    Returns the names removed.
+    """
+    versions_dir = os.path.join(root, VERSIONS_DIR)
+    if not os.path.isdir(versions_dir):
+        return []
+    names = sorted(os.listdir(versions_dir))
+    protected = set(names[-keep:] if keep > 0 else []) | {current_version(root)} | set(in_use)
+    removed = []
+    for name in names:
+        if name not in protected:
+            shutil.rmtree(os.path.join(versions_dir, name), ignore_errors=True)
+            removed.append(name)
+    return removed
+
+
+# -----------------------------
+# Read side
+# -----------------------------
+class ChunkStore:
+    """
+    Read-only, list-like view of chunk texts backed by a memory-mapped blob.
+    Texts are decoded on access; nothing is held in Python objects up front.
+    """
+
+    def __init__(self, blob, offsets, docs=None, chunk_docs=None, chunk_pages=None):
+        self._blob = blob
+        self._offsets = offsets
+        self._docs = docs or []
+        self._chunk_docs = chunk_docs
+        self._chunk_pages = chunk_pages
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return bytes(self._blob[start:end]).decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def source(self, i):
+        """{"doc", "page_start", "page_end"} for chunk i, or None if the index has no page metadata."""
+        if self._chunk_pages is None:
+            return None
+        i = int(i)
+        doc_id = int(self._chunk_docs[i])
+        return {
+            "doc": self._docs[doc_id] if doc_id >= 0 else None,
+            "page_start": int(self._chunk_pages[i, 0]),
+            "page_end": int(self._chunk_pages[i, 1]),
+        }
+
+
+def load_index(index_dir):
+    """
+    Memory-map an index written by write_index().
+    Returns (chunks: ChunkStore, embeddings: read-only float32 np.memmap, meta: dict).
+    """
+    with open(os.path.join(index_dir, META_FILE)) as f:
+        meta = json.load(f)
+
+    embeddings = np.load(os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode="r")
+    offsets = np.load(os.path.join(index_dir, OFFSETS_FILE), mmap_mode="r")
+    blob_path = os.path.join(index_dir, CHUNKS_FILE)
+    if os.path.getsize(blob_path):
+        blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+    else:
+        blob = b""  # np.memmap cannot map an empty file
+
+    if embeddings.dtype != np.float32 or embeddings.shape[0] != len(offsets) - 1:
+        raise ValueError(f"Corrupt reference index in {index_dir}")
+
+    chunk_docs = chunk_pages = None
+    pages_path = os.path.join(index_dir, CHUNK_PAGES_FILE)
+    if os.path.exists(pages_path):
+        chunk_docs = np.load(os.path.join(index_dir, CHUNK_DOCS_FILE), mmap_mode="r")
+        chunk_pages = np.load(pages_path, mmap_mode="r")
+    return ChunkStore(blob, offsets, meta.get("docs"), chunk_docs, chunk_pages), embeddings, meta
@@ -0,0 +1,395 @@
+import os, logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------
+# Vector search primitives
+# -----------------------------
+def top_k_indices(scores, k, min_score=None):
+    """
+    Indices of the k highest scores, best first, in O(n + k log k).
+    Uses np.argpartition instead of a full sort of every score.
+    If min_score is given, indices scoring below it are dropped.
+    """
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        idx = np.argpartition(scores, n - k)[n - k:]
+    else:
+        idx = np.arange(n)
+    idx = idx[np.argsort(-scores[idx], kind="stable")]
+    if min_score is not None:
+        idx = idx[scores[idx] >= min_score]
+    return idx
+
+
+# -----------------------------
+# Pluggable index backends
+# -----------------------------
+class VectorIndex:
+    """
+    Interface for nearest-neighbour search over L2-normalized vectors.
+    search() takes a normalized query and returns (ids, scores), best first.
+    """
+
+    name = "base"
+
+    def search(self, query, k, min_score=None):
+        raise NotImplementedError
+
+    def search_batch(self, queries, k, min_score=None):
+        """Search each row of `queries`; returns a list of (ids, scores)."""
+        return [self.search(q, k, min_score) for q in queries]
+
+
+class ExactIndex(VectorIndex):
+    """Brute-force cosine search: one mat-vec over every vector."""
+
+    name = "exact"
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def __len__(self):
+        return self.embeddings.shape[0]
+
+    def search(self, query, k, min_score=None):
+        sims = self.embeddings @ query
+        idx = top_k_indices(sims, k, min_score)
+        return idx, sims[idx]
+
+    def search_batch(self, queries, k, min_score=None, block_bytes=64 << 20):
+        """
+        Score many queries with one matrix-matrix product per block of queries
+        (blocks keep the queries x vectors score matrix under `block_bytes`).
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        rows = max(1, block_bytes // (4 * max(1, self.embeddings.shape[0])))
+        out = []
+        for start in range(0, queries.shape[0], rows):
+            sims = queries[start:start + rows] @ self.embeddings.T
+            for row in sims:
+                idx = top_k_indices(row, k, min_score)
+                out.append((idx, row[idx]))
+        return out
+
+
+# Files written next to the reference index (see backend/ref_index.py)
+IVF_CENTROIDS_FILE = "ivf_centroids.npy"
+IVF_VECTORS_FILE = "ivf_vectors.npy"
+IVF_IDS_FILE = "ivf_ids.npy"
+IVF_OFFSETS_FILE = "ivf_offsets.npy"
+
+
+def _assign(vectors, centroids, block=16384):
+    """Nearest centroid (max inner product) for every row, in bounded-memory blocks."""
+    out = np.empty(vectors.shape[0], dtype=np.int32)
+    for start in range(0, vectors.shape[0], block):
+        out[start:start + block] = np.argmax(vectors[start:start + block] @ centroids.T, axis=1)
+    return out
+
+
+def _spherical_kmeans(vectors, nlist, iters, rng):
+    """Lloyd iterations on the unit sphere; returns (nlist x dim) normalized centroids."""
+    centroids = np.array(vectors[rng.choice(vectors.shape[0], nlist, replace=False)], dtype=np.float32)
+    for _ in range(iters):
+        assign = _assign(vectors, centroids)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=nlist)
+        nonempty = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[nonempty]
+        sums = np.add.reduceat(vectors[order], starts, axis=0)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids[nonempty] = sums / norms
+        # Re-seed empty lists with random points so every list stays useful
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(vectors.shape[0], len(empty), replace=False)]
+    return centroids
+
+
+class IVFIndex(VectorIndex):
+    """
+    Inverted-file (IVF-Flat) approximate index in pure NumPy.
+
+    Vectors are clustered with spherical k-means into `nlist` lists and stored
+    contiguously per list. A query scores the centroids, then scans only the
+    `nprobe` closest lists. Raising nprobe trades latency for recall;
+    nprobe == nlist is exact search.
+    """
+
+    name = "ivf"
+
+    def __init__(self, centroids, vectors, ids, offsets, nprobe=8):
+        self.centroids = centroids
+        self.vectors = vectors
+        self.ids = ids
+        self.offsets = offsets
+        self.nprobe = nprobe
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @property
+    def nlist(self):
+        return self.centroids.shape[0]
+
+    @classmethod
+    def build(cls, embeddings, nlist=None, iters=10, train_size=None, seed=0, nprobe=8):
+        """
+        Cluster normalized `embeddings` into an IVF index.
+        Defaults: nlist ~ 4*sqrt(n); k-means trained on up to 64 points per list.
+        """
+        n = embeddings.shape[0]
+        if n == 0:
+            raise ValueError("Cannot build an IVF index over zero vectors")
+        nlist = min(n, nlist or max(1, int(4 * np.sqrt(n))))
+        rng = np.random.default_rng(seed)
+        train_size = min(n, train_size or nlist * 64)
+        train = np.asarray(embeddings[np.sort(rng.choice(n, train_size, replace=False))], dtype=np.float32)
+
+        centroids = _spherical_kmeans(train, nlist, iters, rng)
+        assign = _assign(embeddings, centroids)
+        ids = np.argsort(assign, kind="stable").astype(np.int64)
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assign, minlength=nlist))
+        vectors = np.asarray(embeddings[ids], dtype=np.float32)
+        return cls(centroids, vectors, ids, offsets, nprobe=nprobe)
+
+    def save(self, index_dir):
+        for fn, arr in (
+            (IVF_VECTORS_FILE, self.vectors),
+            (IVF_IDS_FILE, self.ids),
+            (IVF_OFFSETS_FILE, self.offsets),
+            (IVF_CENTROIDS_FILE, self.centroids),  # written last: marks a complete IVF index
+        ):
+            path = os.path.join(index_dir, fn)
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, arr)
+            os.replace(path + ".tmp", path)
+
+    @classmethod
+    def exists(cls, index_dir):
+        return os.path.exists(os.path.join(index_dir, IVF_CENTROIDS_FILE))
+
+    @classmethod
+    def load(cls, index_dir, nprobe=8):
+        """Memory-map a saved IVF index; only probed lists are paged in."""
+        def mm(fn):
+            return np.load(os.path.join(index_dir, fn), mmap_mode="r")
+        return cls(
+            np.load(os.path.join(index_dir, IVF_CENTROIDS_FILE)),
+            mm(IVF_VECTORS_FILE), mm(IVF_IDS_FILE), np.load(os.path.join(index_dir, IVF_OFFSETS_FILE)),
+            nprobe=nprobe,
+        )
+
+    def search(self, query, k, min_score=None, nprobe=None):
+        nprobe = min(self.nlist, nprobe or self.nprobe)
+        lists = top_k_indices(self.centroids @ query, nprobe)
+        ids, sims = [], []
+        for lst in lists:
+            start, end = self.offsets[lst], self.offsets[lst + 1]
+            if start == end:
+                continue
+            sims.append(self.vectors[start:end] @ query)
+            ids.append(self.ids[start:end])
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        ids = np.concatenate(ids)
+        sims = np.concatenate(sims)
+        top = top_k_indices(sims, k, min_score)
+        return ids[top], sims[top]
+
+
+# -----------------------------
+# Quantized backends (compact codes + float rescoring)
+# -----------------------------
+Q8_CODES_FILE = "q8_codes.npy"
+Q8_SCALE_FILE = "q8_scale.npy"
+BIN_CODES_FILE = "bin_codes.npy"
+
+_SCAN_BLOCK = 8192  # rows converted per step when scoring int8 codes
+
+
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount_rows(words):
+    """Set bits per row of a uint64 matrix."""
+    if hasattr(np, "bitwise_count"):  # NumPy >= 2.0
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT_TABLE[words.view(np.uint8)].sum(axis=1, dtype=np.int32)
+
+
+class QuantizedIndex(VectorIndex):
+    """
+    Two-pass search: score every vector from compact codes held in memory,
+    then rescore the best `rescore` candidates exactly against the float
+    embeddings. The float matrix stays memory-mapped; only shortlisted rows
+    are read, so resident memory is dominated by the codes.
+    """
+
+    files = ()
+    default_rescore = 32
+
+    def __init__(self, embeddings, rescore=None):
+        self.embeddings = embeddings
+        self.rescore = rescore or self.default_rescore
+
+    def __len__(self):
+        return self.embeddings.shape[0]
+
+    @property
+    def nbytes(self):
+        """Bytes held by the codes (what has to stay in RAM)."""
+        return sum(a.nbytes for a in self._arrays())
+
+    def _arrays(self):
+        raise NotImplementedError
+
+    def approx_scores(self, query):
+        """Per-vector first-pass scores; higher is more similar."""
+        raise NotImplementedError
+
+    def search(self, query, k, min_score=None, rescore=None):
+        shortlist = top_k_indices(self.approx_scores(query), max(k, rescore or self.rescore))
+        shortlist.sort()  # ascending row order reads the memory map sequentially
+        sims = np.asarray(self.embeddings[shortlist], dtype=np.float32) @ query
+        top = top_k_indices(sims, k, min_score)
+        return shortlist[top], sims[top]
+
+    def save(self, index_dir):
+        for fn, arr in zip(self.files, self._arrays()):
+            path = os.path.join(index_dir, fn)
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, arr)
+            os.replace(path + ".tmp", path)
+
+    @classmethod
+    def exists(cls, index_dir):
+        return all(os.path.exists(os.path.join(index_dir, fn)) for fn in cls.files)
+
+    @classmethod
+    def load(cls, index_dir, embeddings, rescore=None):
+        return cls(embeddings, *(np.load(os.path.join(index_dir, fn), mmap_mode="r") for fn in cls.files),
+                   rescore=rescore)
+
+
+class Int8Index(QuantizedIndex):
+    """
+    Scalar quantization: each dimension is mapped to int8 with its own scale
+    (max |value| / 127), so a code is 1 byte per dimension (4x smaller than float32).
+    """
+
+    name = "int8"
+    files = (Q8_CODES_FILE, Q8_SCALE_FILE)
+    default_rescore = 32
+
+    def __init__(self, embeddings, codes, scale, rescore=None):
+        super().__init__(embeddings, rescore)
+        self.codes = codes
+        self.scale = scale
+
+    def _arrays(self):
+        return self.codes, self.scale
+
+    @classmethod
+    def build(cls, embeddings, rescore=None, block=65536):
+        n, dim = embeddings.shape
+        scale = np.zeros(dim, dtype=np.float32)
+        for start in range(0, n, block):
+            np.maximum(scale, np.abs(embeddings[start:start + block]).max(axis=0), out=scale)
+        scale = np.where(scale > 0, scale / 127.0, 1.0).astype(np.float32)
+        codes = np.empty((n, dim), dtype=np.int8)
+        for start in range(0, n, block):
+            codes[start:start + block] = np.clip(np.rint(embeddings[start:start + block] / scale), -127, 127)
+        return cls(embeddings, codes, scale, rescore=rescore)
+
+    def approx_scores(self, query):
+        # q . x ~= (q * scale) . code; converted block by block to bound temporaries
+        q = (query * self.scale).astype(np.float32)
+        out = np.empty(self.codes.shape[0], dtype=np.float32)
+        for start in range(0, out.shape[0], _SCAN_BLOCK):
+            out[start:start + _SCAN_BLOCK] = self.codes[start:start + _SCAN_BLOCK].astype(np.float32) @ q
+        return out
+
+
+class BinaryIndex(QuantizedIndex):
+    """
+    Sign quantization: one bit per dimension (32x smaller than float32),
+    packed into uint64 words. First-pass score is minus the Hamming
+    distance to the query's sign bits, computed with XOR + popcount.
+    Coarser than int8, so a longer shortlist is rescored.
+    """
+
+    name = "binary"
+    files = (BIN_CODES_FILE,)
+    default_rescore = 500
+
+    def __init__(self, embeddings, codes, rescore=None):
+        super().__init__(embeddings, rescore)
+        self.codes = codes
+
+    def _arrays(self):
+        return (self.codes,)
+
+    @staticmethod
+    def pack(vectors):
+        """Sign bits of each row, packed and zero-padded to whole uint64 words."""
+        bits = np.packbits(np.asarray(vectors) > 0, axis=1)
+        pad = (-bits.shape[1]) % 8
+        if pad:
+            bits = np.pad(bits, ((0, 0), (0, pad)))
+        return np.ascontiguousarray(bits).view(np.uint64)
+
+    @classmethod
+    def build(cls, embeddings, rescore=None, block=65536):
+        n = embeddings.shape[0]
+        words = -(-embeddings.shape[1] // 64)
+        codes = np.empty((n, words), dtype=np.uint64)
+        for start in range(0, n, block):
+            codes[start:start + block] = cls.pack(embeddings[start:start + block])
+        return cls(embeddings, codes, rescore=rescore)
+
+    def approx_scores(self, query):
+        q = self.pack(query[None, :])
+        out = np.empty(self.codes.shape[0], dtype=np.int32)
+        for start in range(0, out.shape[0], _SCAN_BLOCK):
+            out[start:start + _SCAN_BLOCK] = _popcount_rows(self.codes[start:start + _SCAN_BLOCK] ^ q)
+        return -out
+
+
+BACKENDS = {"exact": ExactIndex, "ivf": IVFIndex, "int8": Int8Index, "binary": BinaryIndex}
+
+
+def open_index(index_dir, embeddings, backend="exact", nprobe=8, rescore=None):
+    """
+    Return the VectorIndex selected by `backend` for a loaded reference index.
+    Falls back to exact search if the requested ANN files are missing.
+    Quantized codes missing from disk are built in memory instead.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown vector index backend {backend!r}; choose from {sorted(BACKENDS)}")
+    if backend in ("int8", "binary"):
+        cls = BACKENDS[backend]
+        if index_dir and cls.exists(index_dir):
+            index = cls.load(index_dir, embeddings, rescore=rescore)
+            if index.codes.shape[0] == embeddings.shape[0]:
+                return index
+            logger.warning("%s codes in %s are stale; rebuilding in memory", backend, index_dir)
+        else:
+            logger.warning("%s codes not found in %s; building in memory", backend, index_dir)
+        return cls.build(embeddings, rescore=rescore)
+    if backend == "ivf":
+        if index_dir and IVFIndex.exists(index_dir):
+            ivf = IVFIndex.load(index_dir, nprobe=nprobe)
+            if len(ivf) == embeddings.shape[0]:
+                return ivf
+            logger.warning("IVF index in %s is stale (%d vs %d vectors); using exact search",
+                           index_dir, len(ivf), embeddings.shape[0])
+        else:
+            logger.warning("IVF index not found in %s; using exact search", index_dir)
+    return ExactIndex(embeddings)
@@ -1,14 +1,374 @@
-from duckduckgo_search import ddg
-import logging
+import os, json, logging, sqlite3, threading, time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 
 logger = logging.getLogger(__name__)
 
+# -----------------------------
+# Configuration
+# -----------------------------
+# "ddg" (DuckDuckGo) or "http" (JSON search endpoint, e.g. scripts/fake_search_server.py)
+WEB_SEARCH_PROVIDER = os.getenv("WEB_SEARCH_PROVIDER", "ddg")
+WEB_SEARCH_URL = os.getenv("WEB_SEARCH_URL", "http://localhost:8002/search")
+# Per-call deadline and max simultaneous outbound searches
+WEB_SEARCH_TIMEOUT = float(os.getenv("WEB_SEARCH_TIMEOUT", "5"))
+WEB_SEARCH_MAX_CONCURRENCY = int(os.getenv("WEB_SEARCH_MAX_CONCURRENCY", "4"))
+# Persistent result cache ("" disables); relative to the repository root, not the working directory
+WEB_SEARCH_CACHE_PATH = os.getenv(
+    "WEB_SEARCH_CACHE_PATH", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "web_search_cache.sqlite3")
+)
+WEB_SEARCH_CACHE_TTL = float(os.getenv("WEB_SEARCH_CACHE_TTL", "86400"))
+# Circuit breaker: consecutive failures before opening, seconds before a retry probe
+WEB_SEARCH_BREAKER_FAILURES = int(os.getenv("WEB_SEARCH_BREAKER_FAILURES", "5"))
+WEB_SEARCH_BREAKER_RESET = float(os.getenv("WEB_SEARCH_BREAKER_RESET", "30"))
+# How often a waiting caller checks its cancel event (seconds)
+WEB_SEARCH_CANCEL_POLL = 0.05
+
+
+# -----------------------------
+# Providers
+# -----------------------------
+class SearchProvider:
+    """
+    Pluggable search backend. search() returns a list of
+    {"title", "snippet", "url"} dicts and raises on failure.
+    """
+
+    name = "base"
+
+    def search(self, query, max_results, timeout):
+        raise NotImplementedError
+
+
+class DuckDuckGoProvider(SearchProvider):
+    """DuckDuckGo via duckduckgo_search (no API key required)."""
+
+    name = "ddg"
+
+    def search(self, query, max_results, timeout):
+        from duckduckgo_search import ddg
+        results = ddg(query, max_results=max_results) or []
+        return [
+            {
+                "title": r.get("title"),
+                "snippet": r.get("body") or r.get("snippet") or "",
+                "url": r.get("href") or r.get("url"),
+            }
+            for r in results
+        ]
+
+
+class HttpSearchProvider(SearchProvider):
+    """
+    Generic JSON search endpoint: GET <url>?q=...&max_results=N returning
+    {"results": [{"title", "snippet", "url"}, ...]}.
+    Used against scripts/fake_search_server.py in offline tests.
+    """
+
+    name = "http"
+
+    def __init__(self, url):
+        import requests
+        self.url = url
+        self.session = requests.Session()
+
+    def search(self, query, max_results, timeout):
+        resp = self.session.get(self.url, params={"q": query, "max_results": max_results}, timeout=timeout)
+        resp.raise_for_status()
+        return [
+            {"title": r.get("title"), "snippet": r.get("snippet") or "", "url": r.get("url")}
+            for r in resp.json().get("results", [])[:max_results]
+        ]
+
+
+# -----------------------------
+# Persistent result cache
+# -----------------------------
+class SearchCache:
+    """On-disk (SQLite) cache of query -> results with a TTL; safe across threads and processes."""
+
+    def __init__(self, path, ttl=86400.0):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_pid = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def _conn(self):
+        # SQLite connections must not cross fork(); open one per process
+        if self._db is None or self._db_pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache "
+                "(key TEXT PRIMARY KEY, results TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            db.commit()
+            self._db, self._db_pid = db, os.getpid()
+        return self._db
+
+    @staticmethod
+    def key(query, max_results):
+        return f"{max_results}:{' '.join(query.lower().split())}"
+
+    def get(self, query, max_results):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT results, created FROM search_cache WHERE key = ?", (self.key(query, max_results),)
+            ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, query, max_results, results):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_cache (key, results, created) VALUES (?, ?, ?)",
+                (self.key(query, max_results), json.dumps(results), time.time()),
+            )
+            self._conn.commit()
+
+    def purge_expired(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM search_cache WHERE created < ?", (time.time() - self.ttl,))
+            self._conn.commit()
+
+
+# -----------------------------
+# Circuit breaker
+# -----------------------------
+class CircuitBreaker:
+    """
+    Skips calls while the provider is failing.
+    closed -> (N consecutive failures) -> open -> (reset_timeout) -> half-open:
+    one probe call is let through; success closes the breaker, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def cancel_probe(self):
+        """The allowed call never reached the provider; let another caller probe."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._probing:
+                    logger.warning("Web search circuit breaker opened after %d failures", self._failures)
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+# -----------------------------
+# Web search client
+# -----------------------------
+class WebSearchClient:
+    """
+    Web search with a result cache, per-call deadlines, a concurrency limit
+    and a circuit breaker in front of a pluggable provider.
+    Never raises: failures, timeouts and skipped calls return [].
+    """
+
+    def __init__(self, provider, cache=None, timeout=5.0, max_concurrency=4, breaker=None):
+        self.provider = provider
+        self.cache = cache
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._max_concurrency = max_concurrency
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self.calls = self.failures = self.timeouts = self.rejected = 0
+
+    def _get_executor(self):
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(self._max_concurrency, thread_name_prefix="web-search")
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def search(self, query, max_results=3, timeout=None, cancel=None):
+        """
+        Results for `query`, or [] on failure. `timeout` can only shorten the
+        client's own; setting the `cancel` event (threading.Event) makes a
+        waiting caller give up early, like an expired timeout.
+        """
+        if self.cache is not None:
+            cached = self._cache_get(query, max_results)
+            if cached is not None:
+                logger.info("web_search: cache hit for query=%s", query)
+                return cached
+
+        if cancel is not None and cancel.is_set():
+            return []
+        if not self.breaker.allow():
+            logger.info("web_search: circuit open, skipping query=%s", query)
+            self.rejected += 1
+            return []
+
+        # The provider always gets its own full timeout; a caller may stop waiting sooner
+        start = time.monotonic()
+        provider_deadline = start + self.timeout
+        deadline = start + (self.timeout if timeout is None else min(timeout, self.timeout))
+        if not self._slots.acquire(timeout=deadline - start):
+            logger.warning("web_search: concurrency limit reached, skipping query=%s", query)
+            self.rejected += 1
+            self.breaker.cancel_probe()
+            return []
+
+        # The slot is released when the provider call really finishes, so the
+        # limit bounds outbound requests even when callers stop waiting.
+        self.calls += 1
+        claim = threading.Lock()  # whoever takes it first records the call's outcome
+        future = self._get_executor().submit(
+            self.provider.search, query, max_results, max(0.0, provider_deadline - time.monotonic())
+        )
+        future.add_done_callback(lambda _: self._slots.release())
+        future.add_done_callback(lambda f: self._finish(f, claim, provider_deadline, query, max_results))
+        try:
+            self._wait(future, deadline, cancel)
+        except FutureTimeout:
+            if deadline < provider_deadline or (cancel is not None and cancel.is_set()):
+                # Only the caller's shorter budget ran out, or it stopped waiting:
+                # not a provider failure. _finish records the outcome when the call ends.
+                logger.info("web_search: caller stopped waiting after %.1fs for query=%s",
+                            time.monotonic() - start, query)
+                return []
+            if claim.acquire(blocking=False):
+                self.timeouts += 1
+                self.breaker.record_failure()
+            logger.warning("web_search: timed out after %.1fs for query=%s", self.timeout, query)
+            return []
+        except Exception:
+            pass
+        return self._finish(future, claim, provider_deadline, query, max_results)
+
+    @staticmethod
+    def _wait(future, deadline, cancel):
+        """future.result() until `deadline`; raises FutureTimeout then, or as soon as `cancel` is set."""
+        while True:
+            remaining = max(0.0, deadline - time.monotonic())
+            try:
+                return future.result(timeout=remaining if cancel is None else min(remaining, WEB_SEARCH_CANCEL_POLL))
+            except FutureTimeout:
+                if cancel is None or remaining <= WEB_SEARCH_CANCEL_POLL or cancel.is_set():
+                    raise
+
+    def _finish(self, future, claim, provider_deadline, query, max_results):
+        """
+        Record a finished provider call once (breaker, counters, cache) and
+        return its results ([] on failure). Runs in the caller, or in the
+        done-callback when the caller stopped waiting first.
+        """
+        if future.exception() is not None:
+            if claim.acquire(blocking=False):
+                self.failures += 1
+                self.breaker.record_failure()
+                logger.error("web_search failed: %s", future.exception())
+            return []
+        results = future.result()
+        if claim.acquire(blocking=False):
+            if time.monotonic() > provider_deadline:
+                # Finished, but past the provider's own timeout
+                self.timeouts += 1
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            if self.cache is not None:
+                self._cache_put(query, max_results, results)
+        return results
+
+    # A broken cache (locked or corrupt database, unusable path) must not break search
+    def _cache_get(self, query, max_results):
+        try:
+            return self.cache.get(query, max_results)
+        except (sqlite3.Error, OSError, ValueError) as e:
+            logger.warning("web_search: cache read failed, treating as a miss: %s", e)
+            return None
+
+    def _cache_put(self, query, max_results, results):
+        try:
+            self.cache.put(query, max_results, results)
+        except (sqlite3.Error, OSError, ValueError) as e:
+            logger.warning("web_search: cache write failed, result not cached: %s", e)
+
+    def stats(self):
+        out = {
+            "provider": self.provider.name,
+            "breaker": self.breaker.state,
+            "calls": self.calls,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+        }
+        if self.cache is not None:
+            out.update(cache_hits=self.cache.hits, cache_misses=self.cache.misses)
+        return out
+
+
+def make_provider(name=WEB_SEARCH_PROVIDER):
+    if name == "ddg":
+        return DuckDuckGoProvider()
+    if name == "http":
+        return HttpSearchProvider(WEB_SEARCH_URL)
+    raise ValueError(f"Unknown WEB_SEARCH_PROVIDER {name!r}; use 'ddg' or 'http'")
+
+
+client = WebSearchClient(
+    make_provider(),
+    cache=SearchCache(WEB_SEARCH_CACHE_PATH, WEB_SEARCH_CACHE_TTL) if WEB_SEARCH_CACHE_PATH else None,
+    timeout=WEB_SEARCH_TIMEOUT,
+    max_concurrency=WEB_SEARCH_MAX_CONCURRENCY,
+    breaker=CircuitBreaker(WEB_SEARCH_BREAKER_FAILURES, WEB_SEARCH_BREAKER_RESET),
+)
+
+
 # -----------------------------
 # Web Search Utility
 # -----------------------------
-def web_search(query, max_results=3):
+def web_search(query, max_results=3, timeout=None, cancel=None):
     """
-    Perform a simple web search using DuckDuckGo (no API key required).
+    Perform a web search through the shared WebSearchClient
+    (DuckDuckGo by default, no API key required).
     Returns a list of results in the format:
     [
         {
@@ -18,25 +378,10 @@ def web_search(query, max_results=3):
             "source": "web"
         }
     ]
+    `timeout` caps this call (seconds); setting the `cancel` event stops the
+    wait early. Failures, timeouts and cancelled calls return [].
     """
-    try:
-        results = ddg(query, max_results=max_results)
-        if not results:
-            return []
-
-        out = []
-        for r in results:
-            out.append({
-                "title": r.get("title"),
-                "snippet": r.get("body") or r.get("snippet") or "",
-                "url": r.get("href") or r.get("url"),
-                "source": "web"
-            })
-
-        logger.info("web_search: query=%s returned=%d results", query, len(out))
-        return out
-
-    except Exception as e:
-        # Log any search or network failure gracefully
-        logger.exception("web_search failed: %s", e)
-        return []
+    out = [dict(r, source="web") for r in client.search(query, max_results=max_results, timeout=timeout,
+                                                       cancel=cancel)]
+    logger.info("web_search: query=%s returned=%d results", query, len(out))
+    return out
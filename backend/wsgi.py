@@ -0,0 +1,7 @@
+"""
+backend/wsgi.py
+---------------
+WSGI entry point for production servers (see backend/gunicorn.conf.py).
+"""
+
+from app import app  # noqa: F401
@@ -11,6 +11,7 @@ Backend: Flask API (see backend/app.py)
 """
 
 import os
+import json
 import random
 import requests
 import streamlit as st
@@ -20,6 +21,7 @@ import streamlit as st
 # ------------------------------------------------------------
 # Default backend URL if not set via environment variable
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:5000")
+WARMING_UP = "The clinical agent is still loading its knowledge base. Please try again in a few seconds."
 
 # ------------------------------------------------------------
 # Streamlit Page Configuration
@@ -45,6 +47,38 @@ if "patient" not in st.session_state:
 if "chat" not in st.session_state:
     st.session_state.chat = []
 
+# ------------------------------------------------------------
+# Helpers
+# ------------------------------------------------------------
+def iter_sse(resp):
+    """Yield (event, data) pairs from a Server-Sent Events response."""
+    event, data = "message", []
+    for line in resp.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
+
+def show_sources(sources):
+    """Display retrieved sources under the answer."""
+    if sources:
+        st.markdown("#### Sources Used")
+        for i, s in enumerate(sources, 1):
+            where = ""
+            if s.get("page_start"):
+                pages = s["page_start"] if s["page_start"] == s["page_end"] else f"{s['page_start']}-{s['page_end']}"
+                where = f"{s.get('doc') or ''} p. {pages}, ".lstrip()
+            st.markdown(f"**Reference Chunk {i} ({where}score: {s.get('score', 0):.3f})**")
+            st.write(s.get('snippet', '')[:350] + "...")
+
+
 # ------------------------------------------------------------
 # Sidebar Controls
 # ------------------------------------------------------------
@@ -54,6 +88,7 @@ if st.sidebar.button("Reset Session"):
     st.session_state.patient = None
     st.session_state.chat = []
     st.experimental_rerun()
+stream_answers = st.sidebar.checkbox("Stream answers", value=True)
 
 # ------------------------------------------------------------
 # Receptionist Section
@@ -122,26 +157,46 @@ if st.button("Ask Clinical Agent"):
             "text": "That sounds like a medical concern. Let me connect you with our Clinical AI Agent..."
         })
 
+        payload = {"patient_id": st.session_state.patient["patient_id"], "question": q}
         try:
-            # Call backend /clinical endpoint
-            payload = {"patient_id": st.session_state.patient["patient_id"], "question": q}
-            resp = requests.post(f"{BACKEND_URL}/clinical", json=payload, timeout=25)
+            if stream_answers:
+                # Call backend /clinical/stream and render tokens as they arrive
+                with requests.post(f"{BACKEND_URL}/clinical/stream", json=payload, stream=True, timeout=(5, 60)) as resp:
+                    if resp.status_code == 200:
+                        placeholder = st.empty()
+                        text, sources = "", []
+                        for event, data in iter_sse(resp):
+                            if event == "sources":
+                                sources = data.get("sources", [])
+                            elif event == "token":
+                                text += data.get("text", "")
+                                placeholder.success("Clinical: " + text)
+                            elif event == "done":
+                                text = data.get("text", text)
+
+                        # Add message to session chat
+                        st.session_state.chat.append({"from": "clinical", "text": text})
+                        show_sources(sources)
+                    elif resp.status_code == 503:
+                        st.info(WARMING_UP)
+                    else:
+                        st.error(f"Clinical agent error: {resp.status_code} {resp.text}")
+            else:
+                # Call backend /clinical endpoint
+                resp = requests.post(f"{BACKEND_URL}/clinical", json=payload, timeout=25)
 
-            if resp.status_code == 200:
-                data = resp.json()
+                if resp.status_code == 200:
+                    data = resp.json()
 
-                # Add message to session chat
-                st.session_state.chat.append({"from": "clinical", "text": data.get("text")})
+                    # Add message to session chat
+                    st.session_state.chat.append({"from": "clinical", "text": data.get("text")})
 
-                # Display retrieved sources
-                sources = data.get("sources", [])
-                if sources:
-                    st.markdown("#### Sources Used")
-                    for i, s in enumerate(sources, 1):
-                        st.markdown(f"**Reference Chunk {i} (score: {s.get('score', 0):.3f})**")
-                        st.write(s.get('snippet', '')[:350] + "...")
-            else:
-                st.error(f"Clinical agent error: {resp.status_code} {resp.text}")
+                    # Display retrieved sources
+                    show_sources(data.get("sources", []))
+                elif resp.status_code == 503:
+                    st.info(WARMING_UP)
+                else:
+                    st.error(f"Clinical agent error: {resp.status_code} {resp.text}")
 
         except Exception as e:
             st.error(f"Backend request failed: {e}")
@@ -0,0 +1,82 @@
+"""
+scripts/bench_ann.py
+--------------------
+Recall@k vs latency of the IVF approximate index against exact search.
+
+By default builds a synthetic clustered corpus of normalized 384-d vectors
+(queries are noisy copies of corpus vectors, like paraphrased questions).
+Pass --index-dir to benchmark a real index written by scripts/ingest_reference.py.
+
+Usage:
+    python scripts/bench_ann.py --n 200000 --nprobe 1 2 4 8 16 32
+    python scripts/bench_ann.py --index-dir data/reference_index
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from ref_index import current_version_dir, load_index, normalize_rows  # noqa: E402
+from vector_index import ExactIndex, IVFIndex  # noqa: E402
+
+
+def synthetic_corpus(n, dim, clusters, rng):
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    labels = rng.integers(0, clusters, n)
+    return normalize_rows(centers[labels] + 0.6 * rng.standard_normal((n, dim), dtype=np.float32))
+
+
+def run_queries(index, queries, k, **kw):
+    """Returns (list of id arrays, mean latency ms, p99 latency ms)."""
+    results, lat = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        ids, _ = index.search(q, k, **kw)
+        lat.append((time.perf_counter() - t0) * 1000)
+        results.append(ids)
+    return results, float(np.mean(lat)), float(np.percentile(lat, 99))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=200000, help="Synthetic corpus size")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--index-dir", default=None, help="Use a real reference index instead")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.index_dir:
+        _, embeddings, _ = load_index(current_version_dir(args.index_dir))
+    else:
+        embeddings = synthetic_corpus(args.n, args.dim, max(16, args.n // 500), rng)
+    n = embeddings.shape[0]
+    picks = rng.choice(n, args.queries, replace=False)
+    queries = normalize_rows(np.asarray(embeddings[picks]) + 0.05 * rng.standard_normal((args.queries, embeddings.shape[1]), dtype=np.float32))
+
+    if args.index_dir and IVFIndex.exists(args.index_dir):
+        ivf = IVFIndex.load(args.index_dir)
+        print(f"Loaded IVF index: {ivf.nlist} lists")
+    else:
+        t0 = time.perf_counter()
+        ivf = IVFIndex.build(embeddings, nlist=args.nlist)
+        print(f"Built IVF index: {ivf.nlist} lists in {time.perf_counter() - t0:.1f}s")
+
+    truth, t_mean, t_p99 = run_queries(ExactIndex(embeddings), queries, args.k)
+    print(f"\n{n} vectors, k={args.k}, {args.queries} queries")
+    print(f"{'backend':<16} {'recall@k':>9} {'mean ms':>9} {'p99 ms':>9}")
+    print(f"{'exact':<16} {1.0:>9.3f} {t_mean:>9.3f} {t_p99:>9.3f}")
+    for nprobe in args.nprobe:
+        if nprobe > ivf.nlist:
+            continue
+        got, mean, p99 = run_queries(ivf, queries, args.k, nprobe=nprobe)
+        recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(got, truth)])
+        print(f"{'ivf nprobe=' + str(nprobe):<16} {recall:>9.3f} {mean:>9.3f} {p99:>9.3f}")
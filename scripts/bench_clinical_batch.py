@@ -0,0 +1,80 @@
+"""
+scripts/bench_clinical_batch.py
+-------------------------------
+Compare answering N (patient, question) pairs with N POST /clinical calls
+against one POST /clinical/batch call. Both go through Flask's test client,
+in process.
+
+Query, result and answer caches are cleared before each mode. The same
+questions repeat across patients, as in the nightly follow-up jobs.
+
+Run from the repository root after scripts/ingest_reference.py. Set
+WEB_FALLBACK_THRESHOLD=0 to leave web search out of the measurement.
+
+Usage:
+    WEB_FALLBACK_THRESHOLD=0 python scripts/bench_clinical_batch.py --patients 25 --questions 8
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import app as backend_app  # noqa: E402
+import rag  # noqa: E402
+
+QUESTIONS = [
+    "How much potassium can I have each day?",
+    "What should I do if my legs swell?",
+    "Can I take ibuprofen for pain?",
+    "How much fluid should I drink?",
+    "What are signs of a kidney infection?",
+    "Why is my creatinine high?",
+    "What foods are high in phosphorus?",
+    "When should I call my nephrologist?",
+    "Is it safe to exercise after discharge?",
+    "How do I know if my blood pressure is too high?",
+]
+
+
+def clear_caches():
+    rag.embedding_cache.clear()
+    rag.result_cache.clear()
+    rag.answer_cache.clear()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=25)
+    parser.add_argument("--questions", type=int, default=8, help=f"Distinct questions (max {len(QUESTIONS)})")
+    parser.add_argument("--no-answer", action="store_true", help="Retrieval only (batch 'answer': false)")
+    args = parser.parse_args()
+
+    rag.init()
+    client = backend_app.app.test_client()
+    items = [
+        {"patient_id": f"P{p:03d}", "question": q}
+        for p in range(1, args.patients + 1) for q in QUESTIONS[:args.questions]
+    ]
+
+    clear_caches()
+    t0 = time.perf_counter()
+    for item in items:
+        resp = client.post("/clinical", json=item)
+        assert resp.status_code == 200, resp.get_data(as_text=True)
+    loop_s = time.perf_counter() - t0
+
+    clear_caches()
+    t0 = time.perf_counter()
+    resp = client.post("/clinical/batch", json={"items": items, "answer": not args.no_answer})
+    batch_s = time.perf_counter() - t0
+    assert resp.status_code == 200, resp.get_data(as_text=True)
+    errors = sum("error" in r for r in resp.get_json()["results"])
+
+    print(f"{len(items)} items ({args.patients} patients x {args.questions} questions), "
+          f"{errors} errors in batch")
+    print(f"{'loop of /clinical':<22} {loop_s * 1000:>9.0f} ms  ({loop_s / len(items) * 1000:.2f} ms/item)")
+    print(f"{'one /clinical/batch':<22} {batch_s * 1000:>9.0f} ms  ({batch_s / len(items) * 1000:.2f} ms/item)")
+    print(f"speedup: {loop_s / batch_s:.1f}x")
@@ -0,0 +1,92 @@
+"""
+scripts/bench_embedding_batcher.py
+----------------------------------
+Load test for query micro-batching (backend/batching.py).
+
+N client threads each issue M single-query encodes, either directly against
+the encoder (one forward pass per query, as /clinical did before) or through
+an EmbeddingBatcher. Reports throughput and p50 / p99 latency.
+
+The default encoder is a stand-in for a CPU-bound transformer: one forward
+pass at a time, costing a fixed overhead plus a per-item cost. Pass --real
+to use SentenceTransformer("all-MiniLM-L6-v2") instead.
+
+Usage:
+    python scripts/bench_embedding_batcher.py --clients 16 --requests 50
+    python scripts/bench_embedding_batcher.py --real --max-wait-ms 2 5 10
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from batching import EmbeddingBatcher  # noqa: E402
+
+
+def simulated_encoder(overhead_ms, per_item_ms, dim=384):
+    device = threading.Lock()  # one forward pass at a time, like a saturated CPU
+
+    def encode(texts):
+        with device:
+            time.sleep((overhead_ms + per_item_ms * len(texts)) / 1000)
+        return np.ones((len(texts), dim), dtype=np.float32)
+    return encode
+
+
+def real_encoder():
+    from encoders import SentenceTransformerEncoder
+    return SentenceTransformerEncoder("all-MiniLM-L6-v2").encode
+
+
+def load_test(encode_one, clients, requests):
+    latencies = []
+    lock = threading.Lock()
+
+    def client(cid):
+        local = []
+        for i in range(requests):
+            t0 = time.perf_counter()
+            encode_one(f"client {cid} question {i % 7} about potassium and diet")
+            local.append((time.perf_counter() - t0) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    return len(latencies) / wall, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=50, help="Requests per client")
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, nargs="+", default=[2.0, 5.0, 10.0])
+    parser.add_argument("--overhead-ms", type=float, default=8.0, help="Simulated per-call cost")
+    parser.add_argument("--per-item-ms", type=float, default=0.5, help="Simulated per-text cost")
+    parser.add_argument("--real", action="store_true", help="Use the real SentenceTransformer model")
+    args = parser.parse_args()
+
+    encode = real_encoder() if args.real else simulated_encoder(args.overhead_ms, args.per_item_ms)
+
+    print(f"{args.clients} clients x {args.requests} requests")
+    print(f"{'mode':<26} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'mean batch':>11}")
+    qps, p50, p99 = load_test(lambda text: encode([text])[0], args.clients, args.requests)
+    print(f"{'unbatched':<26} {qps:>8.1f} {p50:>8.2f} {p99:>8.2f} {1.0:>11.1f}")
+
+    for wait in args.max_wait_ms:
+        batcher = EmbeddingBatcher(encode, max_batch_size=args.max_batch, max_wait_ms=wait)
+        qps, p50, p99 = load_test(lambda text: batcher.encode([text])[0], args.clients, args.requests)
+        label = f"batched (wait={wait:g}ms)"
+        print(f"{label:<26} {qps:>8.1f} {p50:>8.2f} {p99:>8.2f} {batcher.stats()['mean_batch_size']:>11.1f}")
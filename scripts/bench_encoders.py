@@ -0,0 +1,117 @@
+"""
+scripts/bench_encoders.py
+-------------------------
+Query encoding throughput and latency per encoder backend (backend/encoders.py)
+on the CPU:
+    - sentence-transformers  PyTorch all-MiniLM-L6-v2
+    - onnx-int8 / onnx-fp32  the exported model on ONNX Runtime (run
+                             scripts/export_onnx_encoder.py first)
+    - hash                   deterministic test encoder
+
+For every backend and intra-op thread setting (0 = library default), reports:
+    - serial:     one client encoding one query at a time (per-query latency)
+    - concurrent: N client threads encoding single queries at once, as Flask
+                  request threads do without the micro-batcher
+Backends whose dependencies or model files are missing are skipped.
+For the ONNX backends, also reports the cosine similarity to the PyTorch
+embeddings of the same queries.
+
+Usage:
+    python scripts/bench_encoders.py --threads 0 1 4 --clients 8
+    python scripts/bench_encoders.py --backends hash onnx-int8
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from encoders import make_encoder  # noqa: E402
+
+EMBED_MODEL = "all-MiniLM-L6-v2"
+BACKENDS = ("sentence-transformers", "onnx-int8", "onnx-fp32", "hash")
+
+TOPICS = ["potassium", "phosphorus", "sodium", "fluid", "protein", "anemia", "hypertension", "dialysis"]
+ASKS = ["What is a safe daily {} intake for stage {} CKD?", "How should {} be managed after stage {} diagnosis?",
+        "Which foods raise {} levels in stage {} kidney disease?"]
+
+
+def queries(n):
+    return [ASKS[i % len(ASKS)].format(TOPICS[i % len(TOPICS)], 1 + i % 5) + f" (case {i})" for i in range(n)]
+
+
+def build(backend, threads, onnx_dir):
+    kind = "onnx" if backend.startswith("onnx") else backend
+    return make_encoder(kind, EMBED_MODEL, threads=threads, onnx_dir=onnx_dir, quantized=backend != "onnx-fp32")
+
+
+def serial(encoder, texts):
+    latencies = []
+    t0 = time.perf_counter()
+    for text in texts:
+        s = time.perf_counter()
+        encoder.encode([text])
+        latencies.append((time.perf_counter() - s) * 1000)
+    return len(texts) / (time.perf_counter() - t0), latencies
+
+
+def concurrent(encoder, texts, clients):
+    latencies = []
+    lock = threading.Lock()
+
+    def client(cid):
+        local = []
+        for text in texts[cid::clients]:
+            s = time.perf_counter()
+            encoder.encode([text])
+            local.append((time.perf_counter() - s) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    pool = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    t0 = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return len(texts) / (time.perf_counter() - t0), latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--threads", type=int, nargs="+", default=[0, 1, 4], help="Intra-op thread settings")
+    parser.add_argument("--queries", type=int, default=400)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--onnx-dir", default=os.getenv("RAG_ONNX_DIR", f"data/models/{EMBED_MODEL}-onnx"))
+    args = parser.parse_args()
+
+    texts = queries(args.queries)
+    print(f"{args.queries} queries, {os.cpu_count()} CPUs, {args.clients} concurrent clients")
+    print(f"{'backend':<22} {'threads':>7} {'load s':>7} {'serial q/s':>11} {'p50 ms':>7} {'p99 ms':>7} "
+          f"{'conc q/s':>9} {'p99 ms':>7} {'cos vs pt':>9}")
+    reference = None
+    for backend in args.backends:
+        for threads in args.threads:
+            t0 = time.perf_counter()
+            try:
+                encoder = build(backend, threads, args.onnx_dir)
+            except (ImportError, FileNotFoundError) as e:
+                print(f"{backend:<22} skipped: {e}")
+                break
+            load_s = time.perf_counter() - t0
+            encoder.encode(texts[:8])  # warm up
+            s_qps, s_lat = serial(encoder, texts)
+            c_qps, c_lat = concurrent(encoder, texts, args.clients)
+            vectors = encoder.encode(texts[:64])
+            if backend == "sentence-transformers" and reference is None:
+                reference = vectors
+            cos = (f"{float(np.mean(np.sum(vectors * reference, axis=1))):.4f}"
+                   if backend.startswith("onnx") and reference is not None else "-")
+            print(f"{backend:<22} {threads:>7} {load_s:>7.2f} {s_qps:>11.1f} {np.percentile(s_lat, 50):>7.2f} "
+                  f"{np.percentile(s_lat, 99):>7.2f} {c_qps:>9.1f} {np.percentile(c_lat, 99):>7.2f} {cos:>9}")
@@ -0,0 +1,107 @@
+"""
+scripts/bench_index_swap.py
+---------------------------
+Retrieval latency while the reference index is hot-swapped.
+
+Publishes a synthetic index version in a temporary REF_INDEX_DIR, serves
+retrieve() from N client threads, then publishes a second version and swaps
+it in with rag.reload_index() (load + validate + warm in the background).
+Reports p50 / p99 retrieval latency before, during and after the swap, and
+checks that every request got a complete result from one version.
+
+Queries are embedded by the hash test encoder (backend/encoders.py) instead
+of the sentence-transformer, so only index search and the swap are measured.
+
+Usage:
+    python scripts/bench_index_swap.py --n 200000 --clients 8
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+
+def publish(root, n, dim, seed):
+    from ref_index import new_version_dir, publish_version, write_index
+    rng = np.random.default_rng(seed)
+    path = new_version_dir(root)
+    chunks = [f"version {seed} chunk {i} potassium sodium creatinine" for i in range(n)]
+    write_index(path, chunks, rng.standard_normal((n, dim), dtype=np.float32), model_name=f"hash-{dim}")
+    publish_version(root, path)
+    return os.path.basename(path)
+
+
+def pct(values, q):
+    return float(np.percentile(values, q)) if len(values) else float("nan")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=200000, help="Chunks per index version")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=3.0, help="Load before and after the swap")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="index_swap_bench_")
+    os.environ.update(REF_INDEX_DIR=tmp, RAG_HYBRID="0", RAG_CACHE_SIZE="0", RAG_INDEX_CHECK_INTERVAL="3600")
+    import rag  # noqa: E402  (reads the environment above at import)
+    from encoders import HashEncoder  # noqa: E402
+
+    v1 = publish(tmp, args.n, args.dim, seed=1)
+    rag.model = HashEncoder(args.dim)
+    rag._ref = rag._load_reference()
+    rag._ready.set()
+
+    samples = []  # (start time, latency ms, version served, results)
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def client(cid):
+        local, i = [], 0
+        while not stop.is_set():
+            q = f"client {cid} question {i} potassium"
+            t0 = time.perf_counter()
+            ref = rag._current_reference()
+            res = rag.retrieve(q, top_k=3)
+            local.append((t0, (time.perf_counter() - t0) * 1000, ref.version, len(res)))
+            i += 1
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(args.clients)]
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+
+    v2 = publish(tmp, args.n, args.dim, seed=2)
+    swap_start = time.perf_counter()
+    result = rag.reload_index()
+    swap_end = time.perf_counter()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    assert result["version"] == v2 and all(n == 3 for *_, n in samples)
+    windows = {
+        "before": [ms for t0, ms, *_ in samples if t0 < swap_start],
+        "during": [ms for t0, ms, *_ in samples if swap_start <= t0 < swap_end],
+        "after": [ms for t0, ms, *_ in samples if t0 >= swap_end],
+    }
+    print(f"{args.n} chunks x {args.dim}, {args.clients} clients; {v1} -> {v2} "
+          f"swapped in {result['seconds']:.2f}s (load + validate + warm)")
+    print(f"{'window':<8} {'requests':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, lat in windows.items():
+        print(f"{name:<8} {len(lat):>9} {pct(lat, 50):>8.2f} {pct(lat, 99):>8.2f} {max(lat, default=float('nan')):>8.2f}")
+    served = sorted({v for *_, v, _ in samples})
+    print(f"versions served: {served}; removed after swap: {result['removed_versions'] or 'none'}")
+    shutil.rmtree(tmp, ignore_errors=True)
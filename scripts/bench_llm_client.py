@@ -0,0 +1,122 @@
+"""
+scripts/bench_llm_client.py
+---------------------------
+Load test of the LLM answer stage (backend/llm_client.py) against the local
+mock OpenAI server (scripts/mock_openai_server.py), started here on --port.
+
+C client threads each call rag.answer_with_llm() R times with a fixed
+per-request deadline, as /clinical does. The mock can fail (503) or stall a
+share of requests. Reports answer latency (p50 / p99 / max), how many
+answers came from the LLM and how many fell back to reference excerpts,
+the wait for a concurrency slot and the client's retry / timeout counters.
+With a stalled upstream, the max latency should stay near the deadline.
+
+Usage:
+    python scripts/bench_llm_client.py --clients 32 --max-concurrency 8 --deadline 3
+    python scripts/bench_llm_client.py --fail-rate 0.3 --stall-rate 0.1 --stream
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import requests
+
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(SCRIPTS), "backend"))
+
+CONTEXTS = [
+    {"id": 10, "document": "Limit potassium to 2000-3000 mg per day in stage 3-4 CKD. Avoid salt substitutes.",
+     "score": 0.61},
+    {"id": 11, "document": "Avoid salt substitutes. They contain potassium chloride.", "score": 0.55},
+]
+
+
+def start_mock(args):
+    cmd = [sys.executable, os.path.join(SCRIPTS, "mock_openai_server.py"), "--port", str(args.port),
+           "--first-token-ms", str(args.first_token_ms), "--token-delay-ms", str(args.token_delay_ms),
+           "--fail-rate", str(args.fail_rate), "--stall-rate", str(args.stall_rate), "--stall-ms", "60000"]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            requests.get(f"http://127.0.0.1:{args.port}/", timeout=0.2)
+            return proc
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("mock OpenAI server did not start")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=10, help="Answers per client")
+    parser.add_argument("--deadline", type=float, default=3.0, help="Per-request budget (seconds)")
+    parser.add_argument("--max-concurrency", type=int, default=8, help="LLM_MAX_CONCURRENCY")
+    parser.add_argument("--retries", type=int, default=2, help="LLM_MAX_RETRIES")
+    parser.add_argument("--stream", action="store_true", help="Stream answers (time to the full answer is measured)")
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--first-token-ms", type=float, default=300.0)
+    parser.add_argument("--token-delay-ms", type=float, default=5.0)
+    parser.add_argument("--fail-rate", type=float, default=0.1)
+    parser.add_argument("--stall-rate", type=float, default=0.05)
+    args = parser.parse_args()
+
+    os.environ.update(OPENAI_API_KEY="sk-local", OPENAI_API_BASE=f"http://127.0.0.1:{args.port}/v1",
+                      LLM_MAX_CONCURRENCY=str(args.max_concurrency), LLM_MAX_RETRIES=str(args.retries),
+                      ANSWER_CACHE_PATH="")
+    import metrics  # noqa: E402
+    import rag  # noqa: E402  (reads the environment above at import)
+    from llm_client import client  # noqa: E402
+
+    mock = start_mock(args)
+    latencies, fallbacks = [], 0
+    lock = threading.Lock()
+
+    def worker(cid):
+        global fallbacks
+        local, fell_back = [], 0
+        for i in range(args.requests):
+            t0 = time.perf_counter()
+            answer = rag.answer_with_llm("Name: Test. Primary diagnosis: CKD stage 3.", f"Question {cid}-{i}?",
+                                         CONTEXTS, timeout=args.deadline, stream=args.stream)
+            if args.stream:
+                answer = "".join(answer)
+            local.append(time.perf_counter() - t0)
+            fell_back += answer.startswith("Top reference excerpts")
+        with lock:
+            latencies.extend(local)
+            fallbacks += fell_back
+
+    try:
+        threads = [threading.Thread(target=worker, args=(c,)) for c in range(args.clients)]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - t0
+    finally:
+        mock.kill()
+
+    lat = np.array(latencies)
+    stats = client.stats()
+    queue_sum, queue_count = 0.0, 0
+    for line in metrics.LLM_QUEUE_SECONDS.samples():
+        if line.startswith("llm_queue_wait_seconds_sum"):
+            queue_sum = float(line.split()[-1])
+        elif line.startswith("llm_queue_wait_seconds_count"):
+            queue_count = int(line.split()[-1])
+    print(f"{args.clients} clients x {args.requests} answers, deadline {args.deadline:.1f}s, "
+          f"max_concurrency={args.max_concurrency}, retries={args.retries}, stream={args.stream}; "
+          f"mock: fail {args.fail_rate:.0%}, stall {args.stall_rate:.0%}")
+    print(f"answers/s {len(lat) / wall:.1f} | latency p50 {np.percentile(lat, 50):.2f}s "
+          f"p99 {np.percentile(lat, 99):.2f}s max {lat.max():.2f}s")
+    print(f"LLM answers {len(lat) - fallbacks} | excerpt fallbacks {fallbacks} ({fallbacks / len(lat):.1%})")
+    print(f"slot wait mean {queue_sum / max(queue_count, 1) * 1000:.0f} ms | calls {stats['calls']} "
+          f"retries {stats['retries']} failures {stats['failures']} timeouts {stats['timeouts']} "
+          f"rejected {stats['rejected']}")
@@ -0,0 +1,91 @@
+"""
+scripts/bench_logging.py
+------------------------
+Request-path cost of logging under concurrency (backend/logging_config.py).
+
+N threads each emit M records shaped like the /clinical log lines, with
+handlers attached directly to the root logger (file I/O and rotation under
+the handler lock in every request thread) and with the queue mode (request
+threads only enqueue; a listener thread writes). Reports the time each
+logging call costs the calling thread (mean / p50 / p99) and, for the queue
+mode, how long the listener needed to drain afterwards.
+
+Records go to a temporary log file with a small rotation size, so rotation
+happens during the run; console output is discarded.
+
+Usage:
+    python scripts/bench_logging.py --threads 16 --records 2000
+    python scripts/bench_logging.py --format text
+"""
+
+import argparse
+import logging
+import logging.handlers
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import logging_config  # noqa: E402
+
+logger = logging.getLogger("bench")
+
+
+def run(threads, records, use_queue, fmt, path, queue_size):
+    logging_config.configure_logging(fmt=fmt, use_queue=use_queue, path=path, queue_size=queue_size)
+    for h in logging_config._listener.handlers if use_queue else logging_config._handlers:
+        if isinstance(h, logging.handlers.RotatingFileHandler):
+            h.maxBytes = 1 << 20  # rotate often, as a busy server would
+    latencies = []
+    lock = threading.Lock()
+    start = threading.Barrier(threads + 1)
+
+    def worker(tid):
+        logging_config.set_request_id(f"req-{tid}")
+        timings = {"patient_lookup": 0.02, "query_encoding": 7.6, "similarity_search": 0.2}
+        local = []
+        start.wait()
+        for i in range(records):
+            t0 = time.perf_counter()
+            logger.info("Clinical timings patient=P%03d total_ms=%.2f stages=%s used_web=%s", i % 30, 9.5,
+                        timings, False, extra={"stage_timings": timings, "total_ms": 9.5})
+            local.append((time.perf_counter() - t0) * 1e6)
+        with lock:
+            latencies.extend(local)
+
+    pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for t in pool:
+        t.start()
+    start.wait()
+    t0 = time.perf_counter()
+    for t in pool:
+        t.join()
+    emit_s = time.perf_counter() - t0
+    logging_config.shutdown_logging()  # waits for the listener to drain the queue
+    total_s = time.perf_counter() - t0
+    return np.array(latencies), emit_s, total_s, logging_config.stats()["dropped"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--records", type=int, default=2000, help="Records per thread")
+    parser.add_argument("--format", choices=["json", "text"], default="json")
+    parser.add_argument("--queue-size", type=int, default=0, help="LOG_QUEUE_SIZE for the queue mode (0 = unbounded)")
+    args = parser.parse_args()
+
+    sys.stderr = open(os.devnull, "w")  # console handler output
+    print(f"{args.threads} threads x {args.records} records, format={args.format}")
+    print(f"{'mode':<8} {'mean us':>9} {'p50 us':>9} {'p99 us':>9} {'emit s':>8} {'drained s':>10} {'dropped':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode, use_queue in (("direct", False), ("queue", True)):
+            path = os.path.join(tmp, f"{mode}.log")
+            lat, emit_s, total_s, dropped = run(args.threads, args.records, use_queue, args.format, path,
+                                                 args.queue_size)
+            print(f"{mode:<8} {lat.mean():>9.1f} {np.percentile(lat, 50):>9.1f} {np.percentile(lat, 99):>9.1f} "
+                  f"{emit_s:>8.2f} {total_s:>10.2f} {dropped:>8}")
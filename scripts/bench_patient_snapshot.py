@@ -0,0 +1,105 @@
+"""
+scripts/bench_patient_snapshot.py
+---------------------------------
+Cold load time and resident memory of the two patient storage layouts:
+    - json      one pretty-printed JSON file per patient (PatientStore)
+    - snapshot  one columnar file with interned, dictionary-encoded fields
+                (SnapshotPatientStore, see backend/patient_snapshot.py)
+
+Each layout is loaded in a fresh child process. Memory is that process's
+resident set after loading minus before, and its peak RSS. Both stores
+build the same NameIndex, so the difference comes from the records.
+
+Usage:
+    python scripts/bench_patient_snapshot.py --sizes 100000 1000000
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from bench_patient_store import generate  # noqa: E402
+from patient_snapshot import write_snapshot  # noqa: E402
+from patient_tool import PatientStore, SnapshotPatientStore  # noqa: E402
+
+
+def rss_mb():
+    """Current resident set size of this process (Linux)."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+
+def child(kind, path):
+    """Load one store and print {"load_s", "rss_mb", "peak_mb", "count"} as JSON."""
+    import gc
+    import resource
+    gc.collect()
+    before = rss_mb()
+    t0 = time.perf_counter()
+    if kind == "json":
+        store = PatientStore(data_dir=path, refresh_interval=3600)
+    else:
+        store = SnapshotPatientStore(path=path, refresh_interval=3600)
+    store.refresh(force=True)
+    load_s = time.perf_counter() - t0
+    gc.collect()
+    assert store.get("P000001") is not None
+    print(json.dumps({
+        "load_s": load_s,
+        "rss_mb": rss_mb() - before,
+        "peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "count": len(store),
+    }))
+
+
+def measure(kind, path):
+    out = subprocess.run([sys.executable, __file__, "--child", kind, path], check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def run(n):
+    tmp = tempfile.mkdtemp(prefix="patients_snapshot_bench_")
+    try:
+        print(f"\n== {n} patients ==")
+        data_dir = os.path.join(tmp, "patients")
+        os.makedirs(data_dir)
+        generate(data_dir, n)
+        snapshot = os.path.join(tmp, "patients.snapshot.json")
+        store = PatientStore(data_dir=data_dir, refresh_interval=3600)
+        t0 = time.perf_counter()
+        write_snapshot(snapshot, store.all())
+        print(f"  converted in {time.perf_counter() - t0:.2f}s")
+        del store
+
+        dir_bytes = sum(e.stat().st_size for e in os.scandir(data_dir))
+        sizes = {"json": dir_bytes, "snapshot": os.path.getsize(snapshot)}
+        print(f"  {'layout':<10} {'on disk MB':>11} {'load s':>8} {'RSS MB':>8} {'peak MB':>8}")
+        for kind, path in (("json", data_dir), ("snapshot", snapshot)):
+            r = measure(kind, path)
+            assert r["count"] == n
+            print(f"  {kind:<10} {sizes[kind] / 1e6:>11.1f} {r['load_s']:>8.2f} {r['rss_mb']:>8.0f} {r['peak_mb']:>8.0f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--child", nargs=2, metavar=("KIND", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+    else:
+        random.seed(args.seed)
+        for n in args.sizes:
+            run(n)
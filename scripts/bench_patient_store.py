@@ -0,0 +1,131 @@
+"""
+scripts/bench_patient_store.py
+------------------------------
+Benchmark patient lookups at scale.
+
+Generates N synthetic patient JSON files in a temporary directory and compares:
+    - the old path (re-list and re-parse the directory on every lookup)
+    - PatientStore (load once, hash index by patient_id, ranked NameIndex)
+
+Also times an incremental refresh after a single file is modified.
+
+Usage:
+    python scripts/bench_patient_store.py --sizes 10000 100000
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from patient_tool import PatientStore  # noqa: E402
+
+NAMES = [
+    "John Smith", "Rohit Kumar", "Anita Sharma", "Priya Patel", "Arjun Rao",
+    "Fatima Khan", "Liu Wei", "Carlos Diaz", "Maria Silva", "Asha Nair"
+]
+
+
+def generate(data_dir, n):
+    """Write n dummy patient files shaped like scripts/generate_dummy_patients.py."""
+    for i in range(1, n + 1):
+        record = {
+            "patient_id": f"P{i:06d}",
+            "patient_name": f"{random.choice(NAMES)} {i}",
+            "discharge_date": "2024-07-08",
+            "primary_diagnosis": "Chronic Kidney Disease Stage 3",
+            "medications": ["Lisinopril 10mg daily"],
+            "dietary_restrictions": "Low sodium, fluid restriction 1.5L/day",
+            "follow_up": "Nephrology clinic in 2 weeks",
+            "warning_signs": "Swelling, shortness of breath, decreased urine output",
+            "discharge_instructions": "Monitor blood pressure daily; weigh yourself daily."
+        }
+        with open(os.path.join(data_dir, f"{record['patient_id']}.json"), "w") as f:
+            json.dump(record, f, indent=2)
+
+
+def legacy_find_by_id(data_dir, pid):
+    """The pre-PatientStore lookup: list + parse every file per call."""
+    for fn in sorted(os.listdir(data_dir)):
+        if fn.endswith(".json"):
+            with open(os.path.join(data_dir, fn)) as f:
+                p = json.load(f)
+            if p.get("patient_id") == pid:
+                return p
+    return None
+
+
+def timeit(fn, args_list):
+    """Run fn over args_list and return per-call latencies in microseconds."""
+    out = []
+    for args in args_list:
+        t0 = time.perf_counter()
+        fn(*args)
+        out.append((time.perf_counter() - t0) * 1e6)
+    return out
+
+
+def summarize(label, lat_us):
+    lat_us = sorted(lat_us)
+    p99 = lat_us[min(len(lat_us) - 1, int(len(lat_us) * 0.99))]
+    print(f"  {label:<28} mean={statistics.mean(lat_us):>12.1f}us  p99={p99:>12.1f}us  (n={len(lat_us)})")
+
+
+def run(n, lookups, legacy_lookups):
+    tmp = tempfile.mkdtemp(prefix="patients_bench_")
+    try:
+        print(f"\n== {n} patients ==")
+        t0 = time.perf_counter()
+        generate(tmp, n)
+        print(f"  generated in {time.perf_counter() - t0:.2f}s")
+
+        ids = [(f"P{random.randint(1, n):06d}",) for _ in range(lookups)]
+
+        if legacy_lookups:
+            summarize("legacy find_by_id", timeit(lambda pid: legacy_find_by_id(tmp, pid), ids[:legacy_lookups]))
+
+        store = PatientStore(data_dir=tmp, refresh_interval=3600)
+        t0 = time.perf_counter()
+        store.refresh(force=True)
+        print(f"  PatientStore cold load      {time.perf_counter() - t0:.2f}s")
+
+        summarize("PatientStore.get", timeit(store.get, ids))
+        names = [(f"{random.choice(NAMES)} {random.randint(1, n)}",) for _ in range(lookups)]
+        summarize("search_name (full name)", timeit(store.search_name, names))
+        typos = [(f"{random.choice(NAMES)[:-1]}x {random.randint(1, n)}",) for _ in range(lookups)]
+        summarize("search_name (typo + id)", timeit(store.search_name, typos))
+        prefixes = [(random.choice(NAMES)[:4],) for _ in range(min(lookups, 200))]
+        summarize("search_name (broad prefix)", timeit(store.search_name, prefixes))
+
+        # Incremental refresh: touch one file, force a rescan
+        path = os.path.join(tmp, "P000001.json")
+        with open(path) as f:
+            rec = json.load(f)
+        rec["follow_up"] = "Nephrology clinic in 1 week"
+        with open(path, "w") as f:
+            json.dump(rec, f)
+        t0 = time.perf_counter()
+        store.refresh(force=True)
+        print(f"  incremental refresh (1 file) {time.perf_counter() - t0:.3f}s")
+        assert store.get("P000001")["follow_up"] == "Nephrology clinic in 1 week"
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--lookups", type=int, default=10000)
+    parser.add_argument("--legacy-lookups", type=int, default=5,
+                        help="Lookups to time on the old rescan path (slow; 0 to skip)")
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        run(n, args.lookups, args.legacy_lookups)
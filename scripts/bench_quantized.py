@@ -0,0 +1,86 @@
+"""
+scripts/bench_quantized.py
+--------------------------
+Recall@k, latency and memory of the quantized index backends (int8, binary)
+against exact float32 search.
+
+Memory is the size of the structure each backend has to keep resident:
+the float32 matrix for exact search, the codes for the quantized ones
+(their float vectors stay memory-mapped and only shortlisted rows are read).
+
+Uses the synthetic clustered corpus from bench_ann.py by default.
+Pass --index-dir to benchmark a real index written by scripts/ingest_reference.py.
+
+Usage:
+    python scripts/bench_quantized.py --n 200000 --rescore 0 16 32 64 200
+    python scripts/bench_quantized.py --index-dir data/reference_index
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from bench_ann import run_queries, synthetic_corpus  # noqa: E402
+from ref_index import current_version_dir, load_index, normalize_rows  # noqa: E402
+from vector_index import BinaryIndex, ExactIndex, Int8Index, top_k_indices  # noqa: E402
+
+
+class CodesOnly:
+    """First pass alone: rank by the codes, no float rescoring."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def search(self, query, k):
+        return top_k_indices(self.index.approx_scores(query), k), None
+
+
+def recall(got, truth, k):
+    return float(np.mean([len(set(a) & set(b)) / k for a, b in zip(got, truth)]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=200000, help="Synthetic corpus size")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--rescore", type=int, nargs="+", default=[0, 16, 64, 200, 500, 1000],
+                        help="Shortlist sizes to rescore (0 = rank by codes only, no rescoring)")
+    parser.add_argument("--index-dir", default=None, help="Use a real reference index instead")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.index_dir:
+        _, embeddings, _ = load_index(current_version_dir(args.index_dir))
+    else:
+        embeddings = synthetic_corpus(args.n, args.dim, max(16, args.n // 500), rng)
+    n, dim = embeddings.shape
+    picks = rng.choice(n, args.queries, replace=False)
+    queries = normalize_rows(np.asarray(embeddings[picks]) + 0.05 * rng.standard_normal((args.queries, dim), dtype=np.float32))
+
+    truth, t_mean, t_p99 = run_queries(ExactIndex(embeddings), queries, args.k)
+    float_bytes = n * dim * 4
+    print(f"{n} vectors x {dim}, k={args.k}, {args.queries} queries")
+    print(f"{'backend':<20} {'recall@k':>9} {'mean ms':>9} {'p99 ms':>9} {'memory MB':>10} {'ratio':>7}")
+    print(f"{'exact float32':<20} {1.0:>9.3f} {t_mean:>9.3f} {t_p99:>9.3f} {float_bytes / 1e6:>10.1f} {1.0:>7.1f}")
+
+    for cls in (Int8Index, BinaryIndex):
+        t0 = time.perf_counter()
+        index = cls.build(embeddings)
+        build_s = time.perf_counter() - t0
+        for rescore in args.rescore:
+            if rescore == 0:
+                got, mean, p99 = run_queries(CodesOnly(index), queries, args.k)
+                label = f"{cls.name} codes only"
+            else:
+                got, mean, p99 = run_queries(index, queries, args.k, rescore=rescore)
+                label = f"{cls.name} rescore={rescore}"
+            print(f"{label:<20} {recall(got, truth, args.k):>9.3f} {mean:>9.3f} {p99:>9.3f} "
+                  f"{index.nbytes / 1e6:>10.1f} {float_bytes / index.nbytes:>7.1f}")
+        print(f"  ({cls.name} codes built in {build_s:.2f}s)")
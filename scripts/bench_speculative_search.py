@@ -0,0 +1,102 @@
+"""
+scripts/bench_speculative_search.py
+-----------------------------------
+Latency and provider cost of SPECULATIVE_WEB_SEARCH, in process and without
+a network: pipeline.retrieve_with_fallback() runs with a retrieval that
+sleeps --retrieval-ms and a WebSearchClient whose provider sleeps --web-ms.
+
+C client threads each ask R uncached questions; a share --low-rate of them
+has RAG confidence below WEB_FALLBACK_THRESHOLD and needs the web search.
+For speculation off and on, reports latency (mean / p50 / p99) of the
+low-confidence questions and of all questions, provider calls started, and
+low-confidence questions that got no web results because every search slot
+(--max-concurrency, WEB_SEARCH_MAX_CONCURRENCY) was busy.
+
+Usage:
+    python scripts/bench_speculative_search.py --clients 1 --retrieval-ms 30 --web-ms 800
+    python scripts/bench_speculative_search.py --clients 8 --low-rate 0.2 --max-concurrency 4
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import pipeline  # noqa: E402
+from web_search import SearchProvider, WebSearchClient  # noqa: E402
+
+
+class SleepProvider(SearchProvider):
+    name = "sleep"
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def search(self, query, max_results, timeout):
+        time.sleep(min(self.delay, timeout))
+        return [{"title": query, "snippet": "", "url": "https://example.org/"}][:max_results]
+
+
+def run(args, speculative):
+    """Returns (latency per question, low-confidence flag per question, search client, starved count)."""
+    client = WebSearchClient(SleepProvider(args.web_ms / 1000), timeout=5.0, max_concurrency=args.max_concurrency)
+    high, low = pipeline.WEB_FALLBACK_THRESHOLD + 0.2, pipeline.WEB_FALLBACK_THRESHOLD / 2
+    latencies, flags, starved = [], [], [0]
+    lock = threading.Lock()
+
+    def retrieve(question, top_k=3):
+        time.sleep(args.retrieval_ms / 1000)
+        return [{"id": 0, "document": question, "score": low if question.startswith("low") else high}]
+
+    def worker(cid):
+        rng = random.Random(cid)
+        local = []
+        for i in range(args.requests):
+            is_low = rng.random() < args.low_rate
+            question = f"{'low' if is_low else 'high'} {cid}-{i}"
+            t0 = time.perf_counter()
+            _, web, _ = pipeline.retrieve_with_fallback(
+                question, retrieve, lambda c: max(r["score"] for r in c), client.search, pipeline.Deadline(20),
+                speculative=speculative)
+            local.append((time.perf_counter() - t0, is_low, is_low and not web))
+        with lock:
+            for secs, is_low, no_web in local:
+                latencies.append(secs)
+                flags.append(is_low)
+                starved[0] += no_web
+
+    threads = [threading.Thread(target=worker, args=(c,)) for c in range(args.clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    time.sleep(args.web_ms / 1000)  # let abandoned searches finish before the next mode
+    return np.array(latencies), np.array(flags), client, starved[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=25, help="Questions per client")
+    parser.add_argument("--retrieval-ms", type=float, default=30.0, help="Query encoding + similarity search")
+    parser.add_argument("--web-ms", type=float, default=800.0, help="One web search")
+    parser.add_argument("--low-rate", type=float, default=0.2, help="Share of questions below the threshold")
+    parser.add_argument("--max-concurrency", type=int, default=4, help="WEB_SEARCH_MAX_CONCURRENCY")
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients x {args.requests} questions, retrieval {args.retrieval_ms:.0f} ms, "
+          f"web {args.web_ms:.0f} ms, low confidence {args.low_rate:.0%}, {args.max_concurrency} search slots")
+    print(f"{'speculative':<12} {'low mean':>9} {'low p50':>8} {'low p99':>8} {'all mean':>9} {'all p99':>8} "
+          f"{'searches':>9} {'no web':>7}")
+    for speculative in (False, True):
+        lat, low, client, starved = run(args, speculative)
+        ms = lat * 1000
+        print(f"{'on' if speculative else 'off':<12} {ms[low].mean():>9.0f} {np.percentile(ms[low], 50):>8.0f} "
+              f"{np.percentile(ms[low], 99):>8.0f} {ms.mean():>9.0f} {np.percentile(ms, 99):>8.0f} "
+              f"{client.calls:>9} {starved:>7}")
@@ -0,0 +1,95 @@
+"""
+scripts/bench_startup.py
+------------------------
+Startup benchmark for the backend (backend/app.py).
+
+Each run starts a fresh Python process and measures, from process start:
+    - import_s        time to import backend/app.py (Flask app ready to serve)
+    - first_health_s  first GET /health answered
+    - receptionist_ms latency of a POST /receptionist issued while RAG is still loading
+    - ready_s         GET /ready first returns 200 (model + reference index loaded)
+    - model_load_s / index_load_s as reported by /ready
+
+Requests go through Flask's test client, so no port is needed. Run from the
+repository root (relative data paths), after scripts/ingest_reference.py.
+
+Usage:
+    python scripts/bench_startup.py --runs 3
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, {backend!r})
+import app as backend_app
+out = {{"import_s": time.perf_counter() - t0}}
+client = backend_app.app.test_client()
+
+resp = client.get("/health")
+out["first_health_s"] = time.perf_counter() - t0
+assert resp.status_code == 200, resp.status_code
+
+t = time.perf_counter()
+resp = client.post("/receptionist", json={{"patient_name": {patient!r}}})
+out["receptionist_ms"] = (time.perf_counter() - t) * 1000
+out["ready_during_receptionist"] = backend_app.is_ready()
+
+deadline = time.perf_counter() + {timeout}
+while True:
+    resp = client.get("/ready")
+    if resp.status_code == 200 or time.perf_counter() > deadline:
+        break
+    time.sleep(0.005)
+out["ready_s"] = time.perf_counter() - t0
+out.update({{k: v for k, v in resp.get_json().items() if k.endswith("_s")}})
+out["ready"] = resp.status_code == 200
+print("BENCH " + json.dumps(out))
+"""
+
+
+def run_once(patient, timeout):
+    code = CHILD.format(backend=BACKEND, patient=patient, timeout=timeout)
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    for line in proc.stdout.splitlines():
+        if line.startswith("BENCH "):
+            result = json.loads(line[len("BENCH "):])
+            result["process_wall_s"] = wall
+            return result
+    raise RuntimeError(f"benchmark child failed:\n{proc.stderr[-2000:]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--patient", default="P001", help="Name or ID sent to /receptionist")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Seconds to wait for /ready")
+    args = parser.parse_args()
+
+    results = [run_once(args.patient, args.timeout) for _ in range(args.runs)]
+    if not all(r["ready"] for r in results):
+        print("warning: /ready did not return 200 in at least one run (see /ready 'error')")
+
+    print(f"{'metric':<28}{'median':>10}{'min':>10}{'max':>10}")
+    for key in ("import_s", "first_health_s", "receptionist_ms", "ready_s",
+                "model_load_s", "index_load_s", "process_wall_s"):
+        values = [r[key] for r in results if key in r]
+        if values:
+            print(f"{key:<28}{statistics.median(values):>10.3f}{min(values):>10.3f}{max(values):>10.3f}")
+    served_early = sum(not r["ready_during_receptionist"] for r in results)
+    print(f"receptionist answered before RAG was ready in {served_early}/{len(results)} runs")
+
+
+if __name__ == "__main__":
+    main()
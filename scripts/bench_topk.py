@@ -0,0 +1,63 @@
+"""
+scripts/bench_topk.py
+---------------------
+Micro-benchmark for the top-k selection step of rag.retrieve().
+
+Compares the previous full sort (np.argsort(sims)[::-1][:k]) with the
+argpartition-based top_k_indices() on random similarity vectors.
+The mat-vec that produces the scores is timed too, for context.
+
+Usage:
+    python scripts/bench_topk.py --sizes 10000 100000 1000000 --k 3
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from vector_index import top_k_indices  # noqa: E402
+
+
+def argsort_top_k(sims, k):
+    """Implementation used by retrieve() before top_k_indices()."""
+    return np.argsort(sims)[::-1][:k]
+
+
+def best_of(fn, repeats):
+    """Median wall time of fn() in milliseconds."""
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return float(np.median(times))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'chunks':>10} {'matvec ms':>10} {'argsort ms':>11} {'argpartition ms':>16} {'speedup':>8}")
+    for n in args.sizes:
+        emb = rng.standard_normal((n, args.dim), dtype=np.float32)
+        q = rng.standard_normal(args.dim, dtype=np.float32)
+        sims = emb @ q
+
+        # Both paths must agree on the winners
+        assert set(argsort_top_k(sims, args.k)) == set(top_k_indices(sims, args.k))
+
+        t_mv = best_of(lambda: emb @ q, args.repeats)
+        t_sort = best_of(lambda: argsort_top_k(sims, args.k), args.repeats)
+        t_part = best_of(lambda: top_k_indices(sims, args.k), args.repeats)
+        print(f"{n:>10} {t_mv:>10.3f} {t_sort:>11.3f} {t_part:>16.3f} {t_sort / t_part:>7.1f}x")
+        del emb
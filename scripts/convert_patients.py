@@ -0,0 +1,35 @@
+"""
+scripts/convert_patients.py
+---------------------------
+One-shot converter from the per-patient JSON directory (data/patients/) to
+the single-file columnar snapshot (see backend/patient_snapshot.py).
+
+Serve from the snapshot with:
+    PATIENT_STORE=snapshot python backend/app.py
+
+Usage:
+    python scripts/convert_patients.py [--input data/patients] [--out data/patients.snapshot.json]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from patient_snapshot import write_snapshot  # noqa: E402
+from patient_tool import DATA_DIR, SNAPSHOT_PATH, PatientStore  # noqa: E402
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", default=DATA_DIR, help="Directory of patient JSON files")
+    parser.add_argument("--out", default=SNAPSHOT_PATH, help="Snapshot file to write")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    store = PatientStore(data_dir=args.input)
+    store.refresh(force=True)
+    count = write_snapshot(args.out, store.all())
+    print(f"Wrote {count} patients to {args.out} ({os.path.getsize(args.out) / 1e6:.1f} MB) "
+          f"in {time.perf_counter() - t0:.2f}s")
@@ -0,0 +1,87 @@
+"""
+scripts/eval_context_packing.py
+-------------------------------
+Prompt size with and without context packing (backend/context_packing.py),
+for the same retrieved chunks.
+
+For every question, the top-k chunks are retrieved once and the reference
+context section is built three ways:
+    - cut:    every chunk, first 1200 characters, one source each (the
+              layout compose_prompt used before packing; loses chunk tails)
+    - full:   every chunk in full, one source each
+    - packed: neighbouring chunks merged, repeated sentences dropped, filled
+              to --budget tokens in relevance order
+Reports mean / p95 context tokens, mean full prompt tokens, the saving over
+the full layout and how many chunks packing had to leave out to stay in
+budget. Tokens are chunker.estimate_tokens counts (words and punctuation
+marks).
+
+Questions are those of scripts/eval_hybrid_fallback.py. Run from the
+repository root after scripts/ingest_reference.py.
+
+Usage:
+    python scripts/eval_context_packing.py --top-k 3 5 8 --budget 1000
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import rag  # noqa: E402
+from chunker import estimate_tokens  # noqa: E402
+from context_packing import pack_contexts  # noqa: E402
+from eval_hybrid_fallback import QUESTIONS, patient_questions  # noqa: E402
+
+PATIENT = "Name: Test Patient. Primary diagnosis: Chronic Kidney Disease Stage 3. Discharge instructions: Low sodium diet."
+
+
+def plain_context(contexts, max_chars=None):
+    return "".join(
+        f"[Source {i} | chunk:{c.get('id')} | score:{c.get('score'):.4f}]\n{c.get('document', '')[:max_chars]}\n\n"
+        for i, c in enumerate(contexts, start=1)
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions-file", default=None, help="One question per line (replaces the built-in set)")
+    parser.add_argument("--patients-dir", default="data/patients")
+    parser.add_argument("--top-k", type=int, nargs="+", default=[3, 5, 8])
+    parser.add_argument("--budget", type=int, default=rag.RAG_CONTEXT_TOKENS, help="Context token budget")
+    args = parser.parse_args()
+
+    if args.questions_file:
+        with open(args.questions_file) as f:
+            questions = [line.strip() for line in f if line.strip()]
+    else:
+        questions = QUESTIONS + patient_questions(args.patients_dir)
+
+    rag.init()
+    rag.RAG_CONTEXT_TOKENS = args.budget
+    prompt_overhead = estimate_tokens(rag.compose_prompt(PATIENT, "", [], None))
+    print(f"{len(questions)} questions, budget={args.budget} tokens, prompt template + patient ~{prompt_overhead} tokens")
+    print(f"{'top_k':>5} {'layout':<7} {'ctx mean':>9} {'ctx p95':>8} {'prompt mean':>12} {'saved':>7} "
+          f"{'blocks':>7} {'dropped':>8}")
+    for k in args.top_k:
+        cut, full, packed, prompts, blocks, dropped = [], [], [], [], [], []
+        for q in questions:
+            contexts = rag.retrieve(q, top_k=k)
+            cut.append(estimate_tokens(plain_context(contexts, 1200)))
+            full.append(estimate_tokens(plain_context(contexts)))
+            _, stats = pack_contexts(contexts, args.budget)
+            prompt = estimate_tokens(rag.compose_prompt(PATIENT, q, contexts, None))
+            prompts.append(prompt)
+            packed.append(prompt - estimate_tokens(rag.compose_prompt(PATIENT, q, [], None)))
+            blocks.append(stats["blocks"])
+            dropped.append(stats["dropped"])
+        base = np.array(prompts) - np.array(packed)  # template, patient and question
+        for layout, ctx in (("cut", cut), ("full", full), ("packed", packed)):
+            ctx = np.array(ctx)
+            saved = f"{1 - ctx.sum() / np.sum(full):.1%}" if layout != "full" else "-"
+            n_blocks, n_dropped = (np.mean(blocks), np.mean(dropped)) if layout == "packed" else (k, 0)
+            print(f"{k:>5} {layout:<7} {ctx.mean():>9.0f} {np.percentile(ctx, 95):>8.0f} {(base + ctx).mean():>12.0f} "
+                  f"{saved:>7} {n_blocks:>7.1f} {n_dropped:>8.2f}")
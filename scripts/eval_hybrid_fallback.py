@@ -0,0 +1,122 @@
+"""
+scripts/eval_hybrid_fallback.py
+-------------------------------
+Offline eval of hybrid (dense + BM25) retrieval: how often the web-search
+fallback fires (RAG confidence < WEB_FALLBACK_THRESHOLD) with dense-only
+retrieval and with hybrid retrieval, over the same questions. Both modes
+go through the public rag.retrieve() (the index is reloaded with
+RAG_HYBRID off, then on), and confidence is rag.rag_confidence(): the top
+cosine similarity of the returned chunks in both modes. The last lines
+count the questions whose confidence hybrid retrieval raised or lowered,
+and the fallbacks it removed or added.
+
+Questions are the generic follow-up questions below plus questions about
+every medication and diagnosis in data/patients (exact drug names are where
+dense-only retrieval misses most). Pass --questions-file for your own list,
+one question per line.
+
+Mean latency per question is estimated as retrieval time plus --web-ms for
+every question that falls back to web search.
+
+Run from the repository root after scripts/ingest_reference.py.
+
+Usage:
+    python scripts/eval_hybrid_fallback.py --web-ms 1500
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import rag  # noqa: E402
+from pipeline import WEB_FALLBACK_THRESHOLD  # noqa: E402
+
+QUESTIONS = [
+    "How much potassium can I have each day?",
+    "What should I do if my legs swell?",
+    "Can I take ibuprofen for pain?",
+    "How much fluid should I drink?",
+    "What are signs of a kidney infection?",
+    "Why is my creatinine high?",
+    "What does a low eGFR mean?",
+    "What foods are high in phosphorus?",
+    "When should I call my nephrologist?",
+    "How do I know if my blood pressure is too high?",
+]
+
+
+def patient_questions(patients_dir):
+    """Questions naming the drugs and diagnoses found in the patient records."""
+    drugs, diagnoses = set(), set()
+    for path in glob.glob(os.path.join(patients_dir, "*.json")):
+        with open(path) as f:
+            p = json.load(f)
+        for med in p.get("medications") or []:
+            name = re.split(r"\s+\d", med, maxsplit=1)[0].strip()
+            if name:
+                drugs.add(name)
+        if p.get("primary_diagnosis"):
+            diagnoses.add(p["primary_diagnosis"])
+    out = []
+    for drug in sorted(drugs):
+        out += [f"What are the side effects of {drug}?", f"Should I take {drug} with food?"]
+    for dx in sorted(diagnoses):
+        out.append(f"What is the prognosis for {dx}?")
+    return out
+
+
+def run(questions, top_k, hybrid):
+    """Returns (confidence per question, retrieval seconds per question) with RAG_HYBRID=`hybrid`."""
+    rag.RAG_HYBRID = hybrid
+    rag.reload_index(force=True)  # re-opens the index with or without BM25; clears cached results
+    for q in questions:
+        rag.embed_query(q)  # warm the embedding cache so neither mode pays for encoding
+    confidences, times = [], []
+    for q in questions:
+        t0 = time.perf_counter()
+        contexts = rag.retrieve(q, top_k=top_k)
+        times.append(time.perf_counter() - t0)
+        confidences.append(rag.rag_confidence(contexts))
+    return np.array(confidences), np.array(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions-file", default=None, help="One question per line (replaces the built-in set)")
+    parser.add_argument("--patients-dir", default="data/patients")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--web-ms", type=float, default=1500.0, help="Assumed cost of one web search")
+    parser.add_argument("--threshold", type=float, default=WEB_FALLBACK_THRESHOLD)
+    args = parser.parse_args()
+
+    if args.questions_file:
+        with open(args.questions_file) as f:
+            questions = [line.strip() for line in f if line.strip()]
+    else:
+        questions = list(dict.fromkeys(QUESTIONS + patient_questions(args.patients_dir)))
+
+    rag.init()
+    print(f"{len(questions)} questions, top_k={args.top_k}, threshold={args.threshold}, "
+          f"web search ~{args.web_ms:.0f} ms")
+    print(f"{'retrieval':<10} {'fallback':>9} {'rate':>7} {'mean cos':>9} {'search ms':>10} {'est. mean ms':>13}")
+    confs = {}
+    for label, hybrid in (("dense", False), ("hybrid", True)):
+        conf, secs = run(questions, args.top_k, hybrid)
+        confs[label] = conf
+        fired = conf < args.threshold
+        est_ms = secs.mean() * 1000 + fired.mean() * args.web_ms
+        print(f"{label:<10} {int(fired.sum()):>9} {fired.mean():>7.1%} {conf.mean():>9.4f} "
+              f"{secs.mean() * 1000:>10.2f} {est_ms:>13.1f}")
+    dense, hybrid = confs["dense"], confs["hybrid"]
+    print(f"confidence: higher with hybrid {int((hybrid > dense + 1e-6).sum())}, "
+          f"lower {int((hybrid < dense - 1e-6).sum())}")
+    print(f"fallbacks: removed by hybrid {int(((dense < args.threshold) & (hybrid >= args.threshold)).sum())}, "
+          f"added {int(((dense >= args.threshold) & (hybrid < args.threshold)).sum())}")
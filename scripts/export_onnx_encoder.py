@@ -0,0 +1,57 @@
+"""
+scripts/export_onnx_encoder.py
+------------------------------
+Export the embedding model to ONNX for the backend's RAG_ENCODER=onnx
+(see backend/encoders.py), from the locally cached sentence-transformers
+model (downloaded once if it is not cached yet).
+
+Writes to --out (default RAG_ONNX_DIR, data/models/all-MiniLM-L6-v2-onnx):
+    - model.onnx       float32 transformer
+    - model.int8.onnx  dynamically int8-quantized copy (unless --no-quantize)
+    - tokenizer.json   fast tokenizer
+    - encoder.json     model name, dim, max sequence length
+
+Then checks each exported model against the PyTorch embeddings of a few
+sample queries (mean cosine similarity).
+
+Needs: torch, sentence-transformers, onnx, onnxruntime.
+
+Usage:
+    python scripts/export_onnx_encoder.py
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from encoders import ONNX_INT8_FILE, ONNX_MODEL_FILE, OnnxEncoder, SentenceTransformerEncoder, export_onnx  # noqa: E402
+
+EMBED_MODEL = "all-MiniLM-L6-v2"
+
+SAMPLES = [
+    "What is a safe daily potassium intake for stage 3 CKD?",
+    "Phosphate binders and dietary phosphorus restriction in dialysis patients",
+    "Does a high protein diet speed up kidney function decline?",
+    "fluid restriction",
+]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=EMBED_MODEL)
+    parser.add_argument("--out", default=os.getenv("RAG_ONNX_DIR", f"data/models/{EMBED_MODEL}-onnx"))
+    parser.add_argument("--no-quantize", action="store_true", help="Skip the int8 copy")
+    args = parser.parse_args()
+
+    export_onnx(args.model, args.out, quantize=not args.no_quantize)
+    reference = SentenceTransformerEncoder(args.model).encode(SAMPLES)
+    for quantized, fn in ((False, ONNX_MODEL_FILE), (True, ONNX_INT8_FILE)):
+        path = os.path.join(args.out, fn)
+        if not os.path.exists(path):
+            continue
+        vectors = OnnxEncoder(args.out, quantized=quantized).encode(SAMPLES)
+        cos = np.sum(vectors * reference, axis=1)
+        print(f"{path}: {os.path.getsize(path) / 1e6:.1f} MB, cosine vs PyTorch mean {cos.mean():.4f} min {cos.min():.4f}")
@@ -0,0 +1,60 @@
+"""
+scripts/fake_search_server.py
+-----------------------------
+Local fake web-search provider for offline testing of backend/web_search.py.
+
+Serves GET /search?q=...&max_results=N with JSON
+{"results": [{"title", "snippet", "url"}, ...]}. Options inject latency and
+failures, so timeouts and the circuit breaker can be exercised.
+
+Usage:
+    python scripts/fake_search_server.py --port 8002 --delay-ms 200 --fail-rate 0.2
+
+Then start the backend against it:
+    WEB_SEARCH_PROVIDER=http WEB_SEARCH_URL=http://localhost:8002/search python backend/app.py
+"""
+
+import argparse
+import random
+import time
+
+from flask import Flask, jsonify, request
+
+app = Flask(__name__)
+settings = {"delay_ms": 0.0, "fail_rate": 0.0}
+stats = {"requests": 0}
+
+
+@app.route("/search", methods=["GET"])
+def search():
+    stats["requests"] += 1
+    time.sleep(settings["delay_ms"] / 1000)
+    if random.random() < settings["fail_rate"]:
+        return jsonify({"error": "injected failure"}), 503
+
+    query = request.args.get("q", "")
+    n = int(request.args.get("max_results", 3))
+    return jsonify({"results": [
+        {
+            "title": f"Result {i} for {query}",
+            "snippet": f"Fake snippet {i} about {query}.",
+            "url": f"https://example.org/search/{i}?q={query.replace(' ', '+')}",
+        }
+        for i in range(1, n + 1)
+    ]})
+
+
+@app.route("/stats", methods=["GET"])
+def get_stats():
+    return jsonify(stats)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--delay-ms", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    settings.update(delay_ms=args.delay_ms, fail_rate=args.fail_rate)
+    app.run(host=args.host, port=args.port, threaded=True)
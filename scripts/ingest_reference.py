@@ -1,88 +1,394 @@
 """
 Reference Ingestion Script
 --------------------------
-This script processes the nephrology reference PDF, splits it into text chunks,
+This script processes the nephrology reference PDFs, splits them into text chunks,
 and generates vector embeddings for Retrieval-Augmented Generation (RAG).
 
-Output:
-    - data/reference_embeddings.pkl
-      (contains {'chunks': [...], 'embeddings': [...]})
+Chunks end on sentence/paragraph boundaries, fit a token budget
+(--max-tokens, default 200) and record their document and page range
+(see backend/chunker.py).
+
+Pipeline:
+    - every PDF in the input directory is hashed (SHA-256); documents whose
+      hash is unchanged since the last run are skipped
+    - page text is extracted in a process pool and chunked in page order by
+      one chunker per document, so chunk overlap and sentences running over a
+      page break carry across worker tasks (and across checkpoints)
+    - chunks are streamed to the encoder in large batches and appended to
+      per-document staging files under <out>/staging/ as they are produced
+    - progress is checkpointed after every flush, so an interrupted run
+      resumes where it stopped
+    - the final index is assembled from the staging files into a new version
+      directory, its search structures are built, and the version is published
+      (CURRENT is replaced atomically); a running backend swaps it in without
+      a restart, and versions beyond --keep-versions are deleted
+
+Output (memory-mappable index, see backend/ref_index.py), in
+data/reference_index/versions/<version>/:
+    - embeddings.npy     L2-normalized float32 vectors
+    - chunks.bin         chunk texts (UTF-8)
+    - chunk_offsets.npy  byte offsets into chunks.bin
+    - chunk_docs.npy     source document per chunk
+    - chunk_pages.npy    source page range per chunk
+    - meta.json
+    - q8_*.npy, bin_codes.npy  int8 / binary quantized codes
+    - bm25_*.npy, bm25_vocab.json  BM25 inverted index (hybrid retrieval)
+    - ivf_*.npy          approximate (IVF) search index
+
+Set RAG_IVF_NLIST to override the number of IVF lists (default ~4*sqrt(n)).
 
 Usage:
-    python scripts/ingest_reference.py
+    python scripts/ingest_reference.py [--input data/reference] [--workers 4]
 """
 
+import argparse
+import hashlib
+import json
 import os
-import pickle
+import resource
+import shutil
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
 import fitz  # PyMuPDF for PDF parsing
 import numpy as np
 from tqdm import tqdm
-from sentence_transformers import SentenceTransformer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+from bm25 import BM25Builder  # noqa: E402
+from chunker import MAX_CHUNK_TOKENS, OVERLAP_TOKENS, PageChunker  # noqa: E402
+from encoders import ENCODERS, make_encoder, model_id_for  # noqa: E402
+from ref_index import (  # noqa: E402
+    IndexWriter, current_version_dir, gc_versions, index_exists, load_index, new_version_dir, publish_version,
+)
+from vector_index import BinaryIndex, Int8Index, IVFIndex  # noqa: E402
 
 # -------------------------------------------------------
-# Paths and Model Setup
+# Paths and Settings
 # -------------------------------------------------------
-REF_PATH = "data/reference/comprehensive-clinical-nephrology.pdf"
-OUT_PATH = "data/reference_embeddings.pkl"
-os.makedirs("data", exist_ok=True)
+REF_DIR = os.getenv("REFERENCE_DIR", "data/reference")
+OUT_DIR = os.getenv("REF_INDEX_DIR", "data/reference_index")
+EMBED_MODEL = "all-MiniLM-L6-v2"
+# Same choices as the backend's RAG_ENCODER; the onnx encoder reads RAG_ONNX_DIR / RAG_ONNX_INT8
+ENCODER = os.getenv("RAG_ENCODER", "sentence-transformers")
+
+PAGES_PER_TASK = 20     # pages extracted per worker task
+ENCODE_BATCH = 512      # chunks per encoder call / staging flush
+KEEP_VERSIONS = int(os.getenv("RAG_INDEX_KEEP_VERSIONS", "2"))  # index versions kept on disk
 
-# Load embedding model (lightweight and fast)
-model = SentenceTransformer("all-MiniLM-L6-v2")
 
 # -------------------------------------------------------
-# Helper Function — Chunking Large Text
+# Worker Side — PDF Page Extraction
 # -------------------------------------------------------
-def chunk_text(text, size=900, overlap=200):
+_open_docs = {}
+
+
+def _open_doc(path):
+    """Keep the most recently used PDF open inside each worker process."""
+    if path not in _open_docs:
+        for doc in _open_docs.values():
+            doc.close()
+        _open_docs.clear()
+        _open_docs[path] = fitz.open(path)
+    return _open_docs[path]
+
+
+def page_count(path):
+    with fitz.open(path) as doc:
+        return len(doc)
+
+
+def extract_task(path, start, end):
     """
-    Split large text into overlapping chunks for semantic retrieval.
-    Args:
-        text (str): Full input text.
-        size (int): Maximum characters per chunk.
-        overlap (int): Number of overlapping characters between chunks.
-    Returns:
-        List[str]: Text chunks ready for embedding.
+    Extract the text of pages [start, end) of `path`. Runs in a worker process.
+    Returns [(page_number, text)] with 1-based page numbers; the pages are
+    chunked in order in the main process (see ingest_document).
     """
-    chunks, start = [], 0
-    while start < len(text):
-        chunk = text[start:start + size]
-        if len(chunk.strip()) > 50:  # Skip very short or empty fragments
-            chunks.append(chunk.strip())
-        start += size - overlap
-    return chunks
+    doc = _open_doc(path)
+    return [(i + 1, doc.load_page(i).get_text("text")) for i in range(start, end)]
+
 
 # -------------------------------------------------------
-# PDF Reading and Chunk Embedding
+# Staging — Per-Document Append-Only Segments
 # -------------------------------------------------------
-print(f"Opening reference PDF: {REF_PATH}")
-doc = fitz.open(REF_PATH)
-print(f"Total pages found: {len(doc)}")
+def file_sha256(path, block=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for data in iter(lambda: f.read(block), b""):
+            h.update(data)
+    return h.hexdigest()
+
+
+class Segment:
+    """
+    Staged output of one document: raw float32 vectors (<sha>.f32) and one
+    JSON-encoded chunk dict per line (<sha>.jsonl), both append-only.
+    """
+
+    def __init__(self, staging_dir, sha256):
+        self.vec_path = os.path.join(staging_dir, f"{sha256}.f32")
+        self.txt_path = os.path.join(staging_dir, f"{sha256}.jsonl")
+
+    def truncate(self, rows, dim, text_bytes):
+        """Drop anything written after the last checkpoint (rows, text bytes)."""
+        for path, size in ((self.vec_path, rows * dim * 4), (self.txt_path, text_bytes)):
+            with open(path, "ab") as f:
+                f.truncate(size)
+
+    def append(self, chunks, vectors):
+        """Append one flush; returns the new size of the text file in bytes."""
+        with open(self.vec_path, "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.txt_path, "ab") as f:
+            for chunk in chunks:
+                f.write((json.dumps(chunk) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+            return f.tell()
+
+    def iter_batches(self, rows, dim, batch=4096):
+        """Yield (chunks, vectors) for the first `rows` rows, `batch` at a time."""
+        if rows == 0:
+            return
+        vectors = np.memmap(self.vec_path, dtype=np.float32, mode="r", shape=(rows, dim))
+        with open(self.txt_path, encoding="utf-8") as f:
+            for start in range(0, rows, batch):
+                n = min(batch, rows - start)
+                chunks = [json.loads(f.readline()) for _ in range(n)]
+                yield chunks, vectors[start:start + n]
+
+    def remove(self):
+        for path in (self.vec_path, self.txt_path):
+            if os.path.exists(path):
+                os.remove(path)
+
 
-BATCH_SIZE = 20
-all_chunks, all_embeddings = [], []
+class IngestState:
+    """Checkpoint file (<staging>/state.json): per-document hash and progress."""
 
-# Process PDF in batches for efficiency
-for i in range(0, len(doc), BATCH_SIZE):
-    batch_text = ""
-    for j in range(i, min(i + BATCH_SIZE, len(doc))):
-        page = doc.load_page(j)
-        batch_text += page.get_text("text") + "\n"
+    def __init__(self, staging_dir):
+        self.path = os.path.join(staging_dir, "state.json")
+        self.data = {"model": EMBED_MODEL, "chunking": None, "dim": None, "docs": {}}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.data = json.load(f)
 
-    chunks = chunk_text(batch_text)
-    if not chunks:
-        continue
+    @property
+    def docs(self):
+        return self.data["docs"]
 
-    embeddings = model.encode(chunks, show_progress_bar=False)
-    all_chunks.extend(chunks)
-    all_embeddings.append(embeddings)
-    print(f"Processed pages {i+1}-{min(i+BATCH_SIZE, len(doc))} | {len(chunks)} chunks")
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp, self.path)
 
-doc.close()
 
 # -------------------------------------------------------
-# Save Processed Embeddings
+# Ingestion
 # -------------------------------------------------------
-all_embeddings = np.vstack(all_embeddings)
-pickle.dump({"chunks": all_chunks, "embeddings": all_embeddings}, open(OUT_PATH, "wb"))
+def list_pdfs(input_path):
+    if os.path.isfile(input_path):
+        return [os.path.abspath(input_path)]
+    return sorted(
+        os.path.abspath(os.path.join(input_path, fn))
+        for fn in os.listdir(input_path) if fn.lower().endswith(".pdf")
+    )
+
+
+def ingest_document(pool, model, path, entry, segment, state, pbar, workers, pages_per_task, encode_batch,
+                    chunking):
+    """
+    Extract, chunk, encode and stage one document, checkpointing after every
+    flush. The chunker's unfinished chunk is checkpointed with the page count,
+    so a resumed run continues the same chunk sequence.
+    """
+    total = entry["pages_total"]
+    chunker = PageChunker(os.path.basename(path), chunking["max_tokens"], chunking["overlap_tokens"],
+                          state=entry.get("chunker"))
+    tasks = deque((path, s, min(s + pages_per_task, total)) for s in range(entry["pages_done"], total, pages_per_task))
+    in_flight = deque()
+    pending, pages_pending = [], 0
+
+    def flush():
+        nonlocal pending, pages_pending
+        if pending:
+            vectors = model.encode([c["text"] for c in pending], batch_size=64)
+            entry["text_bytes"] = segment.append(pending, vectors)
+            entry["chunks"] += len(pending)
+        entry["pages_done"] += pages_pending
+        entry["chunker"] = chunker.state()
+        state.save()
+        pending, pages_pending = [], 0
+
+    # Results are consumed in page order with a bounded number of tasks in flight
+    while tasks or in_flight:
+        while tasks and len(in_flight) < workers * 2:
+            p, start, end = tasks.popleft()
+            in_flight.append((end - start, pool.submit(extract_task, p, start, end)))
+        n_pages, future = in_flight.popleft()
+        for page_no, text in future.result():
+            pending.extend(chunker.feed(page_no, text))
+        pages_pending += n_pages
+        pbar.update(n_pages)
+        if len(pending) >= encode_batch:
+            flush()
+    pending.extend(chunker.finish())
+    flush()
+    entry["status"] = "done"
+    state.save()
+
+
+def assemble(out_dir, state, pdfs, staging_dir):
+    """Write the final index from the staged segments, in document order."""
+    dim = state.data["dim"] or 0
+    pdfs = [p for p in pdfs if p in state.docs]
+    total = sum(state.docs[p]["chunks"] for p in pdfs)
+    writer = IndexWriter(out_dir, total, dim)
+    for path in pdfs:
+        entry = state.docs[path]
+        for chunks, vectors in Segment(staging_dir, entry["sha256"]).iter_batches(entry["chunks"], dim):
+            writer.add(
+                [c["text"] for c in chunks], vectors,
+                [(c["doc"], c["page_start"], c["page_end"]) for c in chunks],
+            )
+    return writer.close(model_name=state.data["model"])
+
+
+def peak_rss_mb():
+    """Peak resident set size (MB) of this process and of its largest worker."""
+    to_mb = (1 / 1024) if sys.platform != "darwin" else (1 / 1024 / 1024)
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * to_mb
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * to_mb
+    return own, children
+
+
+def main(input_path, out_dir, workers, pages_per_task, encode_batch, max_tokens=MAX_CHUNK_TOKENS,
+         overlap_tokens=OVERLAP_TOKENS, force=False, keep_versions=KEEP_VERSIONS, encoder=ENCODER):
+    t0 = time.perf_counter()
+    staging_dir = os.path.join(out_dir, "staging")
+    os.makedirs(staging_dir, exist_ok=True)
+    if force:
+        shutil.rmtree(staging_dir)
+        os.makedirs(staging_dir)
+
+    pdfs = list_pdfs(input_path)
+    print(f"Found {len(pdfs)} PDF(s) in {input_path}")
+    state = IngestState(staging_dir)
+    # "per_document": chunks continue across page tasks (staging from older runs is re-chunked)
+    chunking = {"max_tokens": max_tokens, "overlap_tokens": overlap_tokens, "per_document": True}
+    model_id = model_id_for(encoder, EMBED_MODEL)
+    if state.data.get("model") != model_id or state.data.get("chunking") != chunking:
+        if state.docs:
+            print("Embedding model or chunking settings changed; re-ingesting everything")
+        for entry in state.docs.values():
+            Segment(staging_dir, entry["sha256"]).remove()
+        state.data = {"model": model_id, "chunking": chunking, "dim": None, "docs": {}}
+
+    # Forget documents that were deleted from the input directory
+    removed = [p for p in state.docs if p not in pdfs]
+    for path in removed:
+        print(f"Removed: {path}")
+        Segment(staging_dir, state.docs.pop(path)["sha256"]).remove()
+
+    # Work out what is new, changed or half-done
+    todo, seen = [], {}
+    for path in pdfs:
+        sha = file_sha256(path)
+        entry = state.docs.get(path)
+        if sha in seen:
+            # Staging is keyed by content hash; identical copies would only add duplicate chunks
+            print(f"Skipping {path}: identical to {seen[sha]}")
+            state.docs.pop(path, None)
+            continue
+        seen[sha] = path
+        if entry and entry["sha256"] == sha and entry["status"] == "done":
+            continue
+        if entry and entry["sha256"] != sha:
+            print(f"Changed: {path}")
+            Segment(staging_dir, entry["sha256"]).remove()
+            entry = None
+        if entry is None:
+            entry = state.docs[path] = {
+                "sha256": sha, "status": "partial", "pages_total": page_count(path),
+                "pages_done": 0, "chunks": 0, "text_bytes": 0,
+            }
+        elif entry["pages_done"]:
+            print(f"Resuming: {path} from page {entry['pages_done'] + 1}/{entry['pages_total']}")
+        todo.append(path)
+    state.save()
+
+    if not todo and not removed and index_exists(current_version_dir(out_dir)):
+        print("Reference index is up to date; nothing to do.")
+        return
+
+    pages = 0
+    if todo:
+        model = make_encoder(encoder, EMBED_MODEL, onnx_dir=os.getenv("RAG_ONNX_DIR", f"data/models/{EMBED_MODEL}-onnx"),
+                             quantized=os.getenv("RAG_ONNX_INT8", "1") == "1")
+        state.data["dim"] = state.data["dim"] or model.dim
+
+        pages = sum(state.docs[p]["pages_total"] - state.docs[p]["pages_done"] for p in todo)
+        with ProcessPoolExecutor(max_workers=workers) as pool, tqdm(total=pages, unit="page") as pbar:
+            for path in todo:
+                entry = state.docs[path]
+                segment = Segment(staging_dir, entry["sha256"])
+                segment.truncate(entry["chunks"], state.data["dim"], entry["text_bytes"])
+                ingest_document(pool, model, path, entry, segment, state, pbar,
+                                workers, pages_per_task, encode_batch, chunking)
+    elapsed_ingest = time.perf_counter() - t0
+
+    version_dir = new_version_dir(out_dir)
+    meta = assemble(version_dir, state, pdfs, staging_dir)
+    print(f"\nIndex saved to: {version_dir}")
+    print(f"Total chunks: {meta['count']} | dim: {meta['dim']} (float32, normalized)")
+
+    # Build the quantized codes, the BM25 index and the approximate-search index
+    # over the memory-mapped chunks and vectors (IVF last: its centroids mark the end of ingest)
+    if meta["count"]:
+        chunks, normalized, _ = load_index(version_dir)
+        for cls in (Int8Index, BinaryIndex):
+            cls.build(normalized).save(version_dir)
+        bm25 = BM25Builder()
+        bm25.add(chunks)
+        bm25.build().save(version_dir)
+        print(f"BM25 index built: {len(bm25.terms)} terms")
+        nlist = int(os.getenv("RAG_IVF_NLIST", "0")) or None
+        ivf = IVFIndex.build(normalized, nlist=nlist)
+        ivf.save(version_dir)
+        print(f"IVF index built: {ivf.nlist} lists")
+        del chunks, normalized
+
+    publish_version(out_dir, version_dir)
+    removed_versions = gc_versions(out_dir, keep=keep_versions)
+    print(f"Published version {os.path.basename(version_dir)}"
+          + (f"; removed old versions: {', '.join(removed_versions)}" if removed_versions else ""))
+
+    own, children = peak_rss_mb()
+    total_time = time.perf_counter() - t0
+    print(f"Pages processed: {pages} in {elapsed_ingest:.1f}s "
+          f"({pages / elapsed_ingest if elapsed_ingest else 0:.1f} pages/s); total {total_time:.1f}s")
+    print(f"Peak RSS: main {own:.0f} MB | largest worker {children:.0f} MB")
+
 
-print(f"\nEmbeddings saved to: {OUT_PATH}")
-print(f"Total chunks: {len(all_chunks)} | Embedding matrix shape: {all_embeddings.shape}")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", default=REF_DIR, help="Directory of PDFs (or a single PDF)")
+    parser.add_argument("--out", default=OUT_DIR, help="Index output directory")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument("--pages-per-task", type=int, default=PAGES_PER_TASK)
+    parser.add_argument("--encode-batch", type=int, default=ENCODE_BATCH)
+    parser.add_argument("--max-tokens", type=int, default=MAX_CHUNK_TOKENS, help="Token budget per chunk")
+    parser.add_argument("--overlap-tokens", type=int, default=OVERLAP_TOKENS)
+    parser.add_argument("--force", action="store_true", help="Discard staged progress and re-ingest everything")
+    parser.add_argument("--keep-versions", type=int, default=KEEP_VERSIONS, help="Index versions kept on disk")
+    parser.add_argument("--encoder", choices=ENCODERS, default=ENCODER,
+                        help="Chunk encoder; must match the backend's RAG_ENCODER embedding space")
+    args = parser.parse_args()
+    main(args.input, args.out, args.workers, args.pages_per_task, args.encode_batch,
+         args.max_tokens, args.overlap_tokens, force=args.force, keep_versions=args.keep_versions,
+         encoder=args.encoder)
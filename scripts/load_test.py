@@ -0,0 +1,150 @@
+"""
+scripts/load_test.py
+--------------------
+Closed-loop HTTP load test for a running backend.
+
+C client threads each send requests back to back (POST /clinical by default)
+for --duration seconds. Reports throughput, latency percentiles and status
+codes.
+
+With --server-pid (Linux), it also reports the memory of that process and
+its children (e.g. the gunicorn master and workers). RSS counts shared pages
+once per process. PSS splits them between the processes, so the PSS total
+shows whether workers share the model and index or hold copies.
+
+Usage:
+    gunicorn -c backend/gunicorn.conf.py &
+    python scripts/load_test.py --concurrency 16 --duration 30 --server-pid $(pgrep -o gunicorn)
+"""
+
+import argparse
+import collections
+import itertools
+import os
+import random
+import threading
+import time
+
+import requests
+
+QUESTIONS = [
+    "How much potassium can I have each day?",
+    "What should I do if my legs swell?",
+    "Can I take ibuprofen for pain?",
+    "How much fluid should I drink with chronic kidney disease?",
+    "What are signs of a kidney infection?",
+    "Why is my creatinine high?",
+    "What foods are high in phosphorus?",
+    "When should I call my nephrologist?",
+]
+
+
+def process_tree(pid):
+    """pid plus all of its descendants (via /proc)."""
+    children = collections.defaultdict(list)
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children[ppid].append(int(entry))
+    out, todo = [], [pid]
+    while todo:
+        p = todo.pop()
+        out.append(p)
+        todo.extend(children.get(p, []))
+    return out
+
+
+def memory_mb(pid):
+    """(processes, total RSS MB, total PSS MB) of pid and its descendants."""
+    rss = pss = 0
+    procs = process_tree(pid)
+    for p in procs:
+        try:
+            with open(f"/proc/{p}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Rss:"):
+                        rss += int(line.split()[1])
+                    elif line.startswith("Pss:"):
+                        pss += int(line.split()[1])
+        except OSError:
+            continue
+    return len(procs), rss / 1024, pss / 1024
+
+
+def make_request(session, base_url, endpoint, patient_id, question, timeout):
+    if endpoint == "receptionist":
+        return session.post(f"{base_url}/receptionist", json={"patient_name": patient_id}, timeout=timeout)
+    return session.post(f"{base_url}/clinical", json={"patient_id": patient_id, "question": question},
+                        timeout=timeout)
+
+
+def run(base_url, endpoint, concurrency, duration, patients, timeout, unique):
+    latencies, statuses = [], collections.Counter()
+    lock = threading.Lock()
+    counter = itertools.count()
+    stop_at = time.perf_counter() + duration
+
+    def client(cid):
+        rng = random.Random(cid)
+        session = requests.Session()
+        local_lat, local_status = [], collections.Counter()
+        while time.perf_counter() < stop_at:
+            question = rng.choice(QUESTIONS)
+            if unique:
+                question += f" (request {next(counter)})"  # defeat the query/answer caches
+            t0 = time.perf_counter()
+            try:
+                resp = make_request(session, base_url, endpoint, rng.choice(patients), question, timeout)
+                local_status[resp.status_code] += 1
+            except requests.RequestException as e:
+                local_status[type(e).__name__] += 1
+            local_lat.append((time.perf_counter() - t0) * 1000)
+        with lock:
+            latencies.extend(local_lat)
+            statuses.update(local_status)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, statuses, time.perf_counter() - start
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))] if values else 0.0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=os.getenv("BACKEND_URL", "http://localhost:5000"))
+    parser.add_argument("--endpoint", choices=["clinical", "receptionist"], default="clinical")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds")
+    parser.add_argument("--patients", nargs="+", default=[f"P{i:03d}" for i in range(1, 26)])
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--unique", action="store_true", help="Make every question unique (cache misses)")
+    parser.add_argument("--server-pid", type=int, default=None, help="Report memory of this process tree")
+    args = parser.parse_args()
+
+    ready = requests.get(f"{args.url}/ready", timeout=10)
+    if ready.status_code != 200:
+        print(f"warning: {args.url}/ready returned {ready.status_code}: {ready.text.strip()}")
+
+    latencies, statuses, elapsed = run(args.url, args.endpoint, args.concurrency, args.duration,
+                                       args.patients, args.timeout, args.unique)
+    n = len(latencies)
+    print(f"{args.endpoint}: {n} requests in {elapsed:.1f}s with {args.concurrency} clients "
+          f"-> {n / elapsed:.1f} req/s")
+    print(f"latency ms: p50 {percentile(latencies, 50):.1f} | p95 {percentile(latencies, 95):.1f} | "
+          f"p99 {percentile(latencies, 99):.1f} | max {max(latencies, default=0):.1f}")
+    print("status codes: " + ", ".join(f"{k}={v}" for k, v in sorted(statuses.items(), key=str)))
+    if args.server_pid:
+        procs, rss, pss = memory_mb(args.server_pid)
+        print(f"server memory ({procs} processes): RSS total {rss:.0f} MB | PSS total {pss:.0f} MB")
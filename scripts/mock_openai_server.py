@@ -0,0 +1,126 @@
+"""
+scripts/mock_openai_server.py
+-----------------------------
+Local stand-in for the OpenAI Chat Completions API, for offline development.
+
+Implements POST /v1/chat/completions with and without `stream: true`.
+Streaming follows the OpenAI SSE format ("data: {chunk}" ... "data: [DONE]").
+The answer is canned text citing the [Source N] blocks found in the prompt.
+It is emitted word by word with configurable delays, to simulate
+time-to-first-token and generation speed. For testing the client's retries
+and deadlines, a share of requests can fail with 503 (--fail-rate) or stall
+before answering (--stall-rate, --stall-ms), and --drip-ms sends every
+response a few bytes at a time with that pause in between (each read is
+quick, the whole response is not).
+
+Usage:
+    python scripts/mock_openai_server.py --port 8001 --first-token-ms 400 --token-delay-ms 30
+    python scripts/mock_openai_server.py --fail-rate 0.2 --stall-rate 0.05 --stall-ms 30000
+    python scripts/mock_openai_server.py --drip-ms 100
+
+Then start the backend against it:
+    OPENAI_API_KEY=sk-local OPENAI_API_BASE=http://localhost:8001/v1 python backend/app.py
+"""
+
+import argparse
+import json
+import random
+import re
+import time
+import uuid
+
+from flask import Flask, Response, jsonify, request
+
+app = Flask(__name__)
+settings = {"first_token_ms": 400.0, "token_delay_ms": 30.0, "fail_rate": 0.0, "stall_rate": 0.0,
+            "stall_ms": 30000.0, "drip_ms": 0.0}
+DRIP_BYTES = 8
+
+
+def canned_answer(messages):
+    """Deterministic answer that cites the sources present in the prompt."""
+    prompt = " ".join(m.get("content", "") for m in messages)
+    sources = sorted(set(re.findall(r"\[Source (\d+)", prompt)), key=int)
+    cites = " ".join(f"[Source {s}]" for s in sources) or "[no sources]"
+    return (
+        "Based on the reference material, follow your discharge instructions, keep to the "
+        "recommended diet and fluid limits, and contact your nephrology team if warning "
+        f"signs appear {cites}.\n\nDisclaimer: This is NOT medical advice. Consult a clinician."
+    )
+
+
+def drip(parts):
+    """Re-yield the text of `parts` DRIP_BYTES at a time, pausing drip_ms between pieces."""
+    for part in parts:
+        for i in range(0, len(part), DRIP_BYTES):
+            yield part[i:i + DRIP_BYTES]
+            time.sleep(settings["drip_ms"] / 1000)
+
+
+def tokens(text):
+    """Split into word-sized fragments, keeping whitespace like a real tokenizer stream."""
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+@app.route("/v1/chat/completions", methods=["POST"])
+@app.route("/chat/completions", methods=["POST"])
+def chat_completions():
+    body = request.get_json() or {}
+    model = body.get("model", "mock-gpt")
+    answer = canned_answer(body.get("messages", []))
+    cid = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    if random.random() < settings["fail_rate"]:
+        return jsonify({"error": {"message": "mock overloaded", "type": "server_error"}}), 503
+    if random.random() < settings["stall_rate"]:
+        time.sleep(settings["stall_ms"] / 1000)
+
+    if not body.get("stream"):
+        time.sleep((settings["first_token_ms"] + settings["token_delay_ms"] * len(tokens(answer))) / 1000)
+        completion = {
+            "id": cid,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens(answer)), "total_tokens": 0},
+        }
+        if settings["drip_ms"]:
+            return Response(drip([json.dumps(completion)]), mimetype="application/json")
+        return jsonify(completion)
+
+    def generate():
+        def chunk(delta, finish=None):
+            return "data: " + json.dumps({
+                "id": cid,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }) + "\n\n"
+
+        time.sleep(settings["first_token_ms"] / 1000)
+        yield chunk({"role": "assistant"})
+        for tok in tokens(answer):
+            yield chunk({"content": tok})
+            time.sleep(settings["token_delay_ms"] / 1000)
+        yield chunk({}, finish="stop")
+        yield "data: [DONE]\n\n"
+
+    return Response(drip(generate()) if settings["drip_ms"] else generate(), mimetype="text/event-stream")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--first-token-ms", type=float, default=400.0)
+    parser.add_argument("--token-delay-ms", type=float, default=30.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Share of requests that stall first")
+    parser.add_argument("--stall-ms", type=float, default=30000.0)
+    parser.add_argument("--drip-ms", type=float, default=0.0, help="Pause between every few response bytes")
+    args = parser.parse_args()
+    settings.update(first_token_ms=args.first_token_ms, token_delay_ms=args.token_delay_ms,
+                    fail_rate=args.fail_rate, stall_rate=args.stall_rate, stall_ms=args.stall_ms,
+                    drip_ms=args.drip_ms)
+    app.run(host=args.host, port=args.port, threaded=True)
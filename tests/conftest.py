@@ -0,0 +1,11 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = os.path.join(ROOT, "scripts")
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+sys.path.insert(0, SCRIPTS)
+
+# Tests never read or write the persistent caches under the repository's data/
+os.environ.setdefault("ANSWER_CACHE_PATH", "")
+os.environ.setdefault("WEB_SEARCH_CACHE_PATH", "")
@@ -0,0 +1,63 @@
+"""
+SemanticAnswerCache persistence: saves happen off the request path, never
+cost the caller an LLM answer, and concurrent savers cannot corrupt the file.
+"""
+
+import json
+import threading
+
+import numpy as np
+
+import rag
+from answer_cache import SemanticAnswerCache
+
+BAD_PATH = "/proc/nope/answer_cache.json"
+PATIENT = {"patient_name": "Ann Lee", "primary_diagnosis": "CKD stage 3", "discharge_instructions": "Low salt."}
+CONTEXTS = [{"id": 1, "document": "Limit potassium to 2000 mg per day.", "score": 0.6}]
+
+
+def _emb(seed):
+    v = np.random.default_rng(seed).standard_normal(8).astype(np.float32)
+    return v / np.linalg.norm(v)
+
+
+def test_failed_save_is_logged_and_retried(caplog):
+    cache = SemanticAnswerCache(path=BAD_PATH, persist_interval=0)
+    cache.store("fp", _emb(0), "q", "a")  # starts a background save that fails
+    cache._saver.join()
+    assert "Could not save answer cache" in caplog.text
+    assert cache._dirty
+    assert cache.lookup("fp", _emb(0)) == "a"
+
+
+def test_concurrent_saves_leave_a_valid_file(tmp_path):
+    path = str(tmp_path / "answer_cache.json")
+    caches = [SemanticAnswerCache(path=path) for _ in range(4)]
+    for i, cache in enumerate(caches):
+        for j in range(50):
+            cache.store(f"fp{i}", _emb(i * 100 + j), f"q{j}", f"answer {i}")
+    threads = [threading.Thread(target=c.save) for c in caches for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    with open(path) as f:
+        rows = json.load(f)["entries"]
+    assert len(rows) == 50 and len({r["answer"] for r in rows}) == 1
+    assert [p.name for p in tmp_path.iterdir()] == ["answer_cache.json"]
+
+
+def _read_only(*args):
+    raise OSError("read-only file system")
+
+
+def test_cache_errors_keep_the_llm_answer(monkeypatch):
+    monkeypatch.setattr(rag, "answer_cache", SemanticAnswerCache(path=BAD_PATH, persist_interval=0))
+    monkeypatch.setattr(rag.answer_cache, "store", _read_only)
+    monkeypatch.setattr(rag, "embed_query", lambda q: _emb(1))
+    answer = rag.answer_with_llm("summary", "How much potassium?", CONTEXTS, patient=PATIENT,
+                                 llm=lambda messages: "Up to 2000 mg [Source 1].")
+    assert answer == "Up to 2000 mg [Source 1]."
+    parts = list(rag.answer_with_llm("summary", "How much potassium?", CONTEXTS, patient=PATIENT, stream=True,
+                                     llm=lambda messages: iter(["Up to ", "2000 mg."])))
+    assert parts == ["Up to ", "2000 mg."]
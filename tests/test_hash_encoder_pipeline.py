@@ -0,0 +1,107 @@
+"""
+Offline end-to-end test of reference ingestion and retrieval with the hash
+encoder (RAG_ENCODER=hash): no model download, runs anywhere PyMuPDF does.
+"""
+
+import json
+import os
+
+import pytest
+
+fitz = pytest.importorskip("fitz")  # PyMuPDF, used by scripts/ingest_reference.py
+pytest.importorskip("tqdm")
+
+import ingest_reference  # noqa: E402
+from chunker import chunk_pages  # noqa: E402
+from ref_index import current_version_dir, load_index  # noqa: E402
+
+# One topic per page; every page ends mid-sentence and the next page finishes it
+TOPICS = [
+    ("potassium", "Limit potassium to 2000 mg per day in stage 3 chronic kidney disease. "
+                  "Bananas, oranges and potatoes are high in potassium."),
+    ("furosemide", "Furosemide is a loop diuretic for leg swelling and fluid overload. "
+                   "Take furosemide in the morning to avoid waking at night."),
+    ("ibuprofen", "Ibuprofen and other NSAIDs lower kidney blood flow. "
+                  "Use paracetamol for pain instead of ibuprofen."),
+    ("phosphorus", "Phosphorus is high in dairy, nuts and cola drinks. "
+                   "Phosphate binders are taken with meals to limit phosphorus."),
+    ("egfr", "A low eGFR means the kidneys filter less blood than normal. "
+             "An eGFR under 15 is kidney failure."),
+    ("infection", "Fever, flank pain and burning urination are signs of a kidney infection. "
+                  "A kidney infection needs antibiotics promptly."),
+    ("fluid", "Dialysis patients often restrict fluid to 1.5 litres per day. "
+              "Fluid includes soup, ice and jelly."),
+]
+PAGES_PER_TASK = 2
+MAX_TOKENS = 40
+
+
+@pytest.fixture(scope="module")
+def reference(tmp_path_factory):
+    """Ingest a generated PDF with the hash encoder; returns (index root, page texts)."""
+    root = tmp_path_factory.mktemp("reference")
+    pdf_dir = root / "pdfs"
+    pdf_dir.mkdir()
+    doc = fitz.open()
+    for i, (_, text) in enumerate(TOPICS):
+        page_text = ("on the previous page. " if i else "") + text + " This note continues"
+        doc.new_page().insert_textbox(fitz.Rect(40, 40, 560, 800), page_text, fontsize=10)
+    doc.save(str(pdf_dir / "nephrology.pdf"))
+    pages = [(i + 1, page.get_text("text")) for i, page in enumerate(fitz.open(str(pdf_dir / "nephrology.pdf")))]
+
+    index_root = str(root / "index")
+    ingest_reference.main(str(pdf_dir), index_root, workers=1, pages_per_task=PAGES_PER_TASK, encode_batch=4,
+                          max_tokens=MAX_TOKENS, overlap_tokens=10, encoder="hash")
+    return index_root, pages
+
+
+@pytest.fixture
+def rag_hash(reference, monkeypatch):
+    """The rag module serving the test index through the hash encoder."""
+    import rag
+    monkeypatch.setattr(rag, "RAG_ENCODER", "hash")
+    monkeypatch.setattr(rag, "REF_INDEX_DIR", reference[0])
+    rag.init()
+    yield rag
+    rag._ready.clear()
+    rag.embedding_cache.clear()
+    rag.result_cache.clear()
+
+
+def test_ingest_writes_hash_index(reference):
+    index_root, pages = reference
+    version_dir = current_version_dir(index_root)
+    chunks, embeddings, meta = load_index(version_dir)
+
+    assert meta["model"] == "hash-384"
+    assert embeddings.shape == (meta["count"], 384)
+    # Chunking across page tasks gives the same chunks as one pass over the document
+    expected = list(chunk_pages(pages, doc="nephrology.pdf", max_tokens=MAX_TOKENS, overlap_tokens=10))
+    assert list(chunks) == [c["text"] for c in expected]
+    assert [chunks.source(i) for i in range(len(chunks))] == [
+        {"doc": c["doc"], "page_start": c["page_start"], "page_end": c["page_end"]} for c in expected
+    ]
+    with open(os.path.join(index_root, "staging", "state.json")) as f:
+        state = json.load(f)
+    assert [d["status"] for d in state["docs"].values()] == ["done"]
+
+
+def test_retrieve_with_hash_encoder(rag_hash):
+    questions = {
+        "potassium": "How much potassium can I have each day?",
+        "furosemide": "When should I take furosemide?",
+        "ibuprofen": "Can I take ibuprofen for pain?",
+        "phosphorus": "What foods are high in phosphorus?",
+        "egfr": "What does a low eGFR mean?",
+        "infection": "What are signs of a kidney infection?",
+    }
+    for keyword, question in questions.items():
+        results = rag_hash.retrieve(question, top_k=3)
+        assert len(results) == 3
+        # Hashed bag of words is a crude embedding; the matching page must still make the top 3
+        assert any(keyword in r["document"].lower() for r in results), (question, results)
+        assert results[0]["doc"] == "nephrology.pdf"
+        assert rag_hash.rag_confidence(results) == max(r["score"] for r in results)
+
+    batch = rag_hash.retrieve_batch(list(questions.values()), top_k=3)
+    assert [r[0]["id"] for r in batch] == [rag_hash.retrieve(q, top_k=3)[0]["id"] for q in questions.values()]
@@ -0,0 +1,57 @@
+"""
+Hybrid (dense + BM25) fusion in rag._hybrid: BM25 may reorder the top-k,
+but the best dense hit stays, so RAG confidence matches dense-only retrieval.
+"""
+
+import types
+
+import numpy as np
+
+import rag
+from bm25 import BM25Builder
+
+CHUNKS = [
+    "Swelling of the legs can mean fluid overload.",                       # closest in meaning, no query terms
+    "Furosemide dose: take furosemide in the morning.",
+    "Furosemide can lower potassium; check the dose with your doctor.",
+    "A furosemide dose taken late causes waking at night.",
+    "Phosphate binders are taken with meals.",
+]
+QUERY = "furosemide dose"
+
+
+def _reference():
+    builder = BM25Builder()
+    builder.add(CHUNKS)
+    # Unit vectors whose cosine with the query is 0.9, 0.5, 0.4, 0.3 and 0.1
+    cos = np.array([0.9, 0.5, 0.4, 0.3, 0.1], dtype=np.float32)
+    embeddings = np.zeros((len(CHUNKS), len(CHUNKS) + 1), dtype=np.float32)
+    embeddings[:, 0] = cos
+    embeddings[np.arange(len(CHUNKS)), np.arange(len(CHUNKS)) + 1] = np.sqrt(1 - cos ** 2)
+    q_emb = np.zeros(len(CHUNKS) + 1, dtype=np.float32)
+    q_emb[0] = 1.0
+    return types.SimpleNamespace(embeddings=embeddings, bm25=builder.build(), chunks=CHUNKS), q_emb
+
+
+def test_hybrid_keeps_dense_top_hit():
+    ref, q_emb = _reference()
+    sims = ref.embeddings @ q_emb
+    dense_ids = np.argsort(-sims)
+    assert dense_ids[0] == 0
+
+    ids, scores = rag._hybrid(ref, QUERY, q_emb, dense_ids, 3, None)
+    # Chunks 1-3 match both rankers and outrank chunk 0; it takes the last slot
+    assert list(ids) == [1, 2, 0]
+    np.testing.assert_allclose(scores, [0.5, 0.4, 0.9], atol=1e-6)
+    results = rag._results(ref, ids, scores)
+    dense = rag._results(ref, dense_ids[:3], sims[dense_ids[:3]])
+    assert rag.rag_confidence(results) == rag.rag_confidence(dense)
+
+
+def test_hybrid_min_score_and_small_k():
+    ref, q_emb = _reference()
+    dense_ids = np.argsort(-(ref.embeddings @ q_emb))
+    ids, _ = rag._hybrid(ref, QUERY, q_emb, dense_ids, 1, None)
+    assert list(ids) == [0]
+    ids, scores = rag._hybrid(ref, QUERY, q_emb, dense_ids, 3, 0.45)
+    assert list(ids) == [1, 0] and min(scores) >= 0.45
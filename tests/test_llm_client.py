@@ -0,0 +1,114 @@
+"""
+LLMClient against the local mock OpenAI server (scripts/mock_openai_server.py)
+failing and stalling a share of requests: every call ends within its
+deadline, and the counters add up under concurrent calls.
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+pytest.importorskip("flask")
+
+from conftest import SCRIPTS  # noqa: E402
+from llm_client import LLMClient, LLMError, LLMTimeout  # noqa: E402
+
+DEADLINE = 0.6
+# Thread start-up, scheduling and the watchdog's own latency
+SLACK = 0.3
+MESSAGES = [{"role": "user", "content": "[Source 1] Limit potassium. How much potassium can I have?"}]
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def mock_server():
+    procs = []
+
+    def start(*args):
+        port = _free_port()
+        cmd = [sys.executable, os.path.join(SCRIPTS, "mock_openai_server.py"), "--port", str(port),
+               "--first-token-ms", "20", "--token-delay-ms", "1", *args]
+        procs.append(subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        for _ in range(100):
+            try:
+                requests.get(f"http://127.0.0.1:{port}/", timeout=0.2)
+                return f"http://127.0.0.1:{port}/v1"
+            except requests.ConnectionError:
+                time.sleep(0.1)
+        raise RuntimeError("mock OpenAI server did not start")
+
+    yield start
+    for proc in procs:
+        proc.kill()
+        proc.wait()
+
+
+def _call(client, stream):
+    """(outcome, seconds) of one call: "ok", "timeout" or "error"."""
+    t0 = time.monotonic()
+    try:
+        if stream:
+            text = "".join(client.chat_stream(MESSAGES, timeout=DEADLINE))
+        else:
+            text = client.chat(MESSAGES, timeout=DEADLINE)
+        outcome = "ok" if "[Source 1]" in text else "bad answer"
+    except LLMTimeout:
+        outcome = "timeout"
+    except LLMError:
+        outcome = "error"
+    return outcome, time.monotonic() - t0
+
+
+@pytest.mark.parametrize("stream", [False, True], ids=["chat", "chat_stream"])
+def test_failing_and_stalling_upstream(mock_server, stream):
+    api_base = mock_server("--fail-rate", "0.3", "--stall-rate", "0.2", "--stall-ms", "60000")
+    client = LLMClient("sk-test", api_base=api_base, max_concurrency=8, max_retries=2, backoff=0.02,
+                       backoff_max=0.05)
+    n = 48
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda _: _call(client, stream), range(n)))
+
+    outcomes = [o for o, _ in results]
+    stats = client.stats()
+    assert max(secs for _, secs in results) <= DEADLINE + SLACK
+    assert set(outcomes) <= {"ok", "timeout", "error"}
+    assert outcomes.count("ok") > 0 and stats["retries"] > 0 and stats["timeouts"] > 0
+    # Every call posted once plus once per retry, and ended exactly one way
+    assert stats["calls"] == n + stats["retries"]
+    assert stats["timeouts"] == outcomes.count("timeout")
+    assert stats["failures"] == outcomes.count("error")
+    assert stats["in_flight"] == stats["waiting"] == stats["rejected"] == 0
+
+
+@pytest.mark.parametrize("stream", [False, True], ids=["chat", "chat_stream"])
+def test_trickling_response_is_cut_at_deadline(mock_server, stream):
+    # Each socket read completes within the read timeout; the whole answer takes seconds
+    client = LLMClient("sk-test", api_base=mock_server("--drip-ms", "20"), max_retries=0)
+    outcome, secs = _call(client, stream)
+    assert outcome == "timeout"
+    assert DEADLINE - 0.05 <= secs <= DEADLINE + SLACK
+    assert client.stats()["timeouts"] == 1
+
+
+def test_counters_are_consistent_under_contention(mock_server):
+    client = LLMClient("sk-test", api_base=mock_server("--fail-rate", "0.5"), max_concurrency=16, max_retries=1,
+                       backoff=0.0, backoff_max=0.0)
+    threads = [threading.Thread(target=lambda: [_call(client, False) for _ in range(5)]) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = client.stats()
+    assert stats["calls"] == 80 + stats["retries"]
@@ -0,0 +1,75 @@
+"""
+Multi-process /metrics (PROMETHEUS_MULTIPROC_DIR): any worker's scrape adds
+up every worker's counters and histograms, and a dead worker's totals stay.
+"""
+
+import os
+
+import pytest
+
+from metrics import Counter, Histogram, Registry
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork()")
+
+
+def _registry(path):
+    registry = Registry(str(path), flush_interval=3600)
+    requests = registry.register(Counter("requests_total", "Requests", ["endpoint"]))
+    latency = registry.register(Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0)))
+    live = {"n": 0}
+    registry.register_collector(lambda: [("in_flight", "gauge", "In flight", [({}, live["n"])])])
+    return registry, requests, latency, live
+
+
+def _fork_worker(registry, requests, latency, live, n):
+    """A worker that handles `n` requests, writes its samples and exits; returns its pid."""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            registry.start_worker()
+            for _ in range(n):
+                requests.inc(endpoint="clinical")
+                latency.observe(0.5)
+            live["n"] = 1
+            registry.flush()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    return pid
+
+
+def _values(text):
+    return dict(line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#"))
+
+
+def test_scrape_adds_up_workers(tmp_path):
+    registry, requests, latency, live = _registry(tmp_path)
+    registry.clear_dir()
+    requests.inc(endpoint="clinical")  # in the master before fork: must not be counted once per worker
+    first = _fork_worker(registry, requests, latency, live, 3)
+    _fork_worker(registry, requests, latency, live, 4)
+
+    registry.start_worker()  # this process is a third worker
+    requests.inc(endpoint="clinical")
+    values = _values(registry.exposition())
+    assert values['requests_total{endpoint="clinical"}'] == "8"
+    assert values['latency_seconds_bucket{le="1"}'] == "7"
+    assert values["latency_seconds_count"] == "7"
+    assert values["in_flight"] == "2"
+
+    # The first worker is replaced: its counters stay, its gauge goes
+    registry.mark_process_dead(first)
+    registry.mark_process_dead(first)
+    values = _values(registry.exposition())
+    assert values['requests_total{endpoint="clinical"}'] == "8"
+    assert values["latency_seconds_count"] == "7"
+    assert values["in_flight"] == "1"
+    assert not [fn for fn in os.listdir(tmp_path) if fn.startswith(f"worker_{first}_")]
+
+
+def test_single_process_without_dir():
+    registry = Registry("")
+    requests = registry.register(Counter("requests_total", "Requests"))
+    requests.inc(2)
+    registry.start_worker()
+    assert "requests_total 2" in registry.exposition()
@@ -0,0 +1,47 @@
+"""
+WebSearchClient never raises: an unusable result cache is treated as a
+miss on read and skipped on write.
+"""
+
+import pytest
+
+from web_search import SearchCache, SearchProvider, WebSearchClient
+
+RESULTS = [{"title": "Furosemide", "snippet": "Loop diuretic.", "url": "https://example.org/furosemide"}]
+
+
+class StubProvider(SearchProvider):
+    name = "stub"
+
+    def __init__(self):
+        self.calls = 0
+
+    def search(self, query, max_results, timeout):
+        self.calls += 1
+        return RESULTS[:max_results]
+
+
+@pytest.fixture(params=["bad-path", "corrupt"])
+def broken_cache(request, tmp_path):
+    if request.param == "bad-path":
+        return SearchCache("/proc/nope/web_search_cache.sqlite3")
+    path = tmp_path / "web_search_cache.sqlite3"
+    path.write_bytes(b"not a database" * 512)
+    return SearchCache(str(path))
+
+
+def test_broken_cache_is_bypassed(broken_cache, caplog):
+    provider = StubProvider()
+    client = WebSearchClient(provider, cache=broken_cache, timeout=2.0)
+    assert client.search("furosemide") == RESULTS
+    assert client.search("furosemide") == RESULTS
+    assert provider.calls == 2
+    assert client.stats()["failures"] == 0 and client.breaker.state == "closed"
+    assert "cache read failed" in caplog.text and "cache write failed" in caplog.text
+
+
+def test_working_cache_serves_repeats(tmp_path):
+    provider = StubProvider()
+    client = WebSearchClient(provider, cache=SearchCache(str(tmp_path / "cache.sqlite3")), timeout=2.0)
+    assert client.search("Furosemide") == client.search("  furosemide ") == RESULTS
+    assert provider.calls == 1